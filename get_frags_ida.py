@@ -1,13 +1,14 @@
 import numpy as np
-import json
 from pathlib import Path
 from src.demolition import Demolition
 from src.fragility import plot_fragility, Fragility
 from src.demand import Demand, convert_demands, convert_list_to_ndarray
+from src.utilities import load_results
 
 path = Path(__file__).parent / "figs"
-filename = Path(__file__).parent / "outputs/IDA/ida.json"
-demands = json.load(open(filename))
+filename = Path(__file__).parent / "outputs/IDA/ida.npz"
+# Arrays are memory-mapped, read from disk only when accessed
+demands = load_results(filename)
 demands = convert_demands(demands)
 demands = convert_list_to_ndarray(demands)
 
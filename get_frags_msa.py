@@ -1,9 +1,9 @@
 import numpy as np
-import json
 import matplotlib.pyplot as plt
 from pathlib import Path
 from src.fragility import plot_fragility, Fragility
-from src.demand import Demand, convert_demands, convert_list_to_ndarray
+from src.demand import Demand
+from src.edp_array import EDPArray
 from src.utilities import export_results
 
 path = Path(__file__).parent
@@ -14,10 +14,8 @@ fit = 'msa'
 frags = {}
 
 msa_path = path / "outputs/MSA"
-filename = msa_path / "msa.json"
-demands = json.load(open(filename))
-demands = convert_demands(demands)
-demands = convert_list_to_ndarray(demands)
+filename = msa_path / "msa.npz"
+demands = EDPArray.load(filename)
 
 # Process demands
 dem_obj = Demand(demands, non_directional_factor=1, modelling_uncertainty=None)
@@ -35,12 +33,12 @@ medians = []
 labels = ['DLS-1', 'DLS-2', 'DLS-3', 'DLS-4']
 colors = ['b', 'g', 'r', 'k']
 
-for i, threshold in enumerate(drift_thresholds):
-    # Collapse fragility
-    frag = frag_obj.collapse_capacity(
-        demands, dcap=threshold, fit=fit
-    )
+# Fragilities of all damage limit states from a single pass over demands
+dls_frags = frag_obj.limit_state_capacities(
+    demands, drift_thresholds, fit=fit
+)
 
+for i, frag in enumerate(dls_frags):
     frags[f"DLS-{i+1}"] = {
         'median': frag['median'],
         'beta': frag['beta'],
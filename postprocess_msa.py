@@ -1,6 +1,7 @@
 from pathlib import Path
 import numpy as np
 from src.msa_postprocessor import MSAPostprocessor
+from src.edp_array import EDPArray
 from src.utilities import export_results
 
 
@@ -16,3 +17,5 @@ model = MSAPostprocessor(msa_path)
 
 out = model.postprocess(3, imls=imls, return_periods=return_period, n_dir=1)
 export_results(msa_path / "msa", out, "json")
+# Binary demands for fragility and loss computations
+EDPArray.from_msa(out).save(msa_path / "msa.npz")
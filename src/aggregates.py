@@ -0,0 +1,179 @@
+from typing import Dict, Hashable, List, Union
+
+import numpy as np
+
+
+class RunningAggregate:
+    def __init__(
+        self,
+        thresholds: Dict[str, List[float]] = None,
+        bounds: List[float] = (1e-4, 1e3),
+        bins_per_decade: int = 100,
+    ) -> None:
+        """Running aggregates of engineering demand parameters (EDPs), for
+        results streamed in chunks, e.g. record by record
+
+        Values are folded into counts, sums, peaks, counts of exceedance of
+        thresholds and a histogram over log-spaced bins, the quantile
+        sketch. Memory depends on the number of keys only, not on the
+        number of values.
+
+        Parameters
+        ----------
+        thresholds : Dict[str, List[float]], optional
+            Thresholds by EDP, e.g. {'PSD': [1., 2., 5.]}, by default None.
+            Keys are matched against the key, or its first item if a tuple
+        bounds : List[float], optional
+            Range of the quantile sketch, by default (1e-4, 1e3). Values
+            outside are counted in the first or the last bin.
+        bins_per_decade : int, optional
+            Resolution of the quantile sketch, by default 100, i.e. a
+            relative error of the quantiles of about 2.3%
+        """
+        self.thresholds = {
+            edp: np.sort(np.asarray(values, dtype=float))
+            for edp, values in (thresholds or {}).items()
+        }
+        self.bounds = tuple(bounds)
+        self.bins_per_decade = bins_per_decade
+
+        decades = np.log10(self.bounds[1] / self.bounds[0])
+        self.edges = np.geomspace(
+            self.bounds[0], self.bounds[1],
+            int(round(decades * bins_per_decade)) + 1)
+
+        self.stats = {}
+
+    def _new(self, key: Hashable) -> dict:
+        thresholds = self._thresholds(key)
+        return {
+            "count": 0,
+            "sum": 0.,
+            "peak": -np.inf,
+            # Underflow and overflow bins on either side of the edges
+            "histogram": np.zeros(len(self.edges) + 1, dtype=np.int64),
+            "exceedances": np.zeros(len(thresholds), dtype=np.int64),
+        }
+
+    def _thresholds(self, key: Hashable) -> np.ndarray:
+        edp = key[0] if isinstance(key, tuple) else key
+        return self.thresholds.get(edp, np.array([]))
+
+    def update(self, key: Hashable, values: Union[np.ndarray, float]) -> None:
+        """Folds values into the aggregates of a key, nans are ignored
+
+        Parameters
+        ----------
+        key : Hashable
+            e.g. ('PSD', direction)
+        values : Union[np.ndarray, float]
+            Values of any shape
+        """
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        if key not in self.stats:
+            self.stats[key] = self._new(key)
+        if values.size == 0:
+            return
+
+        stats = self.stats[key]
+        stats["count"] += values.size
+        stats["sum"] += float(np.sum(values))
+        stats["peak"] = max(stats["peak"], float(np.max(values)))
+        stats["histogram"] += np.bincount(
+            np.searchsorted(self.edges, values, side="right"),
+            minlength=len(self.edges) + 1)
+
+        thresholds = self._thresholds(key)
+        if thresholds.size:
+            # Number of values strictly above each threshold
+            below = np.searchsorted(np.sort(values), thresholds, side="right")
+            stats["exceedances"] += values.size - below
+
+    def merge(self, other: "RunningAggregate") -> "RunningAggregate":
+        """Folds the aggregates of another chunk, e.g. of another worker,
+        computed with the same bins and thresholds
+        """
+        for key, theirs in other.stats.items():
+            if key not in self.stats:
+                self.stats[key] = self._new(key)
+            stats = self.stats[key]
+            stats["count"] += theirs["count"]
+            stats["sum"] += theirs["sum"]
+            stats["peak"] = max(stats["peak"], theirs["peak"])
+            stats["histogram"] += theirs["histogram"]
+            stats["exceedances"] += theirs["exceedances"]
+        return self
+
+    def keys(self) -> List[Hashable]:
+        return list(self.stats.keys())
+
+    def count(self, key: Hashable) -> int:
+        return self.stats[key]["count"]
+
+    def mean(self, key: Hashable) -> float:
+        stats = self.stats[key]
+        if stats["count"] == 0:
+            return np.nan
+        return stats["sum"] / stats["count"]
+
+    def peak(self, key: Hashable) -> float:
+        stats = self.stats[key]
+        return stats["peak"] if stats["count"] else np.nan
+
+    def exceedances(self, key: Hashable) -> np.ndarray:
+        """Counts of values above each threshold of the key
+        """
+        return self.stats[key]["exceedances"].copy()
+
+    def exceedance_rates(self, key: Hashable) -> np.ndarray:
+        """Fractions of values above each threshold of the key
+        """
+        stats = self.stats[key]
+        if stats["count"] == 0:
+            return np.full(stats["exceedances"].shape, np.nan)
+        return stats["exceedances"] / stats["count"]
+
+    def quantile(
+        self, key: Hashable, q: Union[float, List[float]],
+    ) -> Union[float, np.ndarray]:
+        """Approximate quantiles from the histogram, interpolated
+        geometrically within a bin
+
+        Parameters
+        ----------
+        key : Hashable
+            Key of the values
+        q : Union[float, List[float]]
+            Quantiles in [0, 1]
+
+        Returns
+        -------
+        Union[float, np.ndarray]
+            Quantiles, nan if no values were folded
+        """
+        stats = self.stats[key]
+        q = np.asarray(q, dtype=float)
+        if stats["count"] == 0:
+            return np.full(q.shape, np.nan)[()]
+
+        cumulative = np.cumsum(stats["histogram"])
+        rank = q * stats["count"]
+        idx = np.clip(np.searchsorted(cumulative, rank, side="left"),
+                      0, len(self.edges))
+
+        # Edges of the bins, the underflow and overflow bins are collapsed
+        # onto the bounds of the sketch
+        edges = np.concatenate(
+            ([self.edges[0]], self.edges, [self.edges[-1]]))
+        lower, upper = edges[idx], edges[idx + 1]
+
+        before = np.where(idx > 0, cumulative[idx - 1], 0)
+        inside = stats["histogram"][idx]
+        fraction = np.where(
+            inside > 0, (rank - before) / np.maximum(inside, 1), 0.)
+        fraction = np.clip(fraction, 0., 1.)
+
+        values = lower * (upper / lower) ** fraction
+        # The sketch does not extend beyond the observed peak
+        return np.minimum(values, stats["peak"])[()]
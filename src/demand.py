@@ -1,8 +1,9 @@
-from typing import List, Union
+from typing import Iterator, List, Union
 import numpy as np
-from scipy.stats.distributions import norm
-from pyDOE import lhs
+from scipy.special import ndtri
+from scipy.stats import qmc
 from .demolition import Demolition
+from .edp_array import EDPArray
 
 
 def convert_demands(demands):
@@ -95,11 +96,13 @@ def process_demands(non_directional_factor,
 class Demand:
     def __init__(
         self,
-        demand: dict,
+        demand: Union[dict, EDPArray],
         non_directional_factor: float = 1.0,
         modelling_uncertainty: Union[float, List[float]] = None,
         perform_simulations: bool = False,
         realizations: int = 100,
+        sampling: str = "lhs",
+        seed: int = None,
     ):
         """Initialize demand processor for Nonlinear Time History Analysis
         (NLTHA) results
@@ -141,8 +144,9 @@ class Demand:
 
         Parameters
         ----------
-        demand : dict
-            Demands following NLTHA
+        demand : Union[dict, EDPArray]
+            Demands following NLTHA, EDPArray is used as is, without
+            transformation
         non_directional_factor : float, Optional
             Non-directional conversion factor for components sensitive to both
             directions of response, by default 1.0.
@@ -153,17 +157,34 @@ class Demand:
             by default False
         realizations : int, optional
             Number of realizations, by default 100
+        sampling : str, optional
+            Sampling of the simulations, 'lhs', 'sobol' or 'random',
+            by default "lhs", see DemandSimulator
+        seed : int, optional
+            Seed of the simulations, by default None
         """
         self.demand = demand
         self.non_directional_factor = non_directional_factor
         self.modelling_uncertainty = modelling_uncertainty
         self.realizations = realizations
+        self.sampling = sampling
+        self.seed = seed
+
+        if isinstance(demand, EDPArray):
+            # Already sorted by IML and in array form
+            self.imls = demand.imls
+            self.iml_idxs = np.tile(
+                np.arange(demand.imls.shape[0])[:, np.newaxis],
+                (1, demand.imls.shape[1])).astype('i')
+            self.demand = demand.to_demand()
+            if self.modelling_uncertainty is None:
+                self.modelling_uncertainty = np.zeros((len(self.imls), 1))
+        else:
+            # Intensity measure range for each ground motion record
+            self.imls, self.iml_idxs = self._get_iml_range()
 
-        # Intensity measure range for each ground motion record
-        self.imls, self.iml_idxs = self._get_iml_range()
-
-        # Transform demands into numpy ndarray
-        self.demand = self._transform_demands()
+            # Transform demands into numpy ndarray
+            self.demand = self._transform_demands()
         if perform_simulations:
             # Perform latin hypercube sampling
             self.demand = self._simulate_demands()
@@ -282,131 +303,185 @@ class Demand:
         """
         # If number of realizations is less than the number of ground motions,
         # skip
-        if self.realizations <= self.demand[0].shape(1):
+        if self.realizations <= self.demand[0].shape[1]:
             return self.demand
 
-        nltha = []
-        for i, arr in enumerate(self.demand):
-            nltha.append(
-                np.zeros((arr.shape[0], self.realizations, arr.shape[1])),
-            )
+        simulator = DemandSimulator(
+            self.demand, self.modelling_uncertainty, self.sampling, self.seed)
+        nltha = simulator.sample(self.realizations)
 
-            for j in range(arr.shape[0]):
-                nltha[i][j, :, :] = self._latin_hypercube_sampling(
-                    arr[j, :, :],
-                    self.modelling_uncertainty[j]
-                )
-
-        return nltha
+        # Values of A should be close to 1, as the means of simulated demands
+        # should be the same as the means of
+        # original demands (currently imposing 5% tolerance)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            a = np.mean(np.log(nltha), axis=2) / simulator.mean
+        test = abs(a - 1) * 100
+        if np.any(test[simulator.active] >= 5.0):
+            print(
+                "[WARNING] Means of simulated demands are not equal to the "
+                "means of original demands!")
 
-    def _latin_hypercube_sampling(
-            self, demands: np.ndarray, beta: float) -> np.ndarray:
-        """Latin Hypercube sampling to calculate the distribution of probable
-        losses for each ground motion intensity or earthquake scenario.
-        The original demands of shape (ngm, nvar) will be transformed to
-        simulated shape (nr, nvar), where nr stands for number of realizations.
+        return list(nltha)
 
-        Parameters
-        ----------
-        demands : np.ndarray
-            Demands associated with the intensity measure of interest
-        beta : float
-            Modelling uncertainty associated with the intensity measure of
-            interest
+    def get_non_directional_demands(self) -> List[np.ndarray]:
+        """Transforms NLTHA demands by a non-dimensional factor using the
+        maximum of both directions
 
         Returns
         -------
-        np.ndarray
-            Simulated demands
+        List[np.ndarray]
+            Transformed NLTHA demands
         """
-        nvar = demands.shape[1]
-
-        # Reshape uncertainties to match
-        betas = np.array([beta] * nvar).reshape(nvar, 1)
-
-        # Take natural logarithm of the EDPs
-        ln_edps = np.log(demands)
-
-        # Find the mean matrix of lnEDPs
-        ln_edps_mean = np.mean(ln_edps, axis=0).reshape(ln_edps.shape[1], 1)
-
-        # Find covariance matrix of lnEDPs
-        ln_edps_cov = np.cov(ln_edps, rowvar=False)
-
-        # Find the rank of covariance matrix of lnEDPs
-        ln_edps_cov_rank = np.linalg.matrix_rank(ln_edps_cov)
-
-        # Inflate the variances with epistemic variability
-        sigma = np.array([np.sqrt(np.diag(ln_edps_cov))]).transpose()
-        sigmap2 = np.power(sigma, 2)
-
-        sigma_t = sigma.transpose()
-        r = ln_edps_cov / (sigma * sigma_t)
-
-        # Inflate variance for modelling uncertainty
-        sigmap2 = sigmap2 + (betas * betas)
-        sigma = np.sqrt(sigmap2)
-        sigma2 = sigma * sigma.transpose()
-        ln_edps_cov_inflated = r * sigma2
-
-        # Find the eigenvalues, eigenvectors of the covariance matrix
-        eigen_values, eigen_vectors = np.linalg.eigh(ln_edps_cov_inflated)
+        return np.maximum(*self.demand) * self.non_directional_factor
 
-        # Partition L_total to L_use. L_use is the part of eigenvector matrix
-        # L_total that corresponds to positive eigenvalues
-        # Similarly for D_use
 
-        if ln_edps_cov_rank >= nvar:
-            l_use = eigen_vectors
-            d2_use = eigen_values
-        else:
-            l_use = eigen_vectors[:, nvar - ln_edps_cov_rank:]
-            d2_use = eigen_values[nvar - ln_edps_cov_rank:]
+class DemandSimulator:
+    def __init__(
+        self,
+        demand: List[np.ndarray],
+        modelling_uncertainty: Union[float, List[float]] = None,
+        sampling: str = "lhs",
+        seed: int = None,
+    ) -> None:
+        """Simulation of demands from the joint lognormal distribution of the
+        EDPs of each direction and IML, to calculate the distribution of
+        probable losses for each ground motion intensity or earthquake
+        scenario
+
+        The variances of the log EDPs are inflated with the modelling
+        uncertainty, keeping the correlations, and the covariance matrices
+        of all directions and IMLs are decomposed at once. Realizations are
+        drawn for all directions and IMLs at once, in chunks if needed, see
+        iter_realizations.
 
-        # Find the square roof of D2_use
-        d_use = np.diag(np.power(d2_use, 0.5))
+        Parameters
+        ----------
+        demand : List[np.ndarray]
+            Demands of each direction, (IML, ground motion, variable).
+            Directions without demands, i.e. zeros, are not simulated.
+        modelling_uncertainty : Union[float, List[float]], optional
+            Modelling uncertainty, or uncertainties of each IML,
+            by default None, i.e. zero
+        sampling : str, optional
+            'lhs' for Latin Hypercube sampling, 'sobol' for scrambled Sobol
+            sequences, or 'random', by default "lhs"
+        seed : int, optional
+            Seed of the random number generator, by default None
+        """
+        if sampling not in ("lhs", "sobol", "random"):
+            raise ValueError(f"[EXCEPTION] Unknown sampling {sampling}")
+        self.sampling = sampling
+        self.rng = np.random.default_rng(seed)
 
-        # Generate Standard random numbers
-        if ln_edps_cov_rank >= nvar:
-            u = lhs(nvar, self.realizations)
-        else:
-            u = lhs(ln_edps_cov_rank, self.realizations)
-        u = norm(loc=0, scale=1).ppf(u)
+        demand = np.asarray(demand, dtype=float)
+        ndir, niml, ngm, nvar = demand.shape
 
-        u = u.transpose()
+        if modelling_uncertainty is None:
+            modelling_uncertainty = 0.
+        betas = np.broadcast_to(
+            np.ravel(np.asarray(modelling_uncertainty, dtype=float)), (niml,))
 
-        # Create Lambda=D_use
-        lam = np.matmul(l_use, d_use)
+        # Directions and IMLs with demands
+        self.active = np.any(demand != 0, axis=(2, 3))
+        if np.any(demand[self.active] <= 0):
+            raise ValueError("[EXCEPTION] Demands must be positive for "
+                             "simulations")
 
-        # Create realizations matrix
-        z = np.matmul(lam, u) + np.matmul(ln_edps_mean,
-                                          np.ones([1, self.realizations]))
+        # Take natural logarithm of the EDPs
+        ln_edps = np.log(np.where(self.active[..., np.newaxis, np.newaxis],
+                                  demand, 1.))
+
+        # Mean and covariance matrices of lnEDPs, (direction, IML, variable)
+        self.mean = np.mean(ln_edps, axis=2)
+        centered = ln_edps - self.mean[:, :, np.newaxis]
+        cov = np.matmul(np.swapaxes(centered, -1, -2), centered) / (ngm - 1)
+
+        # Rank of covariance matrices of lnEDPs
+        rank = np.linalg.matrix_rank(cov, hermitian=True)
+
+        # Inflate the variances with epistemic variability, keeping the
+        # correlations
+        sigma = np.sqrt(np.diagonal(cov, axis1=-2, axis2=-1))
+        outer = sigma[..., :, np.newaxis] * sigma[..., np.newaxis, :]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            r = np.where(outer > 0, cov / outer, np.eye(nvar))
+        sigma = np.sqrt(sigma ** 2 + betas[np.newaxis, :, np.newaxis] ** 2)
+        cov = r * sigma[..., :, np.newaxis] * sigma[..., np.newaxis, :]
+
+        # Eigenvalues, in ascending order, and eigenvectors. Only the
+        # eigenvectors of the rank largest eigenvalues are used.
+        eigen_values, eigen_vectors = np.linalg.eigh(cov)
+        used = np.arange(nvar) >= nvar - rank[..., np.newaxis]
+        eigen_values = np.where(used, np.maximum(eigen_values, 0.), 0.)
+
+        # Lambda, (direction, IML, variable, component)
+        self.lam = eigen_vectors * np.sqrt(eigen_values)[..., np.newaxis, :]
+        self.shape = (ndir, niml, nvar)
+        self._engines = None
+
+    def _uniforms(self, size: int) -> np.ndarray:
+        """Uniform samples, (direction, IML, size, variable)
+        """
+        ndir, niml, nvar = self.shape
 
-        ln_edps_sim_mean = np.mean(z, axis=1).reshape(nvar, 1)
-        # ln_edps_sim_cov = np.cov(z)
+        if self.sampling == "random":
+            return self.rng.random((ndir, niml, size, nvar))
 
-        # Values of A should be close to 1, as the means of simulated demands
-        # should be the same as the means of
-        # original demands (currently imposing 5% tolerance)
-        a = ln_edps_sim_mean / ln_edps_mean
-        test = abs(a - 1) * 100
-        if any(test[test >= 5.0]):
-            print(
-                "[WARNING] Means of simulated demands are not equal to the "
-                "means of original demands!")
+        if self.sampling == "lhs":
+            # A random point in each of size strata, strata in random order
+            strata = self.rng.permuted(np.broadcast_to(
+                np.arange(size), (ndir, niml, nvar, size)), axis=-1)
+            u = (strata + self.rng.random(strata.shape)) / size
+            return np.swapaxes(u, -1, -2)
 
-        # b = ln_edps_sim_cov / ln_edps_cov
-        w = np.exp(z).transpose()
+        # Sequences continue over chunks
+        if self._engines is None:
+            self._engines = [qmc.Sobol(nvar, scramble=True, seed=self.rng)
+                             for _ in range(ndir * niml)]
+        u = np.stack([engine.random(size) for engine in self._engines])
+        return u.reshape(ndir, niml, size, nvar)
 
-        return w
+    def sample(self, size: int) -> np.ndarray:
+        """Draws realizations of the demands
 
-    def get_non_directional_demands(self) -> List[np.ndarray]:
-        """Transforms NLTHA demands by a non-dimensional factor using the
-        maximum of both directions
+        Parameters
+        ----------
+        size : int
+            Number of realizations
 
         Returns
         -------
-        List[np.ndarray]
-            Transformed NLTHA demands
+        np.ndarray
+            Simulated demands, (direction, IML, realization, variable),
+            zeros for directions without demands
         """
-        return np.maximum(*self.demand) * self.non_directional_factor
+        u = self._uniforms(size)
+        # Guard against the bounds of the Sobol points
+        u = np.clip(u, np.finfo(float).tiny, 1 - np.finfo(float).eps / 2)
+        z = np.matmul(ndtri(u), np.swapaxes(self.lam, -1, -2)) \
+            + self.mean[:, :, np.newaxis, :]
+
+        return np.where(self.active[:, :, np.newaxis, np.newaxis],
+                        np.exp(z), 0.)
+
+    def iter_realizations(
+            self, realizations: int,
+            chunk: int = 10000) -> Iterator[np.ndarray]:
+        """Draws realizations in chunks, so that all realizations need not
+        fit in memory. Latin Hypercube samples are stratified within each
+        chunk, Sobol sequences continue over chunks.
+
+        Parameters
+        ----------
+        realizations : int
+            Total number of realizations
+        chunk : int, optional
+            Number of realizations per chunk, by default 10000
+
+        Yields
+        ------
+        np.ndarray
+            Simulated demands, (direction, IML, realization, variable)
+        """
+        for start in range(0, realizations, chunk):
+            yield self.sample(min(chunk, realizations - start))
@@ -1,13 +1,16 @@
+from typing import Union
 import numpy as np
 
+from .edp_array import EDPArray
+
 
 class Demolition:
-    def __init__(self, demand: dict) -> None:
+    def __init__(self, demand: Union[dict, EDPArray]) -> None:
         """Init Demolition object
 
         Parameters
         ----------
-        demand : dict
+        demand : Union[dict, EDPArray]
             Demands following NLTHA
         """
         self.demand = demand
@@ -21,6 +24,9 @@ class Demolition:
             Residual drifts
             (number of stripes, number of ground motion records)
         """
+        if isinstance(self.demand, EDPArray):
+            return self.demand.residuals()
+
         rec_key = next(iter(self.demand))
         directions = self.demand[rec_key].keys()
 
@@ -0,0 +1,349 @@
+import json
+from pathlib import Path
+from typing import List, Tuple, Union
+
+import numpy as np
+
+
+def _level(edps: dict, key):
+    """Value at a floor or storey key, keys are integers in the outputs of
+    the postprocessors and strings once exported to JSON
+    """
+    if key in edps:
+        return edps[key]
+    return edps[str(key)]
+
+
+def _direction(out: dict, direction: str):
+    if direction in out:
+        return out[direction]
+    if direction.isdigit() and int(direction) in out:
+        return out[int(direction)]
+    return None
+
+
+class EDPArray:
+    # Engineering demand parameters, in the order of the variable axis
+    EDPS = ("PFA", "PSD", "RPSD")
+    DIRECTIONS = ("1", "2", "SRSS")
+
+    def __init__(
+        self,
+        values: np.ndarray,
+        imls: np.ndarray,
+        nst: int,
+        directions: List[str] = ("1", "2"),
+        records: List[str] = None,
+        return_periods: List[int] = None,
+    ) -> None:
+        """Dense container of engineering demand parameters (EDPs) from
+        nonlinear time history analysis (NLTHA), IDA or MSA
+
+        Values are stored as a single array of shape
+        (direction, iml, record, variable), IMLs of each record in
+        ascending order. The variable axis holds
+            PFA at floors 0 to nst,
+            PSD at storeys 1 to nst,
+            RPSD at storeys 1 to nst,
+            global PFA, PSD and RPSD,
+        so that the first 2 * nst + 1 variables follow the layout of Demand.
+
+        Parameters
+        ----------
+        values : np.ndarray
+            EDPs, (direction, iml, record, variable)
+        imls : np.ndarray
+            IMLs, (iml, record), sorted for each record
+        nst : int
+            Number of storeys
+        directions : List[str], optional
+            Directions along the first axis, by default ("1", "2")
+        records : List[str], optional
+            Record identifiers, by default None
+        return_periods : List[int], optional
+            Return periods of each IML for MSA, by default None
+        """
+        self.values = np.asarray(values, dtype=float)
+        self.imls = np.asarray(imls, dtype=float)
+        self.nst = int(nst)
+        self.directions = [str(d) for d in directions]
+        self.records = None if records is None else \
+            [str(rec) for rec in records]
+        self.return_periods = None if return_periods is None else \
+            [int(rp) for rp in return_periods]
+
+        nvar = 3 * self.nst + 1 + len(self.EDPS)
+        if self.values.ndim != 4 or self.values.shape[3] != nvar:
+            raise ValueError(
+                "[EXCEPTION] EDP values must be of shape (direction, iml, "
+                f"record, {nvar}) for {self.nst} storeys")
+        if self.imls.shape != self.values.shape[1:3]:
+            raise ValueError("[EXCEPTION] IMLs must be of shape (iml, record)")
+
+    @property
+    def shape(self) -> Tuple[int, int, int, int]:
+        return self.values.shape
+
+    def index(self, edp: str, level: Union[int, str] = "global") -> int:
+        """Index of an EDP along the variable axis
+
+        Parameters
+        ----------
+        edp : str
+            PFA, PSD or RPSD
+        level : Union[int, str], optional
+            Floor for PFA, storey for PSD and RPSD, or 'global',
+            by default "global"
+
+        Returns
+        -------
+        int
+            Index along the variable axis
+        """
+        edp = edp.upper()
+        if edp not in self.EDPS:
+            raise ValueError(f"[EXCEPTION] Unknown EDP {edp}")
+
+        if str(level) == "global":
+            return 3 * self.nst + 1 + self.EDPS.index(edp)
+
+        level = int(level)
+        if edp == "PFA":
+            return level
+        if edp == "PSD":
+            return self.nst + level
+        return 2 * self.nst + level
+
+    def direction(self, direction: Union[int, str]) -> np.ndarray:
+        """View of the EDPs of a direction, (iml, record, variable)
+        """
+        return self.values[self.directions.index(str(direction))]
+
+    @property
+    def pfa(self) -> np.ndarray:
+        """View of PFAs at floors, (direction, iml, record, floor)
+        """
+        return self.values[..., :self.nst + 1]
+
+    @property
+    def psd(self) -> np.ndarray:
+        """View of PSDs at storeys, (direction, iml, record, storey)
+        """
+        return self.values[..., self.nst + 1:2 * self.nst + 1]
+
+    @property
+    def rpsd(self) -> np.ndarray:
+        """View of residual PSDs at storeys, (direction, iml, record, storey)
+        """
+        return self.values[..., 2 * self.nst + 1:3 * self.nst + 1]
+
+    @property
+    def global_values(self) -> np.ndarray:
+        """View of global PFA, PSD and RPSD, (direction, iml, record, 3)
+        """
+        return self.values[..., 3 * self.nst + 1:]
+
+    def by_level(self, direction: Union[int, str] = None) -> np.ndarray:
+        """EDPs by type and floor or storey
+
+        Parameters
+        ----------
+        direction : Union[int, str], optional
+            Direction, by default None, i.e. maximum over directions
+
+        Returns
+        -------
+        np.ndarray
+            EDPs, (EDP, floor or storey, iml, record), EDPs in the order of
+            EDPS, PSD and RPSD at floor 0 are nan
+        """
+        if direction is None:
+            values = np.max(self.values, axis=0)
+        else:
+            values = self.direction(direction)
+
+        tensor = np.full((len(self.EDPS), self.nst + 1) + values.shape[:2],
+                         np.nan)
+        tensor[0] = np.moveaxis(values[..., :self.nst + 1], -1, 0)
+        tensor[1, 1:] = np.moveaxis(
+            values[..., self.nst + 1:2 * self.nst + 1], -1, 0)
+        tensor[2, 1:] = np.moveaxis(
+            values[..., 2 * self.nst + 1:3 * self.nst + 1], -1, 0)
+        return tensor
+
+    def to_demand(self) -> List[np.ndarray]:
+        """EDPs in the layout of Demand.demand
+
+        Returns
+        -------
+        List[np.ndarray]
+            For directions 1, 2 and SRSS, arrays of PFAs then PSDs,
+            (iml, record, 2 * nst + 1), zeros for missing directions, nans
+            replaced with means of records at each IML
+        """
+        demand = []
+        for direction in self.DIRECTIONS:
+            if direction not in self.directions:
+                demand.append(np.zeros(self.shape[1:3] + (2 * self.nst + 1, )))
+                continue
+
+            arr = self.direction(direction)[..., :2 * self.nst + 1].copy()
+            means = np.nanmean(arr, axis=1, keepdims=True)
+            demand.append(np.where(np.isnan(arr), means, arr))
+
+        return demand
+
+    def residuals(self) -> np.ndarray:
+        """Global residual drifts, maximum over directions
+
+        Returns
+        -------
+        np.ndarray
+            Residual drifts, (iml, record)
+        """
+        residuals = self.global_values[..., self.EDPS.index("RPSD")]
+        return np.maximum(np.max(residuals, axis=0), 0.)
+
+    def save(self, path: Union[Path, str]) -> Path:
+        """Saves the EDPs to a compressed binary file
+
+        Parameters
+        ----------
+        path : Union[Path, str]
+            Path to the file, .npz is appended if missing
+
+        Returns
+        -------
+        Path
+            Path to the file
+        """
+        path = Path(path)
+        if path.suffix != ".npz":
+            path = path.with_name(path.name + ".npz")
+
+        meta = {
+            "nst": self.nst,
+            "directions": self.directions,
+            "records": self.records,
+            "return-periods": self.return_periods,
+        }
+        np.savez_compressed(path, values=self.values, imls=self.imls,
+                            meta=np.array(json.dumps(meta)))
+        return path
+
+    @classmethod
+    def load(cls, path: Union[Path, str]) -> "EDPArray":
+        """Loads EDPs saved with save()
+        """
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            return cls(data["values"], data["imls"], meta["nst"],
+                       meta["directions"], meta["records"],
+                       meta["return-periods"])
+
+    @classmethod
+    def from_dict(cls, demands: dict) -> "EDPArray":
+        """EDPs from the outputs of IDAPostprocessor or MSAPostprocessor,
+        see from_ida and from_msa
+        """
+        first = demands[next(iter(demands))]
+        if "IM" in _direction(first, "1"):
+            return cls.from_ida(demands)
+        return cls.from_msa(demands)
+
+    @classmethod
+    def from_ida(cls, demands: dict) -> "EDPArray":
+        """EDPs from the outputs of IDAPostprocessor, runs of each record are
+        sorted by IML
+
+        Parameters
+        ----------
+        demands : dict
+            {record: {direction: {'IM': [], 'PFA': {}, 'PSD': {},
+            'RPSD': {}}}}
+
+        Returns
+        -------
+        EDPArray
+        """
+        records = list(demands.keys())
+        first = demands[records[0]]
+        directions = [d for d in cls.DIRECTIONS
+                      if _direction(first, d) is not None]
+        first = _direction(first, directions[0])
+
+        nst = len(first["PSD"]) - 1
+        nruns = len(first["IM"])
+
+        values = np.full((len(directions), nruns, len(records),
+                          3 * nst + 1 + len(cls.EDPS)), np.nan)
+        imls = np.zeros((nruns, len(records)))
+
+        for r, rec in enumerate(records):
+            for d, direction in enumerate(directions):
+                out = _direction(demands[rec], direction)
+                order = np.argsort(out["IM"])
+                imls[:, r] = np.asarray(out["IM"], dtype=float)[order]
+                values[d, :, r] = cls._variables(out, nst)[:, order].T
+
+        return cls(values, imls, nst, directions, records)
+
+    @classmethod
+    def from_msa(cls, demands: dict) -> "EDPArray":
+        """EDPs from the outputs of MSAPostprocessor, stripes are sorted by
+        IML
+
+        Parameters
+        ----------
+        demands : dict
+            {level: {direction: {'PFA': {}, 'PSD': {}, 'RPSD': {}},
+            'return-period': int, 'intensity-measure': float}}
+
+        Returns
+        -------
+        EDPArray
+        """
+        levels = list(demands.keys())
+        ims = [float(demands[level]["intensity-measure"]) for level in levels]
+        levels = [levels[i] for i in np.argsort(ims)]
+
+        first = demands[levels[0]]
+        directions = [d for d in cls.DIRECTIONS
+                      if _direction(first, d) is not None]
+        first = _direction(first, directions[0])
+
+        nst = len(first["PSD"]) - 1
+        # Stripes with fewer records are padded with nans
+        nrecs = max(
+            len(_direction(demands[level], directions[0])["PFA"]["global"])
+            for level in levels)
+
+        values = np.full((len(directions), len(levels), nrecs,
+                          3 * nst + 1 + len(cls.EDPS)), np.nan)
+
+        for i, level in enumerate(levels):
+            for d, direction in enumerate(directions):
+                out = _direction(demands[level], direction)
+                variables = cls._variables(out, nst).T
+                values[d, i, :len(variables)] = variables
+
+        imls = np.repeat(np.sort(ims)[:, np.newaxis], nrecs, axis=1)
+        return_periods = [demands[level]["return-period"] for level in levels]
+
+        return cls(values, imls, nst, directions,
+                   return_periods=return_periods)
+
+    @classmethod
+    def _variables(cls, out: dict, nst: int) -> np.ndarray:
+        """Stacks the EDPs of a direction along the variable axis
+
+        Returns
+        -------
+        np.ndarray
+            (variable, runs or records)
+        """
+        rows = [_level(out["PFA"], st) for st in range(nst + 1)]
+        rows += [_level(out["PSD"], st) for st in range(1, nst + 1)]
+        rows += [_level(out["RPSD"], st) for st in range(1, nst + 1)]
+        rows += [out[edp]["global"] for edp in cls.EDPS]
+        return np.asarray(rows, dtype=float)
@@ -1,12 +1,12 @@
-from typing import List, Union
+from typing import Dict, List, Tuple, Union
 import numpy as np
-from scipy import optimize, stats
-from scipy.interpolate import interp1d
+from scipy import stats
 import matplotlib.pyplot as plt
 
-from .utilities import mlefit_ida, spline, is_list_of_lists, \
-    cdf_lognormal_norm, mlefit_msa
+from .utilities import is_list_of_lists
 from .plot_styles import FONTSIZE
+from .edp_array import EDPArray
+from .fragility_fit import fit_lognormal
 
 
 def plot_fragility(
@@ -163,28 +163,31 @@ def enforce_non_decreasing(arr):
 
 
 class Fragility:
-    def __init__(self, imls: np.ndarray) -> None:
+    def __init__(self, imls: Union[np.ndarray, EDPArray]) -> None:
         """Provides tools to calculate fragility functions
 
         Parameters
         ----------
-        imls : np.ndarray
+        imls : Union[np.ndarray, EDPArray]
             Sorted IML ranges from analysis results,
-            shape = (number of runs, number of records)
+            shape = (number of runs, number of records), or the EDPs
         """
+        if isinstance(imls, EDPArray):
+            imls = imls.imls
         self.imls = imls
 
         # IML range for interpolations
         self.iml_range = np.linspace(np.min(self.imls), np.max(self.imls), 50)
 
     def collapse_capacity(
-            self, demand: List[np.ndarray], flat_slope: float = 0.1,
-            dcap: float = 10., beta: float = 0.0, fit='msa', n_dir=2):
+            self, demand: Union[List[np.ndarray], EDPArray],
+            flat_slope: float = 0.1, dcap: float = 10., beta: float = 0.0,
+            fit='msa', n_dir=2):
         """Calculate IML vs POE fragility for the collapse limit state
 
         Parameters
         ----------
-        demand : List[np.ndarray]
+        demand : Union[List[np.ndarray], EDPArray]
             Demands sorted based on self.imls
         flat_slope : float, optional
             Flattening slope, where collapse is assumed, by default 0.1
@@ -203,6 +206,215 @@ class Fragility:
                 'probs': list,
             }
         """
+        return self.limit_state_capacities(
+            demand, [dcap], flat_slope, beta, fit, n_dir)[0]
+
+    def limit_state_capacities(
+            self, demand: Union[List[np.ndarray], EDPArray],
+            thresholds: Union[List[float], Dict[str, List[float]]],
+            flat_slope: float = 0.1, beta: float = 0.0, fit='msa', n_dir=2,
+    ) -> Union[List[dict], Dict[str, List[dict]]]:
+        """Calculate IML vs POE fragilities for many limit states, defined by
+        thresholds of the peak EDPs of the building, see collapse_capacity
+
+        The demands are reduced to the peak EDPs of each run and record
+        once, and the fragilities of all limit states are fitted at once.
+
+        Parameters
+        ----------
+        demand : Union[List[np.ndarray], EDPArray]
+            Demands sorted based on self.imls
+        thresholds : Union[List[float], Dict[str, List[float]]]
+            PSD thresholds in [%], or thresholds by EDP, e.g.
+            {'PSD': [0.4, 1.0], 'PFA': [0.5]}, PFA in the units of the
+            demands
+        flat_slope : float, optional
+            Flattening slope, where collapse is assumed, by default 0.1,
+            only used with fit='ida'
+        beta : float, optional
+            Additional uncertainty to account for, typically modelling,
+            by default 0.0
+        fit : str, optional
+            'msa' or 'ida', by default 'msa'. IDA limit states are defined
+            by PSD thresholds only.
+
+        Returns
+        -------
+        Union[List[dict], Dict[str, List[dict]]]
+            Fragility models of the thresholds, see collapse_capacity, by
+            EDP if thresholds are provided by EDP
+        """
+        by_edp = isinstance(thresholds, dict)
+        thresholds = self._thresholds(thresholds, fit)
+
+        points, exceedances = self._exceedances(
+            demand, thresholds, flat_slope, fit, n_dir)
+        trials = exceedances.shape[-1]
+        counts = self._counts(exceedances, fit)
+
+        if fit == 'ida':
+            ecdfs = [(points[1:], c[1:] / trials) for c in counts]
+        else:
+            ecdfs = [(points, c / trials) for c in counts]
+
+        medians, betas = fit_lognormal(points, trials, counts)
+        betas = (betas ** 2 + beta ** 2) ** 0.5
+        with np.errstate(divide="ignore"):
+            probs = stats.norm.cdf(
+                np.log(self.iml_range / medians[:, np.newaxis])
+                / betas[:, np.newaxis], loc=0, scale=1)
+
+        models = [
+            {'median': float(medians[i]), 'beta': float(betas[i]),
+             'probs': list(probs[i]), 'ecdf': ecdfs[i]}
+            for i in range(len(counts))
+        ]
+        return self._by_edp(models, thresholds) if by_edp else models
+
+    def bootstrap_capacities(
+            self, demand: Union[List[np.ndarray], EDPArray],
+            thresholds: Union[List[float], Dict[str, List[float]]],
+            n_boot: int = 1000, seed: int = None,
+            percentiles: List[float] = (5., 50., 95.),
+            flat_slope: float = 0.1, beta: float = 0.0, fit='msa', n_dir=2,
+            chunk: int = 250,
+    ) -> Union[List[dict], Dict[str, List[dict]]]:
+        """Bootstrap confidence bands of the IML vs POE fragilities of limit
+        states, for record-to-record uncertainty, see limit_state_capacities
+
+        Records are resampled with replacement. The exceedances of each
+        record, i.e. collapse IMLs for IDA, are computed once, each replicate
+        only reweights them, and the replicates are fitted at once, in
+        chunks of replicates.
+
+        Parameters
+        ----------
+        demand : Union[List[np.ndarray], EDPArray]
+            Demands sorted based on self.imls
+        thresholds : Union[List[float], Dict[str, List[float]]]
+            PSD thresholds in [%], or thresholds by EDP
+        n_boot : int, optional
+            Number of replicates, by default 1000
+        seed : int, optional
+            Seed of the resampling, by default None. Each chunk of
+            replicates draws from its own stream spawned from the seed, so
+            results are reproducible for a given seed and chunk.
+        percentiles : List[float], optional
+            Percentiles of the bands, by default (5., 50., 95.)
+        flat_slope : float, optional
+            Flattening slope, where collapse is assumed, by default 0.1,
+            only used with fit='ida'
+        beta : float, optional
+            Additional uncertainty to account for, typically modelling,
+            by default 0.0
+        fit : str, optional
+            'msa' or 'ida', by default 'msa'
+        chunk : int, optional
+            Number of replicates fitted at once, by default 250
+
+        Returns
+        -------
+        Union[List[dict], Dict[str, List[dict]]]
+            For each threshold, by EDP if thresholds are provided by EDP
+            {
+                'median': float,
+                'beta': float,
+                'medians': np.ndarray, (n_boot, )
+                'betas': np.ndarray, (n_boot, )
+                'percentiles': list,
+                'median-ci': np.ndarray, medians at the percentiles,
+                'beta-ci': np.ndarray, dispersions at the percentiles,
+                'bands': np.ndarray, POEs at the percentiles,
+                    (percentiles, IML points of self.iml_range)
+            }
+        """
+        by_edp = isinstance(thresholds, dict)
+        thresholds = self._thresholds(thresholds, fit)
+
+        points, exceedances = self._exceedances(
+            demand, thresholds, flat_slope, fit, n_dir)
+        nls, _, nrecs = exceedances.shape
+
+        median, dispersion = fit_lognormal(
+            points, nrecs, self._counts(exceedances, fit))
+
+        streams = np.random.SeedSequence(seed).spawn(
+            int(np.ceil(n_boot / chunk)))
+        medians, betas = [], []
+        for i, stream in enumerate(streams):
+            size = min(chunk, n_boot - i * chunk)
+            # Multiplicities of the records in each replicate
+            weights = np.random.default_rng(stream).multinomial(
+                nrecs, np.full(nrecs, 1 / nrecs), size=size)
+
+            _medians, _betas = fit_lognormal(
+                points, nrecs, self._counts(exceedances, fit, weights))
+            medians.append(_medians)
+            betas.append(_betas)
+
+        # (limit state, replicate)
+        medians = np.concatenate(medians).T
+        betas = (np.concatenate(betas).T ** 2 + beta ** 2) ** 0.5
+        dispersion = (dispersion ** 2 + beta ** 2) ** 0.5
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            curves = stats.norm.cdf(
+                np.log(self.iml_range / medians[..., np.newaxis])
+                / betas[..., np.newaxis], loc=0, scale=1)
+        bands = np.percentile(curves, percentiles, axis=1)
+
+        models = [
+            {'median': float(median[i]), 'beta': float(dispersion[i]),
+             'medians': medians[i], 'betas': betas[i],
+             'percentiles': list(percentiles),
+             'median-ci': np.percentile(medians[i], percentiles),
+             'beta-ci': np.percentile(betas[i], percentiles),
+             'bands': bands[:, i]}
+            for i in range(nls)
+        ]
+        return self._by_edp(models, thresholds) if by_edp else models
+
+    @staticmethod
+    def _thresholds(
+            thresholds: Union[List[float], Dict[str, List[float]]],
+            fit: str) -> Dict[str, np.ndarray]:
+        """Thresholds by EDP
+        """
+        if not isinstance(thresholds, dict):
+            thresholds = {"PSD": thresholds}
+        thresholds = {edp.upper(): np.atleast_1d(np.asarray(
+            values, dtype=float)) for edp, values in thresholds.items()}
+
+        unknown = set(thresholds) - {"PFA", "PSD"}
+        if unknown:
+            raise ValueError(f"[EXCEPTION] Unknown EDPs {sorted(unknown)}")
+        if fit == 'ida' and set(thresholds) != {"PSD"}:
+            raise ValueError("[EXCEPTION] IDA limit states are defined by "
+                             "PSD thresholds only")
+        return thresholds
+
+    @staticmethod
+    def _by_edp(models: List[dict],
+                thresholds: Dict[str, np.ndarray]) -> Dict[str, List[dict]]:
+        out, start = {}, 0
+        for edp, values in thresholds.items():
+            out[edp] = models[start:start + len(values)]
+            start += len(values)
+        return out
+
+    def _exceedances(
+            self, demand: Union[List[np.ndarray], EDPArray],
+            thresholds: Dict[str, np.ndarray], flat_slope: float, fit: str,
+            n_dir: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Exceedances of the limit states by each record
+
+        Returns
+        -------
+        Tuple[np.ndarray, np.ndarray]
+            IMLs, and exceedances, (limit state, IMLs, records)
+        """
+        if isinstance(demand, EDPArray):
+            demand = demand.to_demand()
         demand = np.maximum(*demand)
 
         # number of storeys
@@ -210,117 +422,229 @@ class Fragility:
         # number of realizations
         nsim = demand.shape[n_dir]
 
-        # Slice for PSDs only for collapse fragility computation
-        demand = demand[:, :, nst + 1:]
+        # Get the maximum EDPs for the building and shrink one axis of
+        # NLTHA, PFAs at floors then PSDs at storeys
+        peaks = {
+            "PFA": lambda: np.max(demand[:, :, :nst + 1], axis=2),
+            "PSD": lambda: np.max(demand[:, :, nst + 1:], axis=2),
+        }
+
+        exceedances = []
+        for edp, values in thresholds.items():
+            peak = peaks[edp]()
+            if fit == 'ida':
+                points, _exceedances = self._ida_exceedances(
+                    peak, values, nsim, flat_slope)
+            elif fit == 'msa':
+                points = self.imls[:, 0]
+                _exceedances = \
+                    peak[np.newaxis] >= values[:, np.newaxis, np.newaxis]
+            else:
+                raise ValueError(f"[EXCEPTION] Unknown fit {fit}")
+            exceedances.append(_exceedances)
+
+        return points, np.concatenate(exceedances)
+
+    @staticmethod
+    def _counts(exceedances: np.ndarray, fit: str,
+                weights: np.ndarray = None) -> np.ndarray:
+        """Counts of exceedances of the limit states
 
-        # Get the maximum PSDs for the building and shrink one axis of NLTHA
-        demand = np.max(demand, axis=2)
-        if fit == 'ida':
-            # Initialize
-            psd_max = np.max(demand) if np.max(demand) < 10. else 10.
-            iml_max = np.max(self.imls)
-
-            psd_max_mod = min(psd_max, dcap)
-            iml_max_mod = iml_max
-            exceeds = np.zeros(nsim)
-
-            for rec in range(nsim):
-                order = self.imls[:, rec].argsort()
-                iml_range = self.imls[:, rec][order]
-                iml_range = np.append(iml_range, iml_range[-1])
-
-                # Get the PSD range for each simulation/record
-                psd = demand[:, rec][order]
-
-                # flatline
-                psd = np.append(psd, psd_max_mod)
-
-                # Create a spline of psd vs iml
-                psd_spline, iml_spline = spline(psd, iml_range)
-                slope_init = iml_range[1] / psd[1]
-
-                slopes = np.diff(iml_spline) / np.diff(psd_spline)
-
-                try:
-                    flat_idx = np.where(
-                        slopes == slopes[(slopes < flat_slope * slope_init)
-                                         & (slopes > 0)
-                                         & (slopes != np.inf)][0])[0][0]
-                except IndexError:
-                    flat_idx = len(iml_spline) - 1
-                    print(f"[WARNING] IDA for record {rec} not flatlining")
-
-                flat_iml = iml_spline[flat_idx - 1]
-                flat_psd = psd_spline[flat_idx - 1]
-                flat_psd_lim = dcap
-                if flat_psd > flat_psd_lim:
-                    flat_psd = flat_psd_lim
-                    flat_iml = float(iml_spline[np.where(
-                        psd_spline == psd_spline[
-                            psd_spline > flat_psd_lim][0])[0]])
-
-                exceeds[rec] = flat_iml
-
-            iml_min = min(exceeds)
-            iml_max = max(exceeds)
-
-            # Fragility calculations with maximum likelihood (MLE) fitting
-            iml_all = np.linspace(0, iml_max_mod, 100)
-            counts = np.zeros(iml_all.shape)
-
-            counts = np.sum(exceeds[:, np.newaxis] < iml_all, axis=0)
-            counts[iml_all < iml_min] = 0
-            counts[iml_all > iml_max] = len(exceeds)
-
-            # number of records
-            n_rec = len(exceeds)
-
-            xs = iml_all
-            ys = counts
-            if xs[0] == 0:
-                xs, ys = xs[1:], ys[1:]
-            theta_hat_mom = np.exp(np.mean(np.log(xs)))
-            beta_hat_mom = np.std(np.log(xs))
-            x0 = [theta_hat_mom, beta_hat_mom]
-
-            xopt_mle = optimize.fmin(
-                func=lambda var: mlefit_ida(median=var[0], dispersion=var[1],
-                                            total_count=n_rec,
-                                            count=np.array(ys),
-                                            data=xs),
-                x0=x0, maxiter=3000, maxfun=3000, disp=False)
-
-            ecdf = (xs[1:], ys[1:] / n_rec)
-
-        elif fit == 'msa':
-            num_gms = demand.shape[1]
-            num_collapse = np.sum(demand >= dcap, axis=1)
+        Parameters
+        ----------
+        exceedances : np.ndarray
+            Exceedances, (limit state, IMLs, records)
+        fit : str
+            'msa' or 'ida'
+        weights : np.ndarray, optional
+            Multiplicities of the records in replicates,
+            (replicate, records), by default None
+
+        Returns
+        -------
+        np.ndarray
+            Counts, (limit state, IMLs), or (replicate, limit state, IMLs)
+        """
+        if weights is None:
+            counts = np.sum(exceedances, axis=-1)
+        else:
+            counts = np.einsum("lir,br->bli", exceedances.astype(float),
+                               weights)
+        if fit == 'msa':
             # TODO: I am not sure about this
-            enforce_non_decreasing(num_collapse)
-            msa_imls = self.imls[:, 0]
-            ecdf = (msa_imls, num_collapse / num_gms)
-            xopt_mle = mlefit_msa(msa_imls, num_gms, num_collapse)
+            counts = np.maximum.accumulate(counts, axis=-1)
+        return counts
 
-        theta_mle = xopt_mle[0]
-        beta_mle = (xopt_mle[1] ** 2 + beta ** 2) ** 0.5
+    def _ida_exceedances(
+            self, psd: np.ndarray, dcaps: np.ndarray, nsim: int,
+            flat_slope: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Collapses from the flatlines of the IDA curves, for each drift
+        capacity
 
-        probs = stats.norm.cdf(
-            np.log(self.iml_range / theta_mle) / beta_mle, loc=0, scale=1
-        )
+        Parameters
+        ----------
+        psd : np.ndarray
+            Peak storey drifts of the building, (runs, records)
+        dcaps : np.ndarray
+            Maximum PSDs beyond which collapse is assumed in [%]
+        nsim : int
+            Number of records
+        flat_slope : float
+            Flattening slope, where collapse is assumed
+
+        Returns
+        -------
+        Tuple[np.ndarray, np.ndarray]
+            IMLs, and collapses of the records,
+            (drift capacity, IMLs, records)
+        """
+        # Initialize
+        psd_max = np.max(psd) if np.max(psd) < 10. else 10.
+        iml_max = np.max(self.imls)
+
+        # Fragility calculations with maximum likelihood (MLE) fitting
+        iml_all = np.linspace(0, iml_max, 100)
+        if iml_all[0] == 0:
+            iml_all = iml_all[1:]
 
-        return {'median': theta_mle, 'beta': beta_mle, 'probs': list(probs),
-                'ecdf': ecdf}
+        # Collapse IMLs of the records, (drift capacity, records)
+        exceeds = np.array([
+            self._flatlines(self.imls[:, :nsim], psd[:, :nsim],
+                            min(psd_max, dcap), flat_slope, dcap)
+            for dcap in dcaps
+        ]).reshape(len(dcaps), -1)
+
+        return iml_all, exceeds[:, np.newaxis, :] < iml_all[:, np.newaxis]
+
+    @staticmethod
+    def _flatlines(
+            imls: np.ndarray, psd: np.ndarray, psd_max: float,
+            flat_slope: float, dcap: float, size: int = 1000) -> np.ndarray:
+        """IMLs at which the IDA curves of the records flatline
+
+        The PSD-IM curve of each record, closed by a point at psd_max, is
+        resampled on size points per run, see utilities.spline. Collapse is
+        at the first step whose slope drops below flat_slope times the
+        initial slope, or at the first point beyond dcap.
+
+        All records share the grid, steps within a run have the slope of
+        the run, so only the first step of each run and the steps across
+        runs are evaluated, for all records at once.
+
+        Parameters
+        ----------
+        imls : np.ndarray
+            IMLs, (runs, records)
+        psd : np.ndarray
+            Peak storey drifts of the building, (runs, records)
+        psd_max : float
+            PSD closing the IDA curves in [%]
+        flat_slope : float
+            Flattening slope, relative to the initial slope
+        dcap : float
+            Maximum PSD beyond which collapse is assumed in [%]
+        size : int, optional
+            Number of interpolation points per run, by default 1000
 
-    def demolition_capacity(self, residuals: np.ndarray, median: float,
-                            beta: float):
+        Returns
+        -------
+        np.ndarray
+            Collapse IMLs, (records, )
+        """
+        order = np.argsort(imls, axis=0)
+        imls = np.take_along_axis(imls, order, axis=0).T
+        psd = np.take_along_axis(psd, order, axis=0).T
+        nrecs, nruns = imls.shape
+
+        # Nodes of the IDA curves, closed by a flat segment at psd_max
+        y = np.concatenate((imls, imls[:, -1:]), axis=1)
+        x = np.concatenate((psd, np.full((nrecs, 1), psd_max)), axis=1)
+
+        # Grid over the node indices, and run of each point, the last
+        # point is on the last node. Linear interpolation between the nodes
+        # as np.interp, i.e. utilities.spline.
+        points = np.linspace(0, nruns, size * nruns)
+        lo = np.floor(points).astype(int)
+        frac = points - lo
+        npoints = len(points)
+        rows = np.arange(nrecs)[:, np.newaxis]
+        x_pad = np.concatenate((x, x[:, -1:]), axis=1)
+        y_pad = np.concatenate((y, y[:, -1:]), axis=1)
+
+        def grid(nodes, idx):
+            # Interpolated values at points idx, (records, len(idx))
+            idx = np.broadcast_to(idx, (nrecs, np.shape(idx)[-1]))
+            k = lo[idx]
+            return (nodes[rows, k + 1] - nodes[rows, k]) * frac[idx] \
+                + nodes[rows, k]
+
+        # Steps of each run, step i joins points i and i + 1, the first
+        # step of a run may join the previous run
+        runs = np.arange(nruns + 1)
+        first = np.searchsorted(lo[1:], runs, side="left")
+        across = lo[first] != runs
+        inner = first + across
+
+        # Candidate steps in order, the step across runs then the first
+        # step within the run
+        steps = np.stack((first, inner), axis=1).ravel()
+        valid = np.stack((across, inner < np.searchsorted(
+            lo[1:], runs, side="right")), axis=1).ravel()
+        steps = np.minimum(steps, npoints - 2)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            slopes = (grid(y_pad, steps + 1) - grid(y_pad, steps)) \
+                / (grid(x_pad, steps + 1) - grid(x_pad, steps))
+            # Slope of the run for the steps within
+            slopes[:, 1:-1:2] = np.diff(y, axis=1) / np.diff(x, axis=1)
+
+            slope_init = y[:, 1] / x[:, 1]
+            flat = (slopes < flat_slope * slope_init[:, np.newaxis]) \
+                & (slopes > 0) & (slopes != np.inf) & valid
+
+        flatlining = flat.any(axis=1)
+        for rec in np.flatnonzero(~flatlining):
+            print(f"[WARNING] IDA for record {rec} not flatlining")
+        flat_idx = np.where(flatlining, steps[np.argmax(flat, axis=1)],
+                            npoints - 1)
+
+        # Point preceding the flat step
+        flat_point = ((flat_idx - 1) % npoints)[:, np.newaxis]
+        exceeds = grid(y_pad, flat_point)[:, 0]
+        beyond = grid(x_pad, flat_point)[:, 0] > dcap
+        if not beyond.any():
+            return exceeds
+
+        # Beyond the drift capacity, first point exceeding it. Points of a
+        # run are monotonic, the run is found from its end points and the
+        # point by bisection.
+        start = np.searchsorted(lo, runs, side="left")
+        end = np.searchsorted(lo, runs, side="right") - 1
+        exceeding = np.maximum(grid(x_pad, start), grid(x_pad, end)) > dcap
+        run = np.argmax(exceeding, axis=1)
+
+        low, high = start[run], end[run]
+        found = grid(x_pad, low[:, np.newaxis])[:, 0] > dcap
+        high = np.where(found, low, high)
+        while np.any(high - low > 1):
+            mid = (low + high) // 2
+            above = grid(x_pad, mid[:, np.newaxis])[:, 0] > dcap
+            low = np.where(above, low, mid)
+            high = np.where(above, mid, high)
+
+        exceeds[beyond] = grid(y_pad, high[:, np.newaxis])[beyond, 0]
+        return exceeds
+
+    def demolition_capacity(self, residuals: Union[np.ndarray, EDPArray],
+                            median: float, beta: float):
         """Calculate IML vs POE fragility for the demolition limit state
 
         Parameters
         ----------
-        residuals : np.ndarray
+        residuals : Union[np.ndarray, EDPArray]
             Residual drifts sorted based on self.imls
             (number of stripes, number of ground motion records)
-            ordered by sorted IML
+            ordered by sorted IML, or the EDPs
         median : float
             Median EDP in %
         beta : float
@@ -335,71 +659,46 @@ class Fragility:
                 'probs': list,
             }
         """
+        if isinstance(residuals, EDPArray):
+            residuals = residuals.residuals()
+
         # Get the maximum IML recorded from analysis results
         iml_max = np.max(self.imls)
 
         # Number of ground motion records
         num_recs = residuals.shape[1]
 
-        # Demolition probabilities initialization
+        # Residual drifts of all records at all IMLs, (IML points, records),
+        # nan for records not reaching an IML
+        exceeds = self._interp_records(self.imls, residuals, self.iml_range)
+        edp_max = np.max(np.where(np.isnan(exceeds), -np.inf, exceeds),
+                         axis=1)
+
+        # Counts of records below each point of the EDP range at each IML.
+        # Records not reaching an IML are not counted, but are part of the
+        # trials.
+        fitted = edp_max > 0
+        edp_range = np.linspace(0., edp_max[fitted] * 1.5, 200, axis=1)[:, 1:]
+        counts = np.sum(
+            exceeds[fitted, np.newaxis, :] < edp_range[..., np.newaxis],
+            axis=2)
+
+        # Lognormal distributions of the residual drifts at all IMLs at once
+        theta_mle, beta_mle = fit_lognormal(edp_range, num_recs, counts)
+
+        # Demolition probabilities, none without residual drifts
         p_demol_final = np.zeros(self.iml_range.shape)
-
-        for i, iml in enumerate(self.iml_range):
-            exceeds = np.array([])
-
-            for rec in range(num_recs):
-                iml_record = self.imls[:, rec]
-                edp = residuals[:, rec]
-                spline = interp1d(iml_record, edp)
-
-                if iml <= max(iml_record):
-                    exceeds = np.append(exceeds, float(spline(iml)))
-
-            edp_min = min(exceeds)
-            edp_max = max(exceeds)
-
-            edp_range = np.linspace(0., edp_max * 1.5, 200)[1:]
-            counts = sum(np.array(exceeds)[:, np.newaxis] < edp_range)
-            counts[edp_range < edp_min] = 0.
-            counts[edp_range > edp_max] = len(exceeds)
-
-            # Start the fitting
-            if edp_range[0] == 0:
-                edp_range, counts = edp_range[1:], counts[1:]
-
-            theta_hat_mom = np.exp(np.mean(np.log(edp_range)))
-            beta_hat_mom = np.std(np.log(edp_range))
-            x0 = [theta_hat_mom, beta_hat_mom]
-
-            xopt_mle = optimize.fmin(
-                func=lambda var: mlefit_ida(median=var[0], dispersion=var[1],
-                                            total_count=num_recs,
-                                            count=counts, data=edp_range),
-                x0=x0, maxiter=100, maxfun=100, disp=False)
-
-            theta_mle = xopt_mle[0]
-            beta_mle = xopt_mle[1]
-
-            p_demol_iml = stats.norm.cdf(
-                np.log(theta_mle / median)
-                / (beta_mle ** 2 + beta ** 2) ** 0.5,
-                loc=0, scale=1)
-            p_demol_final[i] = p_demol_iml
+        p_demol_final[fitted] = stats.norm.cdf(
+            np.log(theta_mle / median) / (beta_mle ** 2 + beta ** 2) ** 0.5,
+            loc=0, scale=1)
 
         # Final fitting
-        xs = self.iml_range[self.iml_range <= iml_max]
-        ys = np.round(p_demol_final * num_recs, 0)
-
-        theta_hat_mom = np.exp(np.mean(np.log(xs)))
-        beta_hat_mom = np.std(np.log(xs))
-        x0 = [theta_hat_mom, beta_hat_mom]
-        xopt_mle = optimize.fmin(
-            func=lambda var: mlefit_ida(median=var[0], dispersion=var[1],
-                                        total_count=num_recs,
-                                        count=ys, data=xs),
-            x0=x0, maxiter=100, maxfun=100, disp=False)
-        theta_mle = xopt_mle[0]
-        beta_mle = xopt_mle[1]
+        mask = self.iml_range <= iml_max
+        xs = self.iml_range[mask]
+        ys = np.round(p_demol_final * num_recs, 0)[mask]
+
+        theta_mle, beta_mle = fit_lognormal(xs, num_recs, ys)
+        theta_mle, beta_mle = float(theta_mle), float(beta_mle)
 
         probs = stats.norm.cdf(
             np.log(self.iml_range / theta_mle) / beta_mle, loc=0, scale=1
@@ -407,57 +706,114 @@ class Fragility:
 
         return {'median': theta_mle, 'beta': beta_mle, 'probs': list(probs)}
 
-    def edp_given_im(
-            self, demand: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
-        """Calculate EDP vs POE fragility for a given IML, in terms of PDF.
-        Records causing collapse are ignored.
-        When the number of non-collapsing records is less than 3,
-        the distribution at the previous IML is assumed
+    @staticmethod
+    def _interp_records(imls: np.ndarray, values: np.ndarray,
+                        points: np.ndarray) -> np.ndarray:
+        """Linear interpolation of the values of each record at the points,
+        as interp1d, for all records at once. Missing values, i.e. nan, are
+        skipped.
 
         Parameters
         ----------
-        demand : np.ndarray
-            Demands sorted based on self.imls for a particular EDP
-            (number of runs, number of simulations)
+        imls : np.ndarray
+            IMLs, (runs, records)
+        values : np.ndarray
+            Values, e.g. residual drifts, (..., runs, records)
+        points : np.ndarray
+            IMLs to interpolate at, (points, )
 
-        Parameters
-        ----------
-        tuple[np.ndarray, np.ndarray]
-            (medians, dispersions)
+        Returns
+        -------
+        np.ndarray
+            Interpolated values, (..., points, records), nan outside the
+            IMLs of a record
         """
-        # To store the counts of exceedances
-        # (number of simulations, number of IML points)
-        exceeds = np.zeros((self.imls.shape[1], len(self.iml_range)))
-        for rec in range(demand.shape[1]):
-            _demand = demand[:, rec][~np.isnan(demand[:, rec])]
-            _imls = self.imls[:, rec][~np.isnan(demand[:, rec])]
+        imls, values = np.broadcast_arrays(imls, values)
+        # Missing values are sorted last and never reached
+        x = np.where(np.isnan(values) | np.isnan(imls), np.inf, imls)
+        order = np.argsort(x, axis=-2, kind="stable")
+        x = np.take_along_axis(x, order, axis=-2)
+        y = np.take_along_axis(values, order, axis=-2)
+        points = np.asarray(points, dtype=float)[:, np.newaxis]
+        nruns = x.shape[-2]
+
+        # Last IML not above each point, as np.interp
+        lo = np.sum(x[..., np.newaxis, :, :] <= points[:, np.newaxis],
+                    axis=-2) - 1
+        nvalid = np.sum(np.isfinite(x), axis=-2, keepdims=True)
+        last = np.take_along_axis(x, np.maximum(nvalid - 1, 0), axis=-2)
+        inside = (lo >= 0) & (points <= last)
+        lo = np.clip(lo, 0, nruns - 1)
+        hi = np.minimum(lo + 1, nruns - 1)
+
+        x0 = np.take_along_axis(x, lo, axis=-2)
+        x1 = np.take_along_axis(x, hi, axis=-2)
+        y0 = np.take_along_axis(y, lo, axis=-2)
+        y1 = np.take_along_axis(y, hi, axis=-2)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            interp = y0 + (y1 - y0) / (x1 - x0) * (points - x0)
+        interp = np.where(points == x0, y0, interp)
+
+        return np.where(inside, interp, np.nan)
 
-            imls = np.insert(_imls, 0, 0)
-            demand_range = np.insert(_demand, 0, 0)
-
-            spline = interp1d(imls, demand_range, fill_value=max(
-                demand_range), axis=0, bounds_error=False)
-
-            exceeds[rec, :] = spline(self.iml_range)
-
-        max_edps = np.max(exceeds, axis=0)
-
-        # Demand range used for fitting, (number of simulations, 100)
-        medians = np.zeros(max_edps.shape)
-        betas = np.zeros(max_edps.shape)
+    def edp_given_im(
+            self, demand: Union[np.ndarray, EDPArray],
+            direction: Union[int, str] = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Calculate EDP vs POE fragility for a given IML, in terms of PDF.
+        Records causing collapse are ignored beyond their last demand,
+        where the maximum demand of the record is assumed.
 
-        for i, val in enumerate(max_edps):
-            fit_demand_range = np.linspace(0, val * 1.5, 101)[1:]
-            counts = sum(map(lambda x: x < fit_demand_range,
-                         exceeds[:, i])) / demand.shape[1]
+        Lognormal distributions are fitted for all IMLs, and all EDPs and
+        storeys at once, by maximum likelihood on the counts of records
+        below each demand level.
 
-            coef_opt, _ = optimize.curve_fit(
-                cdf_lognormal_norm,
-                fit_demand_range[1:],
-                counts[1:],
-                maxfev=10**6)
+        Parameters
+        ----------
+        demand : Union[np.ndarray, EDPArray]
+            Demands sorted based on self.imls for a particular EDP
+            (number of runs, number of simulations), or for many,
+            (..., number of runs, number of simulations), or the EDPs
+        direction : Union[int, str], optional
+            Direction of the EDPs, by default None, i.e. maximum over
+            directions, only used with EDPArray
 
-            medians[i], betas[i] = coef_opt
-            # medians[i] = np.exp(medians[i])
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray]
+            (medians, dispersions), (..., number of IML points), or
+            (EDP, storey or floor, number of IML points) for EDPArray, see
+            EDPArray.by_level. Nan where there are no demands.
+        """
+        if isinstance(demand, EDPArray):
+            demand = demand.by_level(direction)
+        demand = np.asarray(demand, dtype=float)
+        nsim = demand.shape[-1]
+
+        # Demands of the records at the IML points, starting from zero at a
+        # zero IML, (..., number of IML points, number of simulations)
+        imls = np.concatenate((np.zeros((1, nsim)), self.imls), axis=0)
+        demand = np.concatenate(
+            (np.zeros(demand.shape[:-2] + (1, nsim)), demand), axis=-2)
+        exceeds = self._interp_records(imls, demand, self.iml_range)
+
+        # Beyond the last demand of a record
+        fill = np.nanmax(demand, axis=-2)[..., np.newaxis, :]
+        exceeds = np.where(np.isnan(exceeds), fill, exceeds)
+
+        max_edps = np.max(exceeds, axis=-1)
+
+        # Demand range used for fitting, (..., number of IML points, 100)
+        fitted = max_edps > 0
+        fit_demand_range = np.linspace(
+            0, max_edps[fitted] * 1.5, 101, axis=-1)[:, 1:]
+        counts = np.sum(
+            exceeds[fitted][:, np.newaxis, :]
+            < fit_demand_range[..., np.newaxis], axis=-1)
+
+        medians = np.full(max_edps.shape, np.nan)
+        betas = np.full(max_edps.shape, np.nan)
+        medians[fitted], betas[fitted] = fit_lognormal(
+            fit_demand_range[:, 1:], nsim, counts[:, 1:])
 
         return medians, betas
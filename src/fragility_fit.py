@@ -0,0 +1,260 @@
+from typing import Tuple, Union
+
+import numpy as np
+from scipy import special
+
+
+_LOG_SQRT_2PI = 0.5 * np.log(2 * np.pi)
+
+
+def _prepare(points, trials, counts):
+    """Broadcasts the data of the fits, (fits..., points), and masks the
+    points that carry no information, i.e. at non-positive EDPs or IMLs or
+    without trials
+    """
+    points = np.asarray(points, dtype=float)
+    counts = np.asarray(counts, dtype=float)
+    trials = np.asarray(trials, dtype=float)
+
+    points, trials, counts = np.broadcast_arrays(points, trials, counts)
+    valid = (points > 0) & (trials > 0) & np.isfinite(counts)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_points = np.where(valid, np.log(points), 0.)
+    trials = np.where(valid, trials, 0.)
+    counts = np.where(valid, counts, 0.)
+
+    return log_points, trials, counts, valid
+
+
+def _terms(z):
+    """Log probabilities and inverse Mills ratios of a standard normal,
+    evaluated in log space so that tails do not underflow
+    """
+    log_cdf = special.log_ndtr(z)
+    log_sf = special.log_ndtr(-z)
+    log_pdf = -0.5 * z ** 2 - _LOG_SQRT_2PI
+    return log_cdf, log_sf, np.exp(log_pdf - log_cdf), \
+        np.exp(log_pdf - log_sf)
+
+
+def _nll(mu, beta, log_points, trials, counts, valid):
+    """Negative log-likelihood without the binomial coefficients, with
+    respect to the log median mu and the dispersion beta
+    """
+    z = (log_points - mu[..., np.newaxis]) / beta[..., np.newaxis]
+    log_cdf, log_sf, _, _ = _terms(z)
+    terms = counts * log_cdf + (trials - counts) * log_sf
+    return -np.sum(np.where(valid, terms, 0.), axis=-1)
+
+
+def _score(mu, beta, log_points, trials, counts, valid):
+    """Gradient of the negative log-likelihood and Fisher information,
+    with respect to the log median mu and the dispersion beta
+    """
+    z = (log_points - mu[..., np.newaxis]) / beta[..., np.newaxis]
+    _, _, ratio_cdf, ratio_sf = _terms(z)
+    # Derivatives with respect to z
+    dz = np.where(valid, (trials - counts) * ratio_sf - counts * ratio_cdf,
+                  0.)
+    wz = np.where(valid, trials * ratio_cdf * ratio_sf, 0.)
+
+    grad = (-np.sum(dz, axis=-1) / beta, -np.sum(dz * z, axis=-1) / beta)
+    info = (np.sum(wz, axis=-1) / beta ** 2,
+            np.sum(wz * z, axis=-1) / beta ** 2,
+            np.sum(wz * z ** 2, axis=-1) / beta ** 2)
+    return grad, info
+
+
+def neg_log_likelihood(
+    median: Union[float, np.ndarray],
+    dispersion: Union[float, np.ndarray],
+    points: np.ndarray,
+    trials: Union[int, np.ndarray],
+    counts: np.ndarray,
+    gradient: bool = False,
+) -> Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]:
+    """Negative log-likelihood of lognormal fragility functions, the counts
+    at each point being binomial, for many parameters or fits at once
+
+    Parameters
+    ----------
+    median : Union[float, np.ndarray]
+        Medians, (fits..., )
+    dispersion : Union[float, np.ndarray]
+        Dispersions, (fits..., )
+    points : np.ndarray
+        EDPs or IMLs, (fits..., points)
+    trials : Union[int, np.ndarray]
+        Number of trials, broadcast against the counts
+    counts : np.ndarray
+        Number of exceedances or collapses, (fits..., points)
+    gradient : bool, optional
+        Return the gradient as well, by default False
+
+    Returns
+    -------
+    Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]
+        Negative log-likelihoods, (fits..., ), inf for non-positive
+        parameters, and gradients with respect to the median and the
+        dispersion, (fits..., 2)
+    """
+    log_points, trials, counts, valid = _prepare(points, trials, counts)
+    median, dispersion = np.broadcast_arrays(
+        np.asarray(median, dtype=float), np.asarray(dispersion, dtype=float))
+    feasible = (median > 0) & (dispersion > 0)
+    with np.errstate(divide="ignore"):
+        mu = np.log(np.where(feasible, median, 1.))
+    beta = np.where(feasible, dispersion, 1.)
+
+    data = (log_points, trials, counts, valid)
+    coefficients = np.sum(np.where(
+        valid, special.gammaln(trials + 1) - special.gammaln(counts + 1)
+        - special.gammaln(trials - counts + 1), 0.), axis=-1)
+    nll = np.where(feasible, _nll(mu, beta, *data) - coefficients, np.inf)
+    if not gradient:
+        return nll
+
+    (grad_mu, grad_beta), _ = _score(mu, beta, *data)
+    grad = np.stack((grad_mu / np.where(feasible, median, 1.), grad_beta),
+                    axis=-1)
+    return nll, np.where(feasible[..., np.newaxis], grad, np.nan)
+
+
+def _initial_guess(log_points, trials, counts, valid):
+    """Closed-form estimates from a regression of the probits of the
+    observed fractions on the log points, falls back to the log moments of
+    the points, as the initial guess of the fits in fragility.py
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fractions = counts / trials
+    interior = valid & (fractions > 0) & (fractions < 1)
+    probits = special.ndtri(np.where(interior, fractions, 0.5))
+
+    weights = interior.astype(float)
+    n = np.sum(weights, axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_x = np.sum(weights * log_points, axis=-1) / n
+        mean_z = np.sum(weights * probits, axis=-1) / n
+        dx = (log_points - mean_x[..., np.newaxis]) * weights
+        sxx = np.sum(dx ** 2, axis=-1)
+        slope = np.sum(dx * (probits - mean_z[..., np.newaxis]),
+                       axis=-1) / sxx
+
+        ok = (n >= 2) & (sxx > 0) & (slope > 0)
+        mu = np.where(ok, mean_x - mean_z / slope, 0.)
+        beta = np.where(ok, 1 / slope, 0.)
+
+        # Log moments of the points
+        nvalid = np.sum(valid, axis=-1)
+        mu_mom = np.sum(np.where(valid, log_points, 0.), axis=-1) / nvalid
+        beta_mom = np.sqrt(np.sum(np.where(
+            valid, (log_points - mu_mom[..., np.newaxis]) ** 2, 0.),
+            axis=-1) / nvalid)
+
+    beta_mom = np.where(beta_mom > 0, beta_mom, 1.)
+    mu = np.where(ok, mu, np.nan_to_num(mu_mom))
+    beta = np.where(ok, beta, beta_mom)
+    return mu, beta
+
+
+def fit_lognormal(
+    points: np.ndarray,
+    trials: Union[int, np.ndarray],
+    counts: np.ndarray,
+    x0: Tuple[np.ndarray, np.ndarray] = None,
+    max_iter: int = 100,
+    tol: float = 1e-10,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Maximum likelihood fits of lognormal fragility functions, many fits
+    at once
+
+    The counts at each point are binomial, with a probability given by the
+    lognormal CDF, as mlefit_ida and mlefit_msa. Estimates from a probit
+    regression of the observed fractions are refined with Fisher scoring
+    and step halving, for all fits at once, until each fit converges.
+    Points at non-positive EDPs or IMLs are ignored.
+
+    Parameters
+    ----------
+    points : np.ndarray
+        EDPs or IMLs, (fits..., points), or (points, ) shared by the fits
+    trials : Union[int, np.ndarray]
+        Number of trials, e.g. records, broadcast against the counts, i.e.
+        (fits..., 1) for trials by fit
+    counts : np.ndarray
+        Number of exceedances or collapses, (fits..., points)
+    x0 : Tuple[np.ndarray, np.ndarray], optional
+        Initial medians and dispersions, by default None, i.e. estimated
+    max_iter : int, optional
+        Maximum number of iterations, by default 100
+    tol : float, optional
+        Tolerance on the relative change of the parameters,
+        by default 1e-10
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]
+        Medians and dispersions, (fits..., )
+    """
+    data = _prepare(points, trials, counts)
+    shape = data[0].shape[:-1]
+    # Fits along a single axis
+    data = tuple(arr.reshape(-1, arr.shape[-1]) for arr in data)
+
+    if x0 is None:
+        mu, beta = _initial_guess(*data)
+    else:
+        mu = np.broadcast_to(np.log(x0[0]), shape).astype(float).ravel()
+        beta = np.broadcast_to(x0[1], shape).astype(float).ravel()
+
+    nll = _nll(mu, beta, *data)
+    active = np.isfinite(nll)
+
+    for _ in range(max_iter):
+        if not active.any():
+            break
+
+        idx = np.flatnonzero(active)
+        m, b = mu[idx], beta[idx]
+        args = tuple(arr[idx] for arr in data)
+        (grad_mu, grad_beta), (info_mm, info_mb, info_bb) = _score(
+            m, b, *args)
+
+        # Scoring step, slightly damped for nearly singular information
+        ridge = 1e-10 * (info_mm + info_bb) + 1e-300
+        info_mm, info_bb = info_mm + ridge, info_bb + ridge
+        det = info_mm * info_bb - info_mb ** 2
+        step_mu = -(info_bb * grad_mu - info_mb * grad_beta) / det
+        step_beta = -(info_mm * grad_beta - info_mb * grad_mu) / det
+
+        # Step halving until the likelihood does not decrease
+        current = nll[idx]
+        t = np.ones(m.shape)
+        accepted = np.zeros(m.shape, dtype=bool)
+        new_mu, new_beta, new_nll = m.copy(), b.copy(), current.copy()
+        for _ in range(40):
+            pending = ~accepted
+            if not pending.any():
+                break
+            trial_mu = m + t * step_mu
+            trial_beta = b + t * step_beta
+            with np.errstate(invalid="ignore", divide="ignore"):
+                trial_nll = _nll(trial_mu, np.where(
+                    trial_beta > 0, trial_beta, 1.), *args)
+            ok = pending & (trial_beta > 0) & (trial_nll <= current)
+            new_mu[ok], new_beta[ok] = trial_mu[ok], trial_beta[ok]
+            new_nll[ok] = trial_nll[ok]
+            accepted |= ok
+            t[~accepted] /= 2
+
+        change = np.abs(new_mu - m) + np.abs(new_beta - b)
+        mu[idx], beta[idx], nll[idx] = new_mu, new_beta, new_nll
+
+        converged = ~accepted | (change <= tol * (1 + np.abs(m) + b))
+        active[idx[converged]] = False
+
+    # Fits without a finite maximum, e.g. without any observations, diverge
+    # towards medians of zero or infinity
+    with np.errstate(over="ignore"):
+        return np.exp(mu).reshape(shape), beta.reshape(shape)
@@ -1,10 +1,30 @@
 from pathlib import Path
 from typing import List, Tuple
+from functools import lru_cache
 import os
 from .utilities import create_path
 import numpy as np
 
 
+@lru_cache(maxsize=512)
+def load_record(path: Path) -> np.ndarray:
+    """Reads a ground motion record, parsed records are cached per process
+
+    Parameters
+    ----------
+    path : Path
+        Path to ground motion record
+
+    Returns
+    -------
+    np.ndarray
+        Content of the record file, read-only
+    """
+    record = np.loadtxt(path)
+    record.setflags(write=False)
+    return record
+
+
 def get_ground_motion(path: Path, filenames: List[Path]) -> Tuple[np.array]:
     """Get ground motions
 
@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Union
 from pathlib import Path
 import json
 import numpy as np
@@ -416,33 +416,86 @@ class Hazard:
         return mafe_ls
 
     def get_im(
-            self, mafe: float, k0: float, k1: float, k2: float = 0.) -> float:
+            self, mafe: Union[float, np.ndarray] = None,
+            k0: Union[float, np.ndarray] = None,
+            k1: Union[float, np.ndarray] = None,
+            k2: Union[float, np.ndarray] = 0.,
+            return_period: Union[float, np.ndarray] = None,
+            poe: Union[float, np.ndarray] = None,
+            investigation_time: float = 50.) -> Union[float, np.ndarray]:
         """Get intensity measure (IM) value
 
+        The SAC/FEMA form is a quadratic in ln(s), its root on the
+        decreasing branch of the hazard curve is
+            ln(s) = -2c / (k1 + sqrt(k1^2 - 4 k2 c)), c = ln(mafe / k0),
+        which holds for k2 = 0 as well. MAFEs above the peak of the curve
+        are mapped to the IM at the peak. Values without a root on the
+        decreasing branch, e.g. k1 <= 0 and k2 = 0, are solved numerically.
+
         Parameters
         ----------
-        mafe : float
+        mafe : Union[float, np.ndarray], optional
             Mean annual frequency of exceeding (MAFE) an IM value
-        k0 : float
+        k0 : Union[float, np.ndarray]
             SAC/FEMA-compatible coefficient
-        k1 : float
+        k1 : Union[float, np.ndarray]
             SAC/FEMA-compatible coefficient
-        k2 : float
+        k2 : Union[float, np.ndarray]
             SAC/FEMA-compatible coefficient, by default 0.
+        return_period : Union[float, np.ndarray], optional
+            Return period, used if mafe is not provided, by default None
+        poe : Union[float, np.ndarray], optional
+            Probability of exceedance (POE), used if mafe and return_period
+            are not provided, by default None
+        investigation_time : float, optional
+            Investigation time in years, by default 50
 
         Returns
         -------
-        float
-            intensity measure (IM)
+        Union[float, np.ndarray]
+            intensity measure (IM), float for scalar inputs
+
+        Raises
+        ------
+        ValueError
+            Must provide one of the following input arguments: mafe,
+            return_period, poe, and the coefficients k0 and k1
         """
         if k2 is None:
             k2 = 0.0
 
-        def func(x):
-            return mafe - analytical_mafe(x, k0, k1, k2)
-
-        s = optimization.fsolve(func, x0=0.1)
-        return float(s)
+        if k0 is None or k1 is None:
+            raise ValueError("Must provide the coefficients k0 and k1")
+        if mafe is None:
+            mafe = self.get_mafe(return_period=return_period, poe=poe,
+                                 investigation_time=investigation_time)
+
+        mafe, k0, k1, k2 = np.broadcast_arrays(
+            *(np.asarray(x, dtype=float) for x in (mafe, k0, k1, k2)))
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            c = np.log(mafe / k0)
+            disc = k1 ** 2 - 4 * k2 * c
+            denominator = k1 + np.sqrt(np.maximum(disc, 0.))
+            # Peak of the curve for MAFEs above it
+            s = np.exp(np.where(disc < 0, -k1 / (2 * k2),
+                                -2 * c / denominator))
+
+        # Fall back to a numerical solution
+        fallback = ~(np.isfinite(s) & (denominator > 0))
+        s = np.array(s)
+        for idx in np.argwhere(fallback):
+            idx = tuple(idx)
+
+            def func(x):
+                return mafe[idx] - analytical_mafe(
+                    x, k0[idx], k1[idx], k2[idx])
+
+            s[idx] = optimization.fsolve(func, x0=0.1)[0]
+
+        if s.ndim == 0:
+            return float(s)
+        return s
 
 
 class HazardModel:
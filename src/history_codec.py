@@ -0,0 +1,355 @@
+import pickle
+import zlib
+from pathlib import Path
+from typing import Dict, Tuple, Union
+
+import numpy as np
+
+from .results_store import VARIABLES
+
+
+# Unsigned integer views used for lossless delta encoding of floats
+_UINTS = {4: np.uint32, 8: np.uint64}
+
+# Quantities from which residual drifts are averaged over the free vibration
+# phase, located by analysis step, they are stored at every step
+_UNDECIMATED = ("drifts", "residuals")
+
+
+class HistoryCodec:
+    def __init__(
+        self,
+        dtype: str = "float64",
+        compress: bool = True,
+        delta: bool = False,
+        level: int = 6,
+        chunk: int = 4096,
+        output_dt: float = None,
+    ) -> None:
+        """Encoding of the time histories of a response quantity
+
+        Histories of shape (directions, storeys or floors, steps) are
+        stored row by row, i.e. per direction and storey, each row split
+        into chunks of steps, so that a single row is decoded without
+        decompressing the others.
+
+        Parameters
+        ----------
+        dtype : str, optional
+            Stored precision, e.g. float32, by default "float64"
+        compress : bool, optional
+            zlib compression of the chunks, by default True
+        delta : bool, optional
+            Delta encoding of consecutive steps before compression, by
+            default False. Deltas are taken on the bit patterns of the
+            values, the encoding is lossless.
+        level : int, optional
+            zlib compression level, by default 6
+        chunk : int, optional
+            Number of steps per chunk, by default 4096
+        output_dt : float, optional
+            Time step of the stored histories in [s], by default None, i.e.
+            every analysis step is kept. Histories are decimated by keeping
+            the peak absolute value of each window of steps, and the final
+            step, so that peak and final values are preserved. Not supported
+            for drifts and residuals, see EncodedOutputs.
+        """
+        self.dtype = np.dtype(dtype)
+        if self.dtype.itemsize not in _UINTS or self.dtype.kind != "f":
+            raise ValueError("[EXCEPTION] Histories are stored as float32 "
+                             "or float64")
+
+        self.compress = compress
+        self.delta = delta
+        self.level = level
+        self.chunk = chunk
+        self.output_dt = output_dt
+
+    def factor(self, dt: float = None) -> int:
+        """Number of analysis steps per stored step
+        """
+        if self.output_dt is None or dt is None or dt <= 0:
+            return 1
+        return max(1, int(round(self.output_dt / dt)))
+
+    @staticmethod
+    def decimate(history: np.ndarray, factor: int) -> np.ndarray:
+        """Peak absolute value of each window of factor steps, followed by
+        the final step
+
+        Parameters
+        ----------
+        history : np.ndarray
+            Histories, steps along the last axis
+        factor : int
+            Number of steps per window
+
+        Returns
+        -------
+        np.ndarray
+            Decimated histories
+        """
+        steps = history.shape[-1]
+        if factor <= 1 or steps <= factor:
+            return history
+
+        windows = steps // factor
+        body = history[..., :windows * factor].reshape(
+            history.shape[:-1] + (windows, factor))
+        idx = np.argmax(np.abs(body), axis=-1)[..., np.newaxis]
+        decimated = np.take_along_axis(body, idx, axis=-1)[..., 0]
+
+        return np.concatenate((decimated, history[..., -1:]), axis=-1)
+
+    def encode(self, history: np.ndarray,
+               dt: float = None) -> "EncodedHistory":
+        """Encodes the histories of a response quantity
+
+        Parameters
+        ----------
+        history : np.ndarray
+            Histories, (directions, storeys or floors, steps)
+        dt : float, optional
+            Analysis time step in [s], required for decimation,
+            by default None
+
+        Returns
+        -------
+        EncodedHistory
+        """
+        history = np.asarray(history)
+        history = self.decimate(history, self.factor(dt))
+        nrows = int(np.prod(history.shape[:-1]))
+        values = history.astype(self.dtype).reshape(nrows, history.shape[-1])
+
+        if self.delta:
+            bits = values.view(_UINTS[self.dtype.itemsize])
+            # Unsigned differences wrap around and are undone by cumsum
+            values = np.diff(bits, axis=-1, prepend=bits.dtype.type(0))
+
+        rows = []
+        for row in values:
+            chunks = []
+            for start in range(0, max(row.size, 1), self.chunk):
+                data = row[start:start + self.chunk].tobytes()
+                if self.compress:
+                    data = zlib.compress(data, self.level)
+                chunks.append(data)
+            rows.append(chunks)
+
+        return EncodedHistory(history.shape, self.dtype, self.delta,
+                              self.compress, rows)
+
+
+class EncodedHistory:
+    def __init__(
+        self,
+        shape: Tuple[int, ...],
+        dtype: np.dtype,
+        delta: bool,
+        compressed: bool,
+        rows: list,
+    ) -> None:
+        """Histories of a response quantity encoded with HistoryCodec
+
+        Parameters
+        ----------
+        shape : Tuple[int, ...]
+            Shape of the histories, (directions, storeys or floors, steps)
+        dtype : np.dtype
+            Stored precision
+        delta : bool
+            Chunks are delta encoded
+        compressed : bool
+            Chunks are zlib compressed
+        rows : list
+            Encoded chunks of each row, rows ordered by direction then
+            storey or floor
+        """
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.delta = delta
+        self.compressed = compressed
+        self.rows = rows
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the encoded chunks in bytes
+        """
+        return sum(len(data) for chunks in self.rows for data in chunks)
+
+    def _row(self, index: int) -> np.ndarray:
+        chunks = self.rows[index]
+        if self.delta:
+            dtype = np.dtype(_UINTS[self.dtype.itemsize])
+        else:
+            dtype = self.dtype
+
+        row = np.concatenate([
+            np.frombuffer(
+                zlib.decompress(data) if self.compressed else data,
+                dtype=dtype)
+            for data in chunks
+        ])
+        if self.delta:
+            row = np.cumsum(row, dtype=dtype).view(self.dtype)
+        return row
+
+    def decode(self, direction: int = None, storey: int = None) -> np.ndarray:
+        """Decodes the histories, only the selected rows are decompressed
+
+        Parameters
+        ----------
+        direction : int, optional
+            Direction index, by default None, i.e. all directions
+        storey : int, optional
+            Storey or floor index, by default None, i.e. all
+
+        Returns
+        -------
+        np.ndarray
+            Histories as float64, the selected axes are dropped
+        """
+        ndir, nlev, steps = self.shape
+        dirs = range(ndir) if direction is None else [direction]
+        levels = range(nlev) if storey is None else [storey]
+
+        history = np.empty((len(dirs), len(levels), steps))
+        for i, d in enumerate(dirs):
+            for j, st in enumerate(levels):
+                history[i, j] = self._row(d * nlev + st)
+
+        if storey is not None:
+            history = history[:, 0]
+        if direction is not None:
+            history = history[0]
+        return history
+
+
+def check_encoding(
+    encoding: Union[HistoryCodec, Dict[str, HistoryCodec]],
+) -> Dict[str, HistoryCodec]:
+    """Codecs by quantity, see EncodedOutputs
+
+    Raises
+    ------
+    ValueError
+        If drifts or residuals are to be decimated, residual drifts are
+        averaged from the step at which the free vibration phase starts
+    """
+    if isinstance(encoding, HistoryCodec):
+        encoding = {variable: encoding for variable in VARIABLES}
+
+    for variable in _UNDECIMATED:
+        codec = encoding.get(variable)
+        if codec is not None and codec.output_dt is not None:
+            raise ValueError(
+                f"[EXCEPTION] output_dt is not supported for {variable}, "
+                "use codecs by quantity to decimate accelerations and "
+                "displacements only")
+    return encoding
+
+
+class EncodedOutputs:
+    def __init__(
+        self,
+        outputs: Tuple[np.ndarray, ...],
+        encoding: Union[HistoryCodec, Dict[str, HistoryCodec]],
+        dt: float = None,
+    ) -> None:
+        """Outputs of a nonlinear time history analysis with encoded
+        histories, exported in place of the outputs tuple
+
+        Parameters
+        ----------
+        outputs : Tuple[np.ndarray, ...]
+            Accelerations, displacements, drifts and residuals, further
+            items, e.g. the intensity measure level, are kept as is
+        encoding : Union[HistoryCodec, Dict[str, HistoryCodec]]
+            Codec of all quantities, or codecs by quantity, see VARIABLES,
+            quantities without a codec are stored as is
+        dt : float, optional
+            Analysis time step in [s], by default None
+
+        """
+        encoding = check_encoding(encoding)
+
+        self.histories = {}
+        for i, variable in enumerate(VARIABLES):
+            codec = encoding.get(variable)
+            if codec is None:
+                self.histories[variable] = np.asarray(outputs[i])
+            else:
+                self.histories[variable] = codec.encode(outputs[i], dt)
+        self.extras = tuple(outputs[len(VARIABLES):])
+
+    def variable(self, variable: str, direction: int = None,
+                 storey: int = None) -> np.ndarray:
+        """Decodes the histories of a single quantity
+
+        Parameters
+        ----------
+        variable : str
+            One of VARIABLES
+        direction : int, optional
+            Direction index, by default None, i.e. all directions
+        storey : int, optional
+            Storey or floor index, by default None, i.e. all
+
+        Returns
+        -------
+        np.ndarray
+            Histories
+        """
+        history = self.histories[variable]
+        if isinstance(history, EncodedHistory):
+            return history.decode(direction, storey)
+
+        if direction is not None:
+            history = history[direction]
+            return history if storey is None else history[storey]
+        return history if storey is None else history[:, storey]
+
+    def decode(self) -> Tuple[np.ndarray, ...]:
+        """Outputs in the layout of SolutionAlgorithm.solve
+        """
+        return tuple(self.variable(variable)
+                     for variable in VARIABLES) + self.extras
+
+
+def encode_outputs(
+    outputs: Tuple[np.ndarray, ...],
+    encoding: Union[HistoryCodec, Dict[str, HistoryCodec]] = None,
+    dt: float = None,
+):
+    """Encodes outputs for export, see EncodedOutputs, returned as is if
+    no encoding is provided
+    """
+    if encoding is None:
+        return outputs
+    return EncodedOutputs(outputs, encoding, dt)
+
+
+def decode_outputs(outputs):
+    """Decodes exported outputs if encoded, see EncodedOutputs
+    """
+    if isinstance(outputs, EncodedOutputs):
+        return outputs.decode()
+    return outputs
+
+
+def load_outputs(path: Path):
+    """Reads a pickle file of outputs, decoded if encoded
+
+    Parameters
+    ----------
+    path : Path
+        Path to the pickle file
+
+    Returns
+    -------
+    any
+        Outputs, summaries are returned as is
+    """
+    with open(path, "rb") as file:
+        return decode_outputs(pickle.load(file))
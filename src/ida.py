@@ -1,13 +1,21 @@
 import pickle
+import time
 from pathlib import Path
-from typing import List, Union
+from typing import Callable, Dict, List, Union
 import openseespy.opensees as op
 import numpy as np
 import multiprocessing as mp
 
 from .intensity_measure import IntensityMeasure
 from .solution_algorithm import SolutionAlgorithm, apply_time_series
-from .gm_records import get_ground_motion
+from .gm_records import get_ground_motion, load_record
+from .scheduler import Journal, TaskScheduler, count_points
+from .results_store import ResultsStore
+from .summarizer import failure, performed, summary_path
+from .history_codec import HistoryCodec, check_encoding, \
+    encode_outputs
+from .result_writer import get_writer
+from .worker_pool import WorkerPool
 from .mdof2d.model import build_model
 
 
@@ -24,6 +32,10 @@ class IDA:
     outputs = dict()
     im_output = None
 
+    # Performed and nominal analysis steps, used to calibrate the scheduler
+    steps = 0
+    nominal_steps = 0.
+
     def __init__(
         self,
         model,
@@ -43,6 +55,12 @@ class IDA:
         sa_avg_bounds=[0, 2],
         bnode: List = None,
         tnode: List = None,
+        run_timeout: float = None,
+        step_timeout: float = None,
+        store: ResultsStore = None,
+        summarizer: Callable = None,
+        export_histories: bool = True,
+        encoding: Union[HistoryCodec, Dict[str, HistoryCodec]] = None,
     ) -> None:
         """Incremental Dynamic Analysis (IDA) using Hunt, trace and fill (HTF)
         algorithm
@@ -92,6 +110,27 @@ class IDA:
             Beam transformation type for OpenSees, by default None
         export_at_each_step : bool, optional
             Export time history results at each step of IDA, by default True
+        run_timeout : float, optional
+            Wall-clock budget of a single run in [s], beyond which the run is
+            terminated as non-converged, by default None
+        step_timeout : float, optional
+            Wall-clock budget of a single analysis step in [s], beyond which
+            the run is terminated as non-converged, by default None
+        store : ResultsStore, optional
+            Results store, where the outputs of each run are appended instead
+            of being exported as separate pickle files, by default None
+        summarizer : Callable, optional
+            Called in the worker with the outputs of each run and the step at
+            which free vibrations start, returns its summary, e.g.
+            summarizer.summarize, exported as Record{r}_Run{j}.summary.pickle
+            or to the store, by default None
+        export_histories : bool, optional
+            Export the time histories as pickle files, by default True
+            If False, only the summaries are exported
+        encoding : Union[HistoryCodec, Dict[str, HistoryCodec]], optional
+            Encoding of the exported time histories, for all or for each
+            response quantity, see history_codec, by default None
+            Drifts and residuals are not decimated, see check_encoding
         """
 
         if output_path is None:
@@ -114,6 +153,18 @@ class IDA:
         self.sa_avg_bounds = sa_avg_bounds
         self.bnode = bnode
         self.tnode = tnode
+        self.run_timeout = run_timeout
+        self.step_timeout = step_timeout
+        self.store = store
+        self.summarizer = summarizer
+        self.export_histories = export_histories
+        self.encoding = encoding
+        if encoding is not None:
+            # Fails before the analyses, not in the background writer
+            check_encoding(encoding)
+
+        # Termination status of each run of the current record
+        self.runs = []
 
     def _call_model(self, generate_model: bool = True):
         if not generate_model:
@@ -121,6 +172,17 @@ class IDA:
 
         build_model()
 
+    @staticmethod
+    def _free_vibration_step(dt_record, eq_name_x, eq_name_y=None) -> int:
+        """Step at which the free vibrations start, consistent with
+        IDAPostprocessor
+        """
+        npts = len(load_record(eq_name_x))
+        if eq_name_y is not None:
+            npts = max(npts, len(load_record(eq_name_y)))
+        dur = dt_record * (npts - 1)
+        return int(dur / dt_record)
+
     def _select_htf_step(
         self, im, im_geomean, rec, j, dt_record, eq_name_x,
         eq_name_y, output_path, analysis_time_step, dur, im_filename
@@ -141,18 +203,51 @@ class IDA:
         # Commence analysis
         th = SolutionAlgorithm(
             output_path, analysis_time_step, dur, self.dcap,
-            self.bnode, self.tnode, directions=directions
+            self.bnode, self.tnode, directions=directions,
+            run_timeout=self.run_timeout, step_timeout=self.step_timeout,
         )
         accelerations, displacements, drifts, residuals = th.solve(rec)
+        self.steps += th.steps
+        self.nominal_steps += dur / analysis_time_step
         self.outputs[rec][j] = (accelerations, displacements, drifts,
                                 residuals, im[j - 1])
-        # Export results at each run
+        # Peak responses are reduced here, where the histories are in memory
+        summary, idxres = None, None
+        if self.summarizer is not None or self.store is not None:
+            idxres = self._free_vibration_step(
+                dt_record, eq_name_x, eq_name_y)
+        if self.summarizer is not None:
+            summary = dict(self.summarizer(self.outputs[rec][j], idxres),
+                           **{"collapse-index": th.collapse_index,
+                              "reason": th.reason})
+
+        # Export results at each run, each run is flushed so that the runs
+        # completed before a worker is terminated are kept
+        if self.store is not None:
+            self.store.append(self.outputs[rec][j], rec, run=j, im=im[j - 1],
+                              summary=summary, idxres=idxres,
+                              collapse_index=th.collapse_index,
+                              reason=th.reason)
+            self.store.flush()
+        # Files are written in the background while the next run starts
         if self.export_at_each_step:
-            with open(
-                output_path / f"Record{rec + 1}_Run{j}.pickle", "wb"
-            ) as handle:
-                pickle.dump(self.outputs[rec][j], handle)
-            np.savetxt(im_filename, self.im_output, delimiter=',')
+            writer = get_writer()
+            outputs = self.outputs[rec][j]
+            path = output_path / f"Record{rec + 1}_Run{j}.pickle"
+            if self.store is None and \
+                    (self.export_histories or summary is None):
+                writer.submit(path, lambda file: pickle.dump(encode_outputs(
+                    outputs, self.encoding, analysis_time_step), file))
+            if self.store is None and summary is not None:
+                writer.dump(summary_path(path), summary)
+            writer.savetxt(im_filename, self.im_output, delimiter=',')
+            if self.run_timeout is not None or self.step_timeout is not None:
+                # The worker may be terminated during the next run
+                writer.flush()
+
+        self.runs.append({"run": j, "im": float(im[j - 1]),
+                          "collapse-index": th.collapse_index,
+                          "reason": th.reason})
 
         return th.collapse_index
 
@@ -352,18 +447,19 @@ class IDA:
         for rec in range(nrecs):
             # Counting starts from 0
             self.outputs[rec] = {}
+            self.runs = []
             # Get the ground motion set information
             eq_name_x = self.gm_folder / gm_1[rec]
             eq_name_y = None
 
             dt_record = dts[rec]
-            accg_x = np.loadtxt(eq_name_x)
+            accg_x = load_record(eq_name_x)
             dur = dt_record * (len(accg_x) - 1)
             dur = self.EXTRA_DUR + dur
 
             if gm_2 is not None:
                 eq_name_y = self.gm_folder / gm_2[rec]
-                accg_y = np.loadtxt(eq_name_y)
+                accg_y = load_record(eq_name_y)
 
             # Establish the IM
             if self.im_type == 1:
@@ -414,23 +510,35 @@ class IDA:
             self._hunt_trace_fill(
                 im_geomean, dt_record, dur, eq_name_x, eq_name_y, rec,
                 self.output_path, im_filename)
+            if self.store is not None:
+                self.store.flush()
+
+        get_writer().flush()
 
         print('[IDA] Finished IDA HTF')
 
     def _ida_single(self, rec_data):
-        """Function to process a single record in parallel."""
+        """Function to process a single record in parallel.
+
+        Returns the journal entry of the record, containing its wall-clock
+        time and performed number of analysis steps.
+        """
         rec, gm_1, gm_2, dts, im_filename = rec_data
+        start = time.perf_counter()
+        self.steps = 0
+        self.nominal_steps = 0.
+        self.runs = []
 
         # Get ground motion data
         eq_name_x = self.gm_folder / gm_1
         eq_name_y = None
         dt_record = dts
-        accg_x = np.loadtxt(eq_name_x)
+        accg_x = load_record(eq_name_x)
         dur = dt_record * (len(accg_x) - 1) + self.EXTRA_DUR
 
         if gm_2 is not None:
             eq_name_y = self.gm_folder / gm_2
-            accg_y = np.loadtxt(eq_name_y)
+            accg_y = load_record(eq_name_y)
 
         # Establish the IM
         if self.im_type == 1:
@@ -494,9 +602,57 @@ class IDA:
             self.output_path,
             im_filename,
         )
-
-    def analyze_mp(self, workers) -> None:
-        """Performs IDA using multiprocessing."""
+        if self.store is not None:
+            self.store.flush()
+
+        return {
+            "key": f"ida/{gm_1}",
+            "wall-time": time.perf_counter() - start,
+            "steps": self.steps,
+            "nominal-steps": self.nominal_steps,
+            "runs": self.runs,
+        }
+
+    def _ida_timeout(self, rec_data, reason: str, wall_time: float) -> dict:
+        """Journal entry of a record, whose worker was terminated by the
+        watchdog. The run in progress is recorded as non-converged, see
+        summarizer.failure, remaining runs of the record are not performed.
+        Runs completed before the termination are kept.
+        """
+        rec, gm_1 = rec_data[:2]
+        print(f"[FAILURE] Record {rec} terminated ({reason})")
+
+        # Run in progress, the first one without outputs
+        runs = [j for j in range(1, self.max_runs + 1)
+                if self.outputs[rec][j] is None]
+        run = runs[0] if runs else None
+
+        if run is not None:
+            self.outputs[rec][run] = failure(reason)
+            if self.store is not None:
+                self.store.append_failure(rec, run=run, reason=reason)
+                self.store.flush()
+            elif self.export_at_each_step:
+                path = self.output_path / f"Record{rec + 1}_Run{run}.pickle"
+                get_writer().dump(summary_path(path), failure(reason))
+
+        return {
+            "key": f"ida/{gm_1}",
+            "wall-time": wall_time,
+            "run": run,
+            "collapse-index": -1,
+            "reason": reason,
+        }
+
+    def analyze_mp(self, workers, max_memory: float = None) -> None:
+        """Performs IDA using multiprocessing.
+
+        Workers are persistent, they are recycled only when their resident
+        memory exceeds max_memory in [MB]. Workers exceeding run_timeout or
+        step_timeout are terminated, the run in progress is recorded as
+        non-converged, see summarizer.failure, and the remaining runs of the
+        record are left as None in the outputs.
+        """
 
         im_filename = self.output_path / "IM.csv"
         if im_filename.exists():
@@ -517,15 +673,22 @@ class IDA:
         # Initialize intensity measures
         self.im_output = np.zeros((nrecs, self.max_runs))
 
-        # Prepare data for multiprocessing
-        records_data = [(rec, gm_1[rec], gm_2[rec], (dts[rec]), im_filename)
-                        for rec in range(nrecs)]
+        # Prepare data for multiprocessing, records are dispatched longest
+        # first so that a long record does not run alone at the end
+        journal = Journal(self.output_path)
+        scheduler = TaskScheduler(
+            journal, self.analysis_time_step, self.EXTRA_DUR)
+        for rec in range(nrecs):
+            npts = count_points(self.gm_folder / gm_1[rec])
+            scheduler.add(
+                f"ida/{gm_1[rec]}",
+                (rec, gm_1[rec], gm_2[rec], (dts[rec]), im_filename),
+                npts, dts[rec], runs=self.max_runs)
+        records_data = scheduler.order()
 
         # Get number of CPUs available
         if workers == 0:
             workers = mp.cpu_count()
-        if workers > 0:
-            workers = workers + 1
         with mp.Manager() as manager:
             self.outputs = manager.dict()
             # Ensure self.outputs[rec] exists as a shared dictionary
@@ -536,16 +699,26 @@ class IDA:
                     for j in range(1, self.max_runs + 1):
                         self.outputs[rec][j] = None
             # Use multiprocessing to process records in parallel
-            with mp.Pool(workers - 1, maxtasksperchild=1) as pool:
-                pool.map(self._ida_single, records_data)
+            with WorkerPool(self._ida_single, workers,
+                            initargs=(build_model,),
+                            max_memory=max_memory,
+                            run_timeout=self.run_timeout,
+                            step_timeout=self.step_timeout,
+                            on_timeout=self._ida_timeout) as pool:
+                for entry in pool.imap(records_data):
+                    journal.append([entry])
             # Convert to a normal dictionary before the manager is closed
             outputs = {rec: dict(self.outputs[rec]) for rec in self.outputs}
         self.outputs = outputs
 
         for rec in self.outputs:
             for i in self.outputs[rec]:
+                if not performed(self.outputs[rec][i]):
+                    continue
                 self.im_output[rec, i-1] = self.outputs[rec][i][4]
 
         np.savetxt(im_filename, self.im_output, delimiter=',')
+        # Summaries of the runs terminated by the watchdog
+        get_writer().flush()
 
         print(f'[IDA] Finished IDA HTF for {nrecs} records')
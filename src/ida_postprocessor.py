@@ -1,9 +1,14 @@
 import pickle
-from typing import List, Union, Tuple
+import warnings
+from typing import Iterator, List, Union, Tuple
 from pathlib import Path
 from itertools import chain
 import numpy as np
-from scipy.interpolate import interp1d
+
+from .aggregates import RunningAggregate
+from .history_codec import load_outputs
+from .results_store import ResultsStore
+from .summarizer import SUFFIX, performed, status, summarize
 
 
 class IDAPostprocessor:
@@ -16,7 +21,7 @@ class IDAPostprocessor:
 
     def __init__(
         self,
-        ida: Union[Path, dict],
+        ida: Union[Path, dict, ResultsStore],
         ims: Union[Path],
         dt_path: Union[np.ndarray, Path] = None,
         dur_path: Union[np.ndarray, Path] = None,
@@ -26,8 +31,9 @@ class IDAPostprocessor:
 
         Parameters
         ----------
-        ida : Path
-            Path to IDA outputs
+        ida : Union[Path, dict, ResultsStore]
+            Path to IDA outputs, i.e. a pickle file, a directory of pickle
+            files or a results store directory, or the outputs themselves
         ims : Union[Path]
             Path to IM values output from IDA
         dt_path : Union[np.ndarray, Path], optional
@@ -47,6 +53,9 @@ class IDAPostprocessor:
         self.ida = ida
         self.ims = ims
         self.durs, self.dts = self.get_durs_dts(dt_path, dur_path, gm_folder)
+        # Termination status of the runs with a recorded status, set by
+        # postprocess, {record_id: {run: {'collapse-index', 'reason'}}}
+        self.status = {}
 
     def get_durs_dts(
         self,
@@ -161,57 +170,242 @@ class IDAPostprocessor:
         num_recs: int,
     ) -> Tuple[np.ndarray, np.ndarray]:
 
-        im_spl = np.zeros([num_recs, len(edp_range)])
-        im_spl[:] = np.nan
-        im_qtile = np.zeros([len(qtile_range), len(edp_range)])
+        """Queries the IM at given EDP values on the IDA curve of each
+        record, and the quantiles of IM over the records
 
-        # Getting the edp-based im values
-        for rec in range(num_recs):
-            spl = interp1d(edp[rec], im[rec])
+        Parameters
+        ----------
+        edp_range : np.ndarray
+            EDP values, in ascending order
+        qtile_range : Union[np.ndarray, List]
+            Quantiles
+        im : np.ndarray
+            IM values of the IDA curves, records x points
+        edp : np.ndarray
+            EDP values of the IDA curves, records x points, points that are
+            not finite, e.g. runs not performed, are ignored
+        num_recs : int
+            Number of records
 
-            for i in range(len(edp_range)):
-                if edp_range[i] <= max(edp[rec]):
-                    im_spl[rec][i] = spl(edp_range[i])
-                else:
-                    im_spl[rec][i] = im_spl[rec][i - 1]
+        Returns
+        -------
+        Tuple[np.ndarray, np.ndarray]
+            IM values at edp_range, records x EDP values, beyond the maximum
+            EDP of a record the last value is carried forward
+            IM quantiles, quantiles x EDP values, ignoring records without
+            a value
+        """
+        edp_range = np.asarray(edp_range, dtype=float)
+        im = np.asarray(im, dtype=float)[:num_recs]
+        edp = np.asarray(edp, dtype=float)[:num_recs]
+
+        # Curves are linearly interpolated in ascending order of EDP, the
+        # sort is stable so that repeated EDP values keep the run order
+        order = np.argsort(edp, axis=1, kind="stable")
+        edp = np.take_along_axis(edp, order, axis=1)
+        im = np.take_along_axis(im, order, axis=1)
+
+        # Points of runs not performed are not finite and are dropped, they
+        # are sorted last
+        finite = np.isfinite(edp) & np.isfinite(im)
+        im_spl = np.stack([
+            np.interp(edp_range, edp[rec, finite[rec]], im[rec, finite[rec]])
+            if finite[rec].any() else np.full(len(edp_range), np.nan)
+            for rec in range(num_recs)
+        ])
+
+        # Carry the last value within the range of each record, i.e. up to
+        # its last finite EDP, forward
+        limit = np.max(np.where(finite, edp, -np.inf), axis=1, initial=-np.inf)
+        within = edp_range[np.newaxis, :] <= limit[:, np.newaxis]
+        last = np.where(within, np.arange(len(edp_range)), -1)
+        last = np.maximum.accumulate(last, axis=1)
+        im_spl = np.where(
+            last >= 0,
+            np.take_along_axis(im_spl, np.maximum(last, 0), axis=1),
+            np.nan)
 
         # Getting the edp-based im quantiles
-        for q in range(len(qtile_range)):
-            for i in range(len(edp_range)):
-                im_qtile[q][i] = np.quantile(im_spl[:, i], qtile_range[q])
+        with warnings.catch_warnings():
+            # EDP values beyond the range of all records
+            warnings.simplefilter("ignore", RuntimeWarning)
+            im_qtile = np.nanquantile(
+                im_spl, np.asarray(qtile_range), axis=0)
 
         return im_spl, im_qtile
 
     def _read_ida(self):
+        return dict(self.iter_records())
+
+    def iter_records(self) -> Iterator[Tuple[int, dict]]:
+        """Iterates over the outputs of the records, only the outputs of
+        the current record are held in memory when reading from a directory
+        of pickle files or a results store
+
+        Yields
+        ------
+        Tuple[int, dict]
+            Record index and outputs of its runs, {run: outputs}
+        """
         # Number of records
         nrecs = len(self.dts)
 
         if isinstance(self.ida, dict):
-            data = self.ida
-        elif self.ida.is_file():
+            for rec in range(nrecs):
+                yield rec, self.ida.get(rec, {})
+            return
+
+        if isinstance(self.ida, ResultsStore) or \
+                (self.ida / ResultsStore.MANIFEST).exists():
+            store = self.ida if isinstance(self.ida, ResultsStore) \
+                else ResultsStore(self.ida)
+            # The index is grouped by record once
+            groups = dict(store.records())
+            for rec in range(nrecs):
+                yield rec, {
+                    entry["run"]: store.summary(entry) if "summary" in entry
+                    else store.read(entry)
+                    for entry in groups.get(rec, [])
+                }
+            return
+
+        if self.ida.is_file():
             with open(self.ida, 'rb') as f:
                 data = pickle.load(f)
-
-        else:
-            data = {}
             for rec in range(nrecs):
-                data[rec] = {}
-
-            for file in chain(self.ida.glob('*pickle*'),
-                              self.ida.glob('*pkl*')):
-                rec_run = file.name.replace(".pickle", "").replace(
-                    "Record", "").replace("Run", "").split("_")
+                yield rec, data.get(rec, {})
+            return
+
+        files = {rec: {} for rec in range(nrecs)}
+        for file in chain(self.ida.glob('*pickle*'), self.ida.glob('*pkl*')):
+            summary = file.name.endswith(SUFFIX)
+            rec_run = file.name.replace(SUFFIX, "").replace(
+                ".pickle", "").replace("Record", "").replace(
+                "Run", "").split("_")
+
+            rec = int(rec_run[0]) - 1
+            run = int(rec_run[1])
+
+            # Summaries exported by the workers are read instead of the
+            # histories
+            if summary or run not in files.setdefault(rec, {}):
+                files[rec][run] = file
+
+        for rec in range(nrecs):
+            yield rec, {run: load_outputs(file)
+                        for run, file in files[rec].items()}
+
+    @staticmethod
+    def _reduce_runs(
+        runs: List[tuple],
+        idxres: int,
+    ) -> Tuple[List[np.ndarray], np.ndarray, np.ndarray]:
+        """Reduces the time histories of the runs of a record to peak and
+        residual values. Runs with histories of equal length are reduced at
+        once.
 
-                rec = int(rec_run[0]) - 1
-                run = int(rec_run[1])
+        Parameters
+        ----------
+        runs : List[tuple]
+            Outputs of each run, (accelerations, displacements, drifts, ...)
+            each of shape directions x storeys (or floors) x steps,
+            None for runs that were not performed
+        idxres : int
+            Step from which the residual drifts are computed
 
-                with open(file, 'rb') as f:
-                    data[rec][run] = pickle.load(f)
+        Returns
+        -------
+        Tuple[List[np.ndarray], np.ndarray, np.ndarray]
+            Peak absolute accelerations, displacements and drifts, each of
+            shape runs x directions x storeys (or floors)
+            Residual drifts, runs x directions x storeys
+            Peak residual drifts over the storeys, runs x directions, nan
+            if the record stopped before the free vibration phase
+        """
+        performed = [i for i, run in enumerate(runs) if run is not None]
+        if not performed:
+            raise ValueError("[EXCEPTION] No runs found for the record")
+
+        if any(isinstance(run, dict) for run in runs):
+            return IDAPostprocessor._combine_summaries(runs, idxres)
+
+        first = runs[performed[0]]
+        shapes = [np.shape(first[i])[:2] for i in range(3)]
+
+        peaks = [np.full((len(runs), ) + shape, np.nan) for shape in shapes]
+        residuals = np.full((len(runs), ) + shapes[2], np.nan)
+        peak_residuals = np.full((len(runs), shapes[2][0]), np.nan)
+
+        # Group the runs by number of steps
+        groups = {}
+        for i in performed:
+            groups.setdefault(np.shape(runs[i][2])[-1], []).append(i)
+
+        for steps, group in groups.items():
+            for i in range(3):
+                histories = np.stack([runs[j][i] for j in group])
+                peaks[i][group] = np.amax(np.abs(histories), axis=-1)
+
+            drifts = np.stack([runs[j][2] for j in group])
+            if steps > idxres:
+                residuals[group] = np.mean(drifts[..., idxres:], axis=-1)
+                peak_residuals[group] = np.amax(residuals[group], axis=-1)
+            else:
+                # Record stopped before the free vibration phase
+                residuals[group] = drifts[..., -1]
+
+        return peaks, residuals, peak_residuals
+
+    @staticmethod
+    def _combine_summaries(
+        runs: List[Union[tuple, dict]],
+        idxres: int,
+    ) -> Tuple[List[np.ndarray], np.ndarray, np.ndarray]:
+        """Combines the summaries of the runs of a record, runs exported
+        with their time histories are summarized, see _reduce_runs
+        """
+        summaries = [
+            run if run is None or isinstance(run, dict)
+            else summarize(run, idxres) for run in runs
+        ]
+        first = next(summary for summary in summaries if summary is not None)
+        if "RPSD-free" not in first:
+            raise ValueError("[EXCEPTION] Summaries must include residual "
+                             "drifts over the free vibration phase")
+
+        peaks = [np.full((len(runs), ) + first[edp].shape, np.nan)
+                 for edp in ["PFA", "disp", "PSD"]]
+        residuals = np.full((len(runs), ) + first["PSD"].shape, np.nan)
+        peak_residuals = np.full((len(runs), first["PSD"].shape[0]), np.nan)
+
+        for i, summary in enumerate(summaries):
+            if summary is None:
+                continue
+            for k, edp in enumerate(["PFA", "disp", "PSD"]):
+                peaks[k][i] = summary[edp]
+            residuals[i] = summary["RPSD-free"]
+            if summary["free-vibration"]:
+                peak_residuals[i] = np.amax(summary["RPSD-free"], axis=-1)
+
+        return peaks, residuals, peak_residuals
+
+    def postprocess(
+        self, n_dir=2, aggregate: RunningAggregate = None,
+    ) -> Tuple[dict, dict]:
+        """Postprocess IDA outputs
 
-        return data
+        Records are read and reduced one at a time, the time histories of a
+        single record are held in memory.
 
-    def postprocess(self, n_dir=2) -> Tuple[dict, dict]:
-        """Postprocess IDA outputs
+        Parameters
+        ----------
+        n_dir : int, optional
+            Number of directions, by default 2
+        aggregate : RunningAggregate, optional
+            Running aggregates, where the peak responses of each run over
+            the building are folded, with keys (EDP, direction), i.e. PFA,
+            PSD and RPSD, the latter as peak absolute residual drifts,
+            by default None
 
         Returns
         -------
@@ -241,9 +435,12 @@ class IDAPostprocessor:
 
             dict: cached IDA results, interpolation results, quantiles
                 Useful for data visualization
+
+        Termination statuses recorded with the runs are set in status, runs
+        terminated without outputs are treated as not performed.
         """
-        data = self._read_ida()
         nrecs = len(self.dts)
+        self.status = {}
 
         if isinstance(self.ims, Path):
             im_ida = np.genfromtxt(self.ims, delimiter=',', ndmin=2)
@@ -253,127 +450,119 @@ class IDAPostprocessor:
         # Number of runs
         nruns = im_ida.shape[1]
 
-        # Initialize some variables
+        # Peak and residual responses of all runs, each of shape
+        # records x runs x directions x storeys (or floors)
+        pfa, psd, disp, rpsd = [], [], [], []
+        # Peak residual drift over the storeys, records x runs x directions
+        mrpsd = []
+
+        for rec, data in self.iter_records():
+            print(f"[IDA] Record: gm_{rec + 1}")
+
+            # Analysis time step, residual drifts are computed from the
+            # free vibration phase
+            idxres = int(self.durs[rec] / self.dts[rec])
+            runs = [data.get(run) for run in range(1, nruns + 1)]
+            # Histories of the record are released once reduced
+            del data
+
+            for run, outputs in enumerate(runs, start=1):
+                collapse_index, reason = status(outputs)
+                if collapse_index is not None:
+                    self.status.setdefault(rec + 1, {})[run] = {
+                        "collapse-index": collapse_index, "reason": reason}
+                if outputs is not None and not performed(outputs):
+                    print(f"[WARNING] Record: gm_{rec + 1}, run {run} "
+                          f"terminated without outputs ({reason})")
+            runs = [run if performed(run) else None for run in runs]
+
+            peaks, residuals, peak_residuals = self._reduce_runs(
+                runs, idxres)
+            del runs
+
+            if aggregate is not None:
+                for d in range(min(n_dir, peak_residuals.shape[1])):
+                    aggregate.update(("PFA", d + 1),
+                                     np.max(peaks[0][:, d], axis=-1))
+                    aggregate.update(("PSD", d + 1),
+                                     np.max(peaks[2][:, d], axis=-1))
+                    # Residuals are signed, peak absolute values over the
+                    # storeys are folded into the log-binned sketch, as
+                    # RPSD is reported by the MSA summaries
+                    aggregate.update(("RPSD", d + 1), np.where(
+                        np.isnan(peak_residuals[:, d]), np.nan,
+                        np.max(np.abs(residuals[:, d]), axis=-1)))
+
+            pfa.append(peaks[0])
+            disp.append(peaks[1])
+            psd.append(peaks[2])
+            rpsd.append(residuals)
+            mrpsd.append(peak_residuals)
+
+        pfa = np.stack(pfa)
+        psd = np.stack(psd)
+        disp = np.stack(disp)
+        rpsd = np.stack(rpsd)
+        mrpsd = np.stack(mrpsd)
+
+        # Peaks over the building, records x runs x directions
+        mpfa_us = np.nanmax(pfa, axis=3)
+        mpsd_us = np.nanmax(psd, axis=3)
+        # Top displacement in m
+        mtdisp_us = disp[..., -1]
+
+        # Sort the IM values
+        idx = np.argsort(im_ida, axis=1)
         im = np.zeros([nrecs, nruns + 1])
-        idx = np.zeros([nrecs, nruns], dtype='i')
-        mpfa_us = np.full([nrecs, nruns], np.nan)
-        mpsd_us = np.full([nrecs, nruns], np.nan)
-        mrpsd_us = np.full([nrecs, nruns], np.nan)
-        mtdisp_us = np.full([nrecs, nruns + 1], np.nan)
-        # mtrx = np.full([nrecs, nruns + 1], np.nan)
+        im[:, 1:] = np.take_along_axis(im_ida, idx, axis=1)
 
         mpfa = {}
         mpsd = {}
         mtdisp = {}
 
+        # Initialize target dictionary with its first stage
+        out = {rec: {} for rec in range(1, nrecs + 1)}
+        cache = {}
+
         for d in range(n_dir):
             mpfa[d] = np.zeros([nrecs, nruns + 1])
             mpsd[d] = np.zeros([nrecs, nruns + 1])
             mtdisp[d] = np.zeros([nrecs, nruns + 1])
 
-        # Initialize target dictionary with its first stage
-        out = {}
-        cache = {}
+            mpfa[d][:, 1:] = np.take_along_axis(mpfa_us[..., d], idx, axis=1)
+            mpsd[d][:, 1:] = np.take_along_axis(mpsd_us[..., d], idx, axis=1)
+            mtdisp[d][:, 1:] = np.take_along_axis(
+                mtdisp_us[..., d], idx, axis=1)
 
-        # Loop for each record
-        for rec in range(1, nrecs + 1):
-            out[rec] = {}
-            for d in range(n_dir):
-                if d + 1 not in cache:
-                    cache[d + 1] = {}
-
-                print("\nDirection: %s" % d)
-
-                out[rec][d + 1] = {
-                    "IM": im_ida[rec - 1].tolist(),
-                    'PSD': {}, 'PFA': {}, 'RPSD': {},
+            # Assemble the nested outputs from the arrays
+            for rec in range(nrecs):
+                rpsd_global = mrpsd[rec, :, d]
+                if not np.all(np.isnan(rpsd_global)):
+                    # Repopulate nans with max of data
+                    rpsd_global = np.where(
+                        np.isnan(rpsd_global), np.nanmax(rpsd_global),
+                        rpsd_global)
+
+                out[rec + 1][d + 1] = {
+                    "IM": im_ida[rec].tolist(),
+                    "PSD": {
+                        st + 1: psd[rec, :, d, st].tolist()
+                        for st in range(psd.shape[3])
+                    },
+                    "PFA": {
+                        st: pfa[rec, :, d, st].tolist()
+                        for st in range(pfa.shape[3])
+                    },
+                    "RPSD": {
+                        st + 1: rpsd[rec, :, d, st].tolist()
+                        for st in range(rpsd.shape[3])
+                    },
                 }
-
-                print("Record: gm_%s" % rec)
-
-                # Sort the IM values
-                im[rec - 1, 1:] = np.sort(im_ida[rec - 1])
-                idx[rec - 1, :] = np.argsort(im_ida[rec - 1])
-
-                # Loop over each run
-                for run in range(1, nruns + 1):
-                    print(f"Record: gm_{rec}, Run {run}")
-
-                    # Select analysis results of rec and run
-                    selection = data[rec - 1][run]
-
-                    # Get PFAs in g
-                    pfa = np.amax(abs(selection[0][:, :]), axis=2)[d]
-
-                    for st, val in enumerate(pfa):
-                        if st in out[rec][d + 1]['PFA']:
-                            out[rec][d + 1]['PFA'][st].append(float(val))
-                        else:
-                            out[rec][d + 1]['PFA'][st] = [float(val)]
-
-                    mpfa_us[rec - 1, run - 1] = max(pfa)
-
-                    # Get PSDs in %
-                    psd = np.amax(abs(selection[2]), axis=2)[d]
-
-                    for st, val in enumerate(psd):
-                        if st + 1 in out[rec][d + 1]['PSD']:
-                            out[rec][d + 1]['PSD'][st + 1].append(float(val))
-                        else:
-                            out[rec][d + 1]['PSD'][st + 1] = [float(val)]
-
-                    mpsd_us[rec - 1, run - 1] = max(psd)
-
-                    # Getting the residual PSDs in %
-                    # Analysis time step
-                    dt = self.dts[rec - 1]
-                    idxres = int(self.durs[rec - 1] / dt)
-                    res_drifts = selection[2][:, :, idxres:][d]
-
-                    for st in range(len(psd)):
-                        if len(res_drifts[st]) > 0:
-                            if st + 1 in out[rec][d + 1]['RPSD']:
-                                out[rec][d + 1]['RPSD'][st + 1].append(
-                                    float(sum(res_drifts[st])
-                                          / len(res_drifts[st])))
-                            else:
-                                out[rec][d + 1]['RPSD'][st + 1] = \
-                                    [float(sum(res_drifts[st])
-                                           / len(res_drifts[st]))]
-
-                        else:
-                            if st + 1 in out[rec][d + 1]['RPSD']:
-                                out[rec][d + 1]['RPSD'][st + 1].append(
-                                    float(selection[2][0][st][-1]))
-                            else:
-                                out[rec][d + 1]['RPSD'][st + 1] = [
-                                    float(selection[2][0][st][-1])]
-
-                    # Record the peak value of residual drift at each run
-                    # for each record
-                    mrpsd_us[rec - 1, run - 1] = \
-                        max(np.sum(res_drifts, axis=1) / res_drifts.shape[1])
-
-                    # Get the top displacement in m
-                    top_disp = np.amax(abs(selection[1]), axis=n_dir)[d]
-                    mtdisp_us[rec - 1, run - 1] = top_disp[-1]
-
-                # Sort the results
-                out[rec][d + 1]['PFA']['global'] = mpfa_us[rec - 1, :].tolist()
-                out[rec][d + 1]['PSD']['global'] = mpsd_us[rec - 1, :].tolist()
-                out[rec][d + 1]['RPSD']['global'] = \
-                    mrpsd_us[rec - 1, :].tolist()
-
-                # Repopulate nans with max of data
-                out[rec][d + 1]['RPSD']['global'] = [
-                    max(out[rec][d + 1]['RPSD']['global'])
-                    if np.isnan(x) else x for x in out[rec][d + 1]['RPSD'][
-                        'global']
-                ]
-
-                mpfa[d][rec - 1, 1:] = mpfa_us[rec - 1, :][idx[rec - 1]]
-                mpsd[d][rec - 1, 1:] = mpsd_us[rec - 1, :][idx[rec - 1]]
-                mtdisp[d][rec - 1, 1:] = mtdisp_us[rec - 1, :][idx[rec - 1]]
+                out[rec + 1][d + 1]["PFA"]["global"] = \
+                    mpfa_us[rec, :, d].tolist()
+                out[rec + 1][d + 1]["PSD"]["global"] = \
+                    mpsd_us[rec, :, d].tolist()
+                out[rec + 1][d + 1]["RPSD"]["global"] = rpsd_global.tolist()
 
         # Fit the splines to the data
         for d in range(n_dir):
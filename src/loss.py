@@ -0,0 +1,522 @@
+from typing import Callable, Dict, List, Union
+import numpy as np
+from scipy import special, stats
+
+from .edp_array import EDPArray
+
+
+# Storey loss functions by name of regression, called as f(edp, popt),
+# parameters along the first axis of popt
+LOSS_FUNCTIONS: Dict[str, Callable] = {}
+
+
+def register_loss_function(name: str) -> Callable:
+    """Registers a storey loss function under the name of its regression,
+    as used in the 'regression' entry of the storey loss functions
+
+    The function is called as f(edp, popt) with arrays of EDPs and of the
+    fitting parameters, parameters along the first axis, broadcast against
+    the EDPs.
+    """
+    def decorator(func: Callable) -> Callable:
+        LOSS_FUNCTIONS[name] = func
+        return func
+    return decorator
+
+
+@register_loss_function("weibull")
+def weibull(x, popt):
+    a, b, c = popt
+    return a * (1 - np.exp(-((x / b) ** c)))
+
+
+@register_loss_function("papadopoulos")
+def papadopoulos(x, popt):
+    a, b, c, d, e = popt
+    return e * x**a / (b**a + x**a) + (1 - e) * x**c / (d**c + x**c)
+
+
+def group_edp(group: str, slf: dict) -> str:
+    """EDP of a component group, the 'edp' entry of its storey loss
+    function, or PSD or PFA from the name of the group
+    """
+    if "edp" in slf:
+        return slf["edp"].upper()
+    if "PSD" in group:
+        return "PSD"
+    if "PFA" in group:
+        return "PFA"
+    raise ValueError(f"[EXCEPTION] EDP of component group {group} unknown")
+
+
+def storey_losses(
+    edps: EDPArray,
+    slfs: dict,
+    percentiles: List[str] = ("mean", ),
+    directions: List[str] = ("1", ),
+) -> np.ndarray:
+    """Losses of the component groups at each storey, for all groups,
+    percentiles, directions, IMLs, records and storeys at once
+
+    Groups sharing a regression are evaluated in a single broadcast call of
+    its storey loss function, see LOSS_FUNCTIONS.
+
+    Parameters
+    ----------
+    edps : EDPArray
+        EDPs from IDA or MSA
+    slfs : dict
+        Storey loss functions by component group
+            {
+                group: {
+                    'regression': str,
+                    'fitting_parameters': {
+                        percentile: {'popt': List, 'multiplier': float}
+                    },
+                }
+            }
+    percentiles : List[str], optional
+        Loss percentiles, by default ("mean", )
+    directions : List[str], optional
+        Directions, e.g. 'SRSS' for two-directional dynamic analysis,
+        by default ("1", )
+
+    Returns
+    -------
+    np.ndarray
+        Losses, (group, percentile, direction, iml, record, floor or
+        storey), nan where the EDP is not defined, i.e. PSD at floor 0, or
+        for missing records
+    """
+    groups = list(slfs.keys())
+    # EDPs, (direction, EDP, floor or storey, iml, record)
+    tensor = np.stack([edps.by_level(d) for d in directions])
+    # EDPs of the groups, (group, 1, direction, iml, record, storey)
+    x = np.stack([
+        tensor[:, EDPArray.EDPS.index(group_edp(group, slfs[group]))]
+        for group in groups
+    ])
+    x = np.moveaxis(x, 2, -1)[:, np.newaxis]
+
+    losses = np.full(x.shape[:1] + (len(percentiles), ) + x.shape[2:],
+                     np.nan)
+    regressions = [slfs[group]["regression"] for group in groups]
+    for regression in dict.fromkeys(regressions):
+        if regression not in LOSS_FUNCTIONS:
+            raise ValueError(
+                f"[EXCEPTION] Unknown storey loss function {regression}")
+        idx = [i for i, r in enumerate(regressions) if r == regression]
+
+        # Parameters, (parameter, group, percentile), and multipliers
+        params = [[slfs[groups[i]]["fitting_parameters"][p]
+                   for p in percentiles] for i in idx]
+        popt = np.moveaxis(np.array(
+            [[p["popt"] for p in row] for row in params], dtype=float), -1, 0)
+        multiplier = np.array(
+            [[p["multiplier"] for p in row] for row in params], dtype=float)
+
+        shape = (slice(None), slice(None)) + (np.newaxis, ) * 4
+        losses[idx] = multiplier[shape] * LOSS_FUNCTIONS[regression](
+            x[idx], popt[(slice(None), ) + shape])
+
+    return losses
+
+
+def expected_losses(
+    edps: EDPArray,
+    slfs: dict,
+    collapse: dict = None,
+    replacement_cost: float = 1.0,
+    percentiles: List[str] = ("mean", ),
+    directions: List[str] = ("1", ),
+) -> Dict[str, Union[np.ndarray, list]]:
+    """Expected losses conditioned on the intensity measure, for all
+    component groups, percentiles and directions at once
+
+    Parameters
+    ----------
+    edps : EDPArray
+        EDPs from IDA or MSA
+    slfs : dict
+        Storey loss functions by component group, see storey_losses
+    collapse : dict, optional
+        Collapse fragility, {'median': float, 'beta': float},
+        by default None, i.e. no collapse
+    replacement_cost : float, optional
+        Replacement cost, loss given collapse, by default 1.0
+    percentiles : List[str], optional
+        Loss percentiles, by default ("mean", )
+    directions : List[str], optional
+        Directions, by default ("1", )
+
+    Returns
+    -------
+    Dict[str, Union[np.ndarray, list]]
+        {
+            'groups': List[str],
+            'percentiles': List[str],
+            'directions': List[str],
+            'imls': np.ndarray, (iml, )
+            'E[L|NC,IM]': np.ndarray, by group,
+                (group, percentile, direction, iml),
+            'P[C|IM]': np.ndarray, (iml, ),
+            'E[L|C,IM]': np.ndarray, (iml, ),
+            'E[L|IM]': np.ndarray, total, (percentile, direction, iml),
+        }
+    """
+    losses = storey_losses(edps, slfs, percentiles, directions)
+
+    # Building losses of each record, averaged over the records, missing
+    # records are skipped
+    missing = np.all(np.isnan(losses), axis=-1)
+    losses = np.where(missing, np.nan, np.nansum(losses, axis=-1))
+    losses = np.nanmean(losses, axis=-1)
+
+    imls = edps.imls[:, 0]
+    if collapse is None:
+        p_c = np.zeros(imls.shape)
+    else:
+        with np.errstate(divide="ignore"):
+            p_c = stats.norm.cdf(
+                np.log(imls / collapse["median"]) / collapse["beta"],
+                loc=0, scale=1)
+        p_c[np.isnan(p_c)] = 0
+
+    losses_c = replacement_cost * np.ones_like(p_c)
+    total = p_c * losses_c + (1 - p_c) * np.sum(losses, axis=0)
+
+    return {
+        "groups": list(slfs.keys()),
+        "percentiles": list(percentiles),
+        "directions": list(directions),
+        "imls": imls,
+        "E[L|NC,IM]": losses,
+        "P[C|IM]": p_c,
+        "E[L|C,IM]": losses_c,
+        "E[L|IM]": total,
+    }
+
+
+def get_mafe_ls(h: np.ndarray, s: np.ndarray,
+                theta: np.ndarray, beta: np.ndarray, add_tail=False):
+    """
+    Compute the mean annual frequency of exceedance (MAFE) of a limit state
+    defined by a lognormal fragility function, by direct integration with
+    a seismic hazard curve.
+
+    The method evaluates:
+
+        λ_LS = ∫ P(LS | IM) · |dλ(IM) / dIM| dIM
+
+    where λ(IM) is the mean annual frequency of exceedance (MAFE) of the
+    intensity measure IM. The integral is computed using the closed-form
+    bin-wise formulation described in Porter et al. (2004), assuming:
+        - the hazard curve is log-linear between adjacent IM points
+        (i.e. exponential in linear IM space),
+        - the fragility (conditional exceedance probability) varies linearly
+        between adjacent IM points.
+
+    Pre-processing is applied to the hazard input to improve numerical
+    stability:
+        1. Hazard values H≤0 are removed (typically occurring at very low IM).
+        2. Non-decreasing or duplicated IM points are removed (typically
+        occurring at the high-IM tail of the hazard curve).
+
+    Parameters
+    ----------
+    H : np.ndarray
+        Mean annual frequency of exceedance (MAFE) values of the hazard curve,
+        λ(IM), defined at discrete IM levels.
+    s : np.ndarray
+        Intensity measure (IM) levels corresponding to the hazard values H.
+    eta : float
+        Median of the lognormal fragility function (IM at 50% probability).
+    beta : float
+        Lognormal dispersion of the fragility function (total logarithmic
+        standard deviation).
+    add_tail : bool, optional
+        If True, includes a tail contribution to account for hazard exceedances
+        beyond the largest intensity measure (IM) explicitly included in the
+        numerical integration.
+
+    Returns
+    -------
+    lambda_ls : float
+        Mean annual frequency of exceedance (MAFE) of the specified limit
+        state.
+
+    References
+    ----------
+    Porter, K. A., Beck, J. L., & Shaikhutdinov, R. V. (2004).
+    Simplified Estimation of Economic Seismic Risk for Buildings.
+    Earthquake Spectra, 20(4), 1239-1263.
+    https://doi.org/10.1193/1.1809129
+    """
+    return float(get_mafe_ls_batch(h, s, theta, beta, add_tail))
+
+
+def get_mafe_ls_batch(h: np.ndarray, s: np.ndarray,
+                      theta: np.ndarray, beta: np.ndarray,
+                      add_tail=False) -> np.ndarray:
+    """MAFE of limit states for stacks of fragility functions and hazard
+    curves at once, see get_mafe_ls
+
+    Hazard curves and fragility parameters are broadcast against each
+    other, e.g. theta[:, np.newaxis] with hazard curves of shape
+    (curves, points) gives (fragilities, curves). The pre-processing of
+    each hazard curve masks points instead of removing them, and the bins
+    join consecutive retained points.
+
+    Parameters
+    ----------
+    h : np.ndarray
+        MAFE values of the hazard curves, (..., points)
+    s : np.ndarray
+        IM levels of the hazard curves, (..., points)
+    theta : np.ndarray
+        Medians of the fragility functions
+    beta : np.ndarray
+        Dispersions of the fragility functions
+    add_tail : bool, optional
+        If True, includes the tail beyond the largest IM level
+
+    Returns
+    -------
+    np.ndarray
+        MAFE of the limit states, broadcast shape of the hazard curves,
+        without the points axis, and of the fragility parameters
+    """
+    theta = np.asarray(theta, dtype=float)[..., np.newaxis]
+    beta = np.asarray(beta, dtype=float)[..., np.newaxis]
+    h, s, theta, beta = np.broadcast_arrays(
+        np.asarray(h, dtype=float), np.asarray(s, dtype=float), theta, beta)
+
+    # Strip non-positive hazard values
+    positive = h > 0
+
+    # Strip non-decreasing hazard segments (keep only where H decreases
+    # with s), comparing each point with the previous positive one
+    prev = _previous(positive)
+    h_prev = np.take_along_axis(h, np.maximum(prev, 0), axis=-1)
+    s_prev = np.take_along_axis(s, np.maximum(prev, 0), axis=-1)
+    keep = positive & ((prev < 0) | ((h < h_prev) & (s > s_prev)))
+
+    # Fragility / conditional probability at hazard points, P(LS | IM=s)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = np.where(s > 0, special.ndtr(np.log(s / theta) / beta), 0.)
+
+    # Bin integration (Porter et al. method 1)
+    lambda_ls = np.sum(_porter_bins(s, h, p, keep), axis=-1)
+
+    # Tail beyond last hazard point
+    if add_tail:
+        last = _last(keep)
+        lambda_ls = lambda_ls + np.where(
+            np.any(keep, axis=-1),
+            np.take_along_axis(p * h, last[..., np.newaxis], -1)[..., 0],
+            0.)
+
+    return lambda_ls
+
+
+def _previous(mask: np.ndarray) -> np.ndarray:
+    """Index of the previous point of the mask along the last axis, -1 if
+    none
+    """
+    idx = np.where(mask, np.arange(mask.shape[-1]), -1)
+    idx = np.maximum.accumulate(idx, axis=-1)
+    return np.concatenate(
+        (np.full(idx.shape[:-1] + (1, ), -1), idx[..., :-1]), axis=-1)
+
+
+def _last(mask: np.ndarray) -> np.ndarray:
+    """Index of the last point of the mask along the last axis, 0 if none
+    """
+    return np.max(np.where(mask, np.arange(mask.shape[-1]), 0), axis=-1)
+
+
+def _porter_bins(s: np.ndarray, h: np.ndarray, p: np.ndarray,
+                 valid: np.ndarray) -> np.ndarray:
+    """Contributions of the bins between consecutive valid points, by
+    closed-form integration over each bin of a log-linear hazard curve and
+    a linear conditional probability or loss ratio (Porter et al., 2004)
+
+    Returns
+    -------
+    np.ndarray
+        Contribution of each bin at its end point, zero elsewhere and for
+        flat hazard segments
+    """
+    prev = _previous(valid)
+    start = np.maximum(prev, 0)
+    s0 = np.take_along_axis(s, start, axis=-1)
+    h0 = np.take_along_axis(h, start, axis=-1)
+    p0 = np.take_along_axis(p, start, axis=-1)
+
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        ds = s - s0
+        k = np.log(h / h0) / ds  # d(ln H)/ds
+        dp = p - p0
+        bins = p0 * h0 * (1 - np.exp(k * ds)) - (dp / ds) * h0 * (
+            np.exp(k * ds) * (ds - 1 / k) + 1 / k)
+
+    return np.where(valid & (prev >= 0) & (k != 0), bins, 0.)
+
+
+def get_eal(
+    iml: np.ndarray, loss: np.ndarray, hazard: dict, rc: float = 1.0
+):
+    """Computes expected annual loss (EAL)
+
+    Parameters
+    ----------
+    iml : np.ndarray
+        IM levels
+    loss : np.ndarray
+        Expected Losses
+    hazard : dict
+        Hazard function
+    rc : float
+        Replacement cost
+
+    Returns
+    -------
+    tuple[float, dict]
+        float - EAL as a % of the total replacement cost
+        dict - Cached results
+            {
+                'eal-bins': List,
+                'iml': List,
+                'mafe': List,
+                'loss-ratio': float,
+            }
+    """
+    # Hazard
+    hazard = {key.lower(): value for key, value in hazard.items()}
+    iml_hazard = np.array(hazard['s'], dtype=float)
+    mafe = np.asarray(hazard["mafe"], dtype=float)
+
+    # Loss as the ratio of replacement cost
+    mdf = _loss_at(iml, loss, iml_hazard) / rc
+
+    # EAL contributions of each subgroup
+    non_zero_indices = mafe != 0
+    eal_bins = _porter_bins(iml_hazard, mafe, mdf, non_zero_indices)
+    eal_bins = eal_bins[non_zero_indices][1:]
+
+    iml_hazard = iml_hazard[non_zero_indices]
+    mafe = mafe[non_zero_indices]
+    mdf = mdf[non_zero_indices]
+
+    # EAL expressed in the units of total replacement cost
+    eal = rc * (sum(eal_bins) + mafe[-1])
+
+    # EAL ratio in % of the total replacement cost
+    eal_ratio = eal / rc * 100
+
+    # Cache the results
+    cache = {
+        'eal-bins': list(eal_bins),
+        'hazard-iml': list(iml_hazard),
+        'hazard-mafe': list(mafe),
+        'loss-ratio': list(mdf),
+    }
+
+    return eal_ratio, cache
+
+
+def get_eal_batch(
+    iml: np.ndarray, loss: np.ndarray, s: np.ndarray, mafe: np.ndarray,
+    rc: float = 1.0,
+) -> np.ndarray:
+    """Expected annual loss (EAL) ratios for stacks of vulnerability curves
+    and hazard curves at once, see get_eal
+
+    Vulnerability curves and hazard curves are broadcast against each
+    other, e.g. losses of shape (curves, 1, imls) with hazard curves of
+    shape (branches, points) give (curves, branches). Hazard points with
+    zero MAFE are masked instead of removed.
+
+    Parameters
+    ----------
+    iml : np.ndarray
+        IM levels of the vulnerability curves, (..., imls)
+    loss : np.ndarray
+        Expected losses, (..., imls)
+    s : np.ndarray
+        IM levels of the hazard curves, (..., points)
+    mafe : np.ndarray
+        MAFE values of the hazard curves, (..., points)
+    rc : float, optional
+        Replacement cost, by default 1.0
+
+    Returns
+    -------
+    np.ndarray
+        EAL as a % of the total replacement cost
+    """
+    s, mafe = np.broadcast_arrays(np.asarray(s, dtype=float),
+                                  np.asarray(mafe, dtype=float))
+
+    # Loss as the ratio of replacement cost, (..., points)
+    mdf = _loss_at(iml, loss, s) / rc
+    mdf, s, mafe = np.broadcast_arrays(mdf, s, mafe)
+
+    non_zero = mafe != 0
+    eal_bins = np.sum(_porter_bins(s, mafe, mdf, non_zero), axis=-1)
+    mafe_last = np.take_along_axis(
+        mafe, _last(non_zero)[..., np.newaxis], axis=-1)[..., 0]
+
+    # EAL ratio in % of the total replacement cost
+    return (eal_bins + mafe_last) * 100
+
+
+def _loss_at(iml: np.ndarray, loss: np.ndarray,
+             s: np.ndarray) -> np.ndarray:
+    """Losses of vulnerability curves at IM levels, linear between the IM
+    levels of the curves, starting from zero loss at zero IM, and the loss
+    at the largest IM level beyond
+
+    Parameters
+    ----------
+    iml : np.ndarray
+        IM levels, (..., imls)
+    loss : np.ndarray
+        Expected losses, (..., imls)
+    s : np.ndarray
+        IM levels to interpolate at, (..., points)
+
+    Returns
+    -------
+    np.ndarray
+        Losses, (..., points)
+    """
+    iml, loss = np.broadcast_arrays(np.asarray(iml, dtype=float),
+                                    np.asarray(loss, dtype=float))
+    order = np.argsort(iml, axis=-1, kind="stable")
+    iml = np.take_along_axis(iml, order, axis=-1)
+    loss = np.take_along_axis(loss, order, axis=-1)
+
+    # Add zeros to beginning of iml and loss
+    zeros = np.zeros(iml.shape[:-1] + (1, ))
+    iml = np.concatenate((zeros, iml), axis=-1)
+    loss = np.concatenate((zeros, loss), axis=-1)
+    n = iml.shape[-1]
+
+    s = np.asarray(s, dtype=float)
+    # Last IM level not above each point, as np.interp
+    lo = np.sum(iml[..., np.newaxis, :] <= s[..., np.newaxis], axis=-1) - 1
+    inside = (lo >= 0) & (s <= iml[..., -1:])
+    lo = np.clip(lo, 0, n - 1)
+    hi = np.minimum(lo + 1, n - 1)
+
+    shape = np.broadcast_shapes(iml.shape[:-1], s.shape[:-1])
+    x0 = np.take_along_axis(np.broadcast_to(iml, shape + (n, )), lo, -1)
+    x1 = np.take_along_axis(np.broadcast_to(iml, shape + (n, )), hi, -1)
+    y0 = np.take_along_axis(np.broadcast_to(loss, shape + (n, )), lo, -1)
+    y1 = np.take_along_axis(np.broadcast_to(loss, shape + (n, )), hi, -1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values = y0 + (y1 - y0) / (x1 - x0) * (s - x0)
+    values = np.where(s == x0, y0, values)
+
+    return np.where(inside, values, loss[..., -1:])
@@ -1,11 +1,16 @@
-from typing import List
+from typing import Callable, Dict, List, Union
 from pathlib import Path
 import pickle
 import openseespy.opensees as op
-import numpy as np
 
 from .solution_algorithm import SolutionAlgorithm, apply_time_series
 from .utilities import append_record, extract_tnodes_bnodes
+from .gm_records import load_record
+from .results_store import ResultsStore
+from .summarizer import summary_path
+from .history_codec import HistoryCodec, check_encoding, \
+    encode_outputs
+from .result_writer import get_writer
 from .mdof2d.model import build_model
 
 
@@ -18,8 +23,6 @@ class MSA:
     g = 9.81
     use_multiprocess = False
 
-    outputs = dict()
-
     def __init__(
         self,
         gm_folder: Path,
@@ -31,6 +34,12 @@ class MSA:
         export_at_each_step: bool = True,
         bnode: List = None,
         tnode: List = None,
+        run_timeout: float = None,
+        step_timeout: float = None,
+        store: ResultsStore = None,
+        summarizer: Callable = None,
+        export_histories: bool = True,
+        encoding: Union[HistoryCodec, Dict[str, HistoryCodec]] = None,
     ) -> None:
         """Multiple Stripe Analysis (MSA)
 
@@ -54,6 +63,27 @@ class MSA:
             If None, will default to ground motion record time step, i.e., dt
         export_at_each_step : bool, optional
             Export time history results at each step of IDA, by default True
+        run_timeout : float, optional
+            Wall-clock budget of a single record in [s], beyond which the
+            analysis is terminated as non-converged, by default None
+        step_timeout : float, optional
+            Wall-clock budget of a single analysis step in [s], beyond which
+            the analysis is terminated as non-converged, by default None
+        store : ResultsStore, optional
+            Results store, where the outputs of each record are appended
+            instead of being exported as separate pickle files,
+            by default None
+        summarizer : Callable, optional
+            Called in the worker with the outputs of each record, returns
+            its summary, e.g. summarizer.summarize, exported as
+            Record{n}.summary.pickle or to the store, by default None
+        export_histories : bool, optional
+            Export the time histories as pickle files, by default True
+            If False, only the summaries are exported
+        encoding : Union[HistoryCodec, Dict[str, HistoryCodec]], optional
+            Encoding of the exported time histories, for all or for each
+            response quantity, see history_codec, by default None
+            Drifts and residuals are not decimated, see check_encoding
         """
         self.gm_folder = gm_folder
         self.output_path = output_path
@@ -62,6 +92,18 @@ class MSA:
         self.dcap = dcap
         self.analysis_time_step = analysis_time_step
         self.export_at_each_step = export_at_each_step
+        self.run_timeout = run_timeout
+        self.step_timeout = step_timeout
+        self.store = store
+        self.summarizer = summarizer
+        self.export_histories = export_histories
+        self.encoding = encoding
+        if encoding is not None:
+            # Fails before the analyses, not in the background writer
+            check_encoding(encoding)
+
+        # Outputs of the analysed records, per batch and record index
+        self.outputs = {}
 
         if tnode is None and bnode is None:
             tnode, bnode = extract_tnodes_bnodes()
@@ -88,6 +130,38 @@ class MSA:
         name, data = batch
         print(f"[START] Running {name} records...")
 
+        # Initialize outputs
+        self.outputs[name] = {}
+
+        # For each record pair, pending writes are flushed also if the
+        # analysis fails
+        try:
+            for rec in range(len(data["X"])):
+                self.analyze_record(name, data, rec)
+        finally:
+            get_writer().flush()
+
+    def analyze_record(self, name: str, data: dict, rec: int):
+        """Performs nonlinear time history analysis for a single record pair
+        of a batch
+
+        Parameters
+        ----------
+        name : str
+            Name of batch
+        data : RecordModel
+            Dictionary of
+                'X': names of records in X direction
+                'Y': names of records in Y direction
+                'dt': time step of records
+        rec : int
+            Index of record pair within the batch
+
+        Returns
+        -------
+        Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+            Accelerations, displacements, drifts and residual drifts
+        """
         # Get the filenames of record pairs and time steps
         names_x = data["X"]
         names_y = data["Y"]
@@ -98,70 +172,100 @@ class MSA:
         accg_y = None
         eq_name_y = None
 
-        # Initialize outputs
-        self.outputs[name] = {}
+        if name not in self.outputs:
+            self.outputs[name] = {}
+
+        if self.use_multiprocess:
+            self.recorder_cache = f"{name}_{rec}.txt"
+
+        # reading records
+        eq_name_x = self.gm_folder / name / names_x[rec]
+        dt = dts[rec]
+        accg_x = load_record(eq_name_x)
+
+        # Second direction
+        if names_y is not None:
+            eq_name_y = self.gm_folder / name / names_y[rec]
+            accg_y = load_record(eq_name_y)
+            # duration, make sure both directions have the same size
+            accg_x, accg_y = append_record(accg_x, accg_y)
+
+        # add extra duration of free vibrations to the records
+        dur = round(self.EXTRA_DUR + dt * len(accg_x), 5)
+
+        # analysis time step
+        if self.analysis_time_step is None:
+            analysis_time_step = dt
+        else:
+            analysis_time_step = self.analysis_time_step
+
+        # Create the model
+        self._call_model()
+
+        # Create the time series
+        apply_time_series(dt, eq_name_x, eq_name_y, self.g, self.g,
+                          self.omegas, self.damping,
+                          self.TSTAGX, self.TSTAGY,
+                          self.PTAGX, self.PTAGY)
+
+        if names_y is None:
+            print(f"[MSA] Record: {rec} - {name}: {names_x[rec]};")
+            directions = 1
+        else:
+            print(
+                f"[MSA] Record: {rec} - {name}: {names_x[rec]} and "
+                f"{names_y[rec]} pair;")
+            directions = 2
+
+        analysis_time_step = min(analysis_time_step, dt)
+        if dt % analysis_time_step != 0:
+            analysis_time_step = dt / (int(dt / analysis_time_step))
+
+        # Commence analysis
+        th = SolutionAlgorithm(
+            self.output_path / name, analysis_time_step, dur, self.dcap,
+            self.bnode, self.tnode,
+            extra_dur=self.EXTRA_DUR,
+            directions=directions,
+            run_timeout=self.run_timeout,
+            step_timeout=self.step_timeout,
+        )
+        # Record specific cache, records of a batch may run concurrently
+        self.outputs[name][rec] = th.solve(rec)
+
+        # Performed and nominal number of analysis steps
+        self.steps = th.steps
+        self.nominal_steps = dur / analysis_time_step
+        # Termination status
+        self.collapse_index = th.collapse_index
+        self.reason = th.reason
+
+        # Peak responses are reduced here, where the histories are in memory
+        summary = None
+        if self.summarizer is not None:
+            summary = dict(self.summarizer(self.outputs[name][rec]),
+                           **{"collapse-index": th.collapse_index,
+                              "reason": th.reason})
+
+        path = self.output_path / name / f"Record{rec + 1}.pickle"
+        if self.store is not None:
+            self.store.append(self.outputs[name][rec], rec, stripe=name,
+                              summary=summary,
+                              collapse_index=th.collapse_index,
+                              reason=th.reason)
+            self.store.flush()
+        elif self.export_at_each_step:
+            # Files are written in the background while the next record
+            # starts
+            writer = get_writer()
+            outputs = self.outputs[name][rec]
+            if self.export_histories or summary is None:
+                writer.submit(path, lambda file: pickle.dump(encode_outputs(
+                    outputs, self.encoding, analysis_time_step), file))
+            if summary is not None:
+                writer.dump(summary_path(path), summary)
+
+        # Wipe the model
+        op.wipe()
 
-        # For each record pair
-        for rec in range(len(names_x)):
-            if self.use_multiprocess:
-                self.recorder_cache = f"{name}_{rec}.txt"
-
-            # reading records
-            eq_name_x = self.gm_folder / name / names_x[rec]
-            dt = dts[rec]
-            accg_x = np.loadtxt(eq_name_x)
-
-            # Second direction
-            if names_y is not None:
-                eq_name_y = self.gm_folder / name / names_y[rec]
-                accg_y = np.loadtxt(eq_name_y)
-                # duration, make sure both directions have the same size
-                accg_x, accg_y = append_record(accg_x, accg_y)
-
-            # add extra duration of free vibrations to the records
-            dur = round(self.EXTRA_DUR + dt * len(accg_x), 5)
-
-            # analysis time step
-            if self.analysis_time_step is None:
-                analysis_time_step = dt
-            else:
-                analysis_time_step = self.analysis_time_step
-
-            # Create the model
-            self._call_model()
-
-            # Create the time series
-            apply_time_series(dt, eq_name_x, eq_name_y, self.g, self.g,
-                              self.omegas, self.damping,
-                              self.TSTAGX, self.TSTAGY,
-                              self.PTAGX, self.PTAGY)
-
-            if names_y is None:
-                print(f"[MSA] Record: {rec} - {name}: {names_x[rec]};")
-                directions = 1
-            else:
-                print(
-                    f"[MSA] Record: {rec} - {name}: {names_x[rec]} and "
-                    f"{names_y[rec]} pair;")
-                directions = 2
-
-            analysis_time_step = min(analysis_time_step, dt)
-            if dt % analysis_time_step != 0:
-                analysis_time_step = dt / (int(dt / analysis_time_step))
-
-            # Commence analysis
-            th = SolutionAlgorithm(
-                self.output_path / name, analysis_time_step, dur, self.dcap,
-                self.bnode, self.tnode,
-                extra_dur=self.EXTRA_DUR,
-                directions=directions
-            )
-            self.outputs[name][rec] = th.solve()
-
-            if self.export_at_each_step:
-                with open(self.output_path / name / f"Record{rec + 1}.pickle",
-                          "wb") as handle:
-                    pickle.dump(self.outputs[name][rec], handle)
-
-            # Wipe the model
-            op.wipe()
+        return self.outputs[name][rec]
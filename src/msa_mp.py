@@ -1,7 +1,15 @@
-from typing import Union, List
+from typing import Callable, Dict, Union, List
 from pathlib import Path
+import pickle
+import time
 import multiprocessing as mp
 from .msa import MSA
+from .results_store import ResultsStore
+from .summarizer import failure, performed, status, summary_path
+from .history_codec import HistoryCodec, load_outputs
+from .scheduler import Journal, TaskScheduler, count_points
+from .worker_pool import WorkerPool
+from .mdof2d.model import build_model
 
 
 class MSA_MP:
@@ -19,6 +27,12 @@ class MSA_MP:
         omegas=None,
         bnode=None,
         tnode=None,
+        run_timeout=None,
+        step_timeout=None,
+        store: ResultsStore = None,
+        summarizer: Callable = None,
+        export_histories: bool = True,
+        encoding: Union[HistoryCodec, Dict[str, HistoryCodec]] = None,
     ) -> None:
         self.analysis_options = analysis_options
         self.export_dir = export_dir
@@ -32,25 +46,163 @@ class MSA_MP:
         self.omegas = omegas
         self.bnode = bnode
         self.tnode = tnode
+        self.run_timeout = run_timeout
+        self.step_timeout = step_timeout
+        self.store = store
+        self.summarizer = summarizer
+        self.export_histories = export_histories
+        self.encoding = encoding
 
-    def start(self, records, workers=0):
+        # Outputs assembled per batch once all records are analysed
+        self.outputs = {}
+
+    def start(self, records, workers=0, max_memory=None):
         """
         Start the parallel computation
+        Each (batch, record pair) is a separate task, tasks are dispatched
+        longest first to a shared pool of persistent workers
         :param records: dict
         :param workers: int
-        :return: None
+        :param max_memory: float, resident memory of a worker in [MB]
+        beyond which it is recycled
+        Workers exceeding run_timeout or step_timeout are terminated and the
+        record is journaled as non-converged
+        :return: dict, outputs per batch and record index
         """
-        # Get number of CPUs available
-        if workers == 0:
+        n_tasks = sum(len(data["X"]) for data in records.values())
+
+        # Get number of CPUs available, there is no use for more workers
+        # than tasks
+        if workers <= 0:
             workers = mp.cpu_count()
-        if workers > 0:
-            workers = workers + 1
+        workers = max(1, min(workers, n_tasks))
+
+        journal = Journal(self.export_dir)
+        scheduler = TaskScheduler(
+            journal, self.analysis_time_step, MSA.EXTRA_DUR)
+
+        for name, data in records.items():
+            for rec, name_x in enumerate(data["X"]):
+                npts = count_points(Path(self.gm_folder) / name / name_x)
+                scheduler.add(f"{name}/{name_x}", (name, rec, data), npts,
+                              data["dt"][rec])
+
+        with WorkerPool(self.run_record, workers, initargs=(build_model,),
+                        max_memory=max_memory,
+                        run_timeout=self.run_timeout,
+                        step_timeout=self.step_timeout,
+                        on_timeout=self.record_timeout) as pool:
+            for entry in pool.imap(scheduler.order()):
+                journal.append([entry])
+                if entry["collapse-index"] != -1:
+                    print(f"[SUCCESS] {entry['key']}")
+
+        return self.assemble(records)
+
+    def assemble(self, records):
+        """
+        Assembles the outputs of each batch from the record files written
+        by the workers
+        :param records: dict
+        :return: dict, outputs per batch and record index, summaries where
+        the histories were not exported or the store is used, records that
+        were not completed are missing, records terminated by the watchdog
+        have the summary of summarizer.failure
+        """
+        if self.store is not None:
+            # Chunks were flushed by the workers
+            self.store.refresh()
+
+        for name, data in records.items():
+            self.outputs[name] = {}
+            if self.store is not None:
+                self.outputs[name] = self.store.as_dict(
+                    name, summaries=True).get(name, {})
+            else:
+                for rec in range(len(data["X"])):
+                    path = Path(self.export_dir) / name / \
+                        f"Record{rec + 1}.pickle"
+                    if not path.exists():
+                        # Histories were not exported
+                        path = summary_path(path)
+                    if not path.exists():
+                        print(f"[WARNING] Record: {rec} - {name} has no "
+                              f"outputs")
+                        continue
+                    self.outputs[name][rec] = load_outputs(path)
+
+            for rec, outputs in self.outputs[name].items():
+                if not performed(outputs):
+                    print(f"[WARNING] Record: {rec} - {name} terminated "
+                          f"without outputs ({status(outputs)[1]})")
+
+        return self.outputs
+
+    def run_record(self, task):
+        """Runs a single record pair of a batch
+        :param task: Tuple[str, int, dict]
+        :return: dict, journal entry of the task
+        """
+        name, rec, data = task
+        start = time.perf_counter()
+
+        msa = MSA(
+            self.gm_folder,
+            self.export_dir,
+            self.damping,
+            self.omegas,
+            self.dcap,
+            analysis_time_step=self.analysis_time_step,
+            bnode=self.bnode,
+            tnode=self.tnode,
+            run_timeout=self.run_timeout,
+            step_timeout=self.step_timeout,
+            store=self.store,
+            summarizer=self.summarizer,
+            export_histories=self.export_histories,
+            encoding=self.encoding,
+        )
+        msa.use_multiprocess = True
+
+        # Outputs are written to file, only the journal entry is returned
+        msa.analyze_record(name, data, rec)
+
+        return {
+            "key": f"{name}/{data['X'][rec]}",
+            "wall-time": time.perf_counter() - start,
+            "steps": msa.steps,
+            "nominal-steps": msa.nominal_steps,
+            "collapse-index": msa.collapse_index,
+            "reason": msa.reason,
+        }
+
+    def record_timeout(self, task, reason, wall_time):
+        """
+        Journal entry of a record pair, whose worker was terminated by the
+        watchdog, the record is recorded as non-converged, see
+        summarizer.failure
+        :param task: Tuple[str, int, dict]
+        :param reason: str
+        :param wall_time: float, time in [s] before the termination
+        :return: dict, journal entry of the task
+        """
+        name, rec, data = task
+        print(f"[FAILURE] Record: {rec} - {name} terminated ({reason})")
 
-        with mp.Pool(workers - 1, maxtasksperchild=1) as pool:
-            outputs = pool.imap(self.run_msa, list(records.items()))
+        if self.store is not None:
+            self.store.append_failure(rec, stripe=name, reason=reason)
+            self.store.flush()
+        else:
+            path = Path(self.export_dir) / name / f"Record{rec + 1}.pickle"
+            with open(summary_path(path), "wb") as file:
+                pickle.dump(failure(reason), file)
 
-            for _ in outputs:
-                print("[SUCCESS]")
+        return {
+            "key": f"{name}/{data['X'][rec]}",
+            "wall-time": wall_time,
+            "collapse-index": -1,
+            "reason": reason,
+        }
 
     def run_msa(self, batch):
 
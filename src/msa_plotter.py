@@ -1,6 +1,7 @@
 import numpy as np
 import matplotlib.pyplot as plt
 from .plot_styles import *
+from .edp_array import EDPArray
 
 
 class MSAPlotter:
@@ -8,6 +9,9 @@ class MSAPlotter:
         self.out = out
 
     def get_return_periods(self):
+        if isinstance(self.out, EDPArray):
+            return sorted(self.out.return_periods)
+
         rp = []
         for period in self.out.keys():
             rp.append(int(period))
@@ -16,6 +20,10 @@ class MSAPlotter:
         return rp
 
     def get_edp(self, direction, storey, edptype, rps, factor=1.0):
+        if isinstance(self.out, EDPArray):
+            return self._get_edp_array(direction, storey, edptype, rps,
+                                       factor)
+
         edptype = edptype.lower()
         edp = []
         # For each return period
@@ -32,20 +40,36 @@ class MSAPlotter:
             else:
                 # acc
                 try:
-                    critical = np.array(max(
+                    critical = np.maximum(
                         self.out[rp][str(1)][edptype][str(storey)],
-                        self.out[rp][str(2)][edptype][str(storey)])) \
+                        self.out[rp][str(2)][edptype][str(storey)]) \
                         * factor
                 except KeyError:
-                    critical = np.array(max(
+                    critical = np.maximum(
                         self.out[rp][str(1)]["PFA"][str(storey)],
-                        self.out[rp][str(2)]["PFA"][str(storey)])) \
+                        self.out[rp][str(2)]["PFA"][str(storey)]) \
                         * factor
 
                 edp.append(list(critical))
 
         return edp
 
+    def _get_edp_array(self, direction, storey, edptype, rps, factor=1.0):
+        edptype = edptype.lower()
+        rows = [self.out.return_periods.index(int(rp)) for rp in rps]
+
+        if edptype == "drift" or edptype == "psd":
+            idx = self.out.index("PSD", storey)
+            values = self.out.direction(direction)[rows, :, idx]
+        else:
+            # acc, critical of both directions
+            idx = self.out.index("PFA", storey)
+            values = np.maximum(
+                self.out.direction(1)[rows, :, idx],
+                self.out.direction(2)[rows, :, idx]) * factor
+
+        return values.tolist()
+
     def plot_vs_rp(self, edp, rp, xlabel=None, ylabel=None,
                    xlimit=None, ylimit=None):
         def median(lst):
@@ -1,28 +1,106 @@
 import os
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
-from typing import List
+from typing import Any, Callable, Dict, List, Tuple, Union
 import numpy as np
 
 from .hazard import Hazard, analytical_mafe
+from .history_codec import load_outputs
+from .results_store import ResultsStore
+from .summarizer import SUFFIX, EDPS, performed, residual_drift, status, \
+    summarize
 from .utilities import read_pickle
 
 
 class MSAPostprocessor:
-    def __init__(self, msa: Path) -> None:
+    # Persisted peak responses of the records processed so far
+    SUMMARY = "summary.pickle"
+
+    def __init__(self, msa: Union[Path, ResultsStore]) -> None:
         """MSA postprocessor
 
         Parameters
         ----------
-        msa : Path
-            Directory containing MSA outputs
+        msa : Union[Path, ResultsStore]
+            Directory containing MSA outputs, or results store
             It must not include any subdirectories other than pertinent to
             MSA outputs
         """
+        if not isinstance(msa, ResultsStore) and \
+                (msa / ResultsStore.MANIFEST).exists():
+            msa = ResultsStore(msa)
         self.msa = msa
+        # Summary changed since it was loaded
+        self._updated = False
+        # Termination status of the records with a recorded status, set by
+        # postprocess, {level: {record: {'collapse-index', 'reason'}}}
+        self.status = {}
 
     def _get_ground_motion_batches(self):
+        if isinstance(self.msa, ResultsStore):
+            return self.msa.stripes()
         return next(os.walk(self.msa))[1]
 
+    def _level_sources(self, level: str) -> List[Tuple[str, Any, Callable]]:
+        """Records of a level of excitation
+
+        Returns
+        -------
+        List[Tuple[str, Any, Callable]]
+            Key, signature that changes when the record outputs are
+            rewritten, and loader of the outputs of each record
+        """
+        if isinstance(self.msa, ResultsStore):
+            # Summaries are read instead of the histories
+            return [
+                (f"{level}/{entry['record']}",
+                 (entry["segment"], entry["line"]),
+                 partial(self.msa.summary, entry) if "summary" in entry
+                 else partial(self.msa.read, entry))
+                for entry in self.msa.entries(stripe=level)
+            ]
+
+        # Summaries exported by the workers are read instead of the histories
+        paths = {}
+        for record in next(os.walk(self.msa / level))[-1]:
+            if record.endswith(SUFFIX):
+                paths[record[:-len(SUFFIX)] + ".pickle"] = record
+            else:
+                paths.setdefault(record, record)
+
+        sources = []
+        for record, filename in paths.items():
+            path = self.msa / level / filename
+            stat = path.stat()
+            sources.append((f"{level}/{record}",
+                            (filename, stat.st_size, stat.st_mtime_ns),
+                            partial(load_outputs, path)))
+        return sources
+
+    def _summary_path(self) -> Path:
+        if isinstance(self.msa, ResultsStore):
+            return self.msa.directory / self.SUMMARY
+        return self.msa / self.SUMMARY
+
+    def _load_summary(self) -> Dict:
+        path = self._summary_path()
+        if not path.exists():
+            return {}
+        try:
+            return read_pickle(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            # Summary is a cache, it is rebuilt if unreadable
+            return {}
+
+    def _save_summary(self, summary: Dict) -> None:
+        path = self._summary_path()
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as handle:
+            pickle.dump(summary, handle)
+        os.replace(tmp, path)
+
     def _get_rp_im(self, level, idx, rps, imls, coefs, hazard):
         im, rp = None, None
 
@@ -36,7 +114,7 @@ class MSAPostprocessor:
             coefs2 = coefs[2]
 
         if im is None:
-            im = Hazard.get_im(1 / rp, coefs[0], coefs[1], coefs2)
+            im = Hazard().get_im(1 / rp, coefs[0], coefs[1], coefs2)
 
         if rps is None:
             # infer from level
@@ -78,7 +156,7 @@ class MSAPostprocessor:
     def postprocess(
             self, nst: int, imls: List[float] = None,
             return_periods: List[float] = None, coefs: List[float] = None,
-            hazard=None, n_dir=2) -> dict:
+            hazard=None, n_dir=2, workers: int = None) -> dict:
         """Postprocess MSA outputs
 
         Parameters
@@ -96,6 +174,12 @@ class MSAPostprocessor:
             SAC/FEMA-compatible hazard fitting coefficients, by default None
         fitted_hazard : HazardModelSchema, optional
             Fitted hazard function using Hazard module
+        n_dir : int, optional
+            Number of directions, by default 2
+        workers : int, optional
+            Number of threads reading the records, by default None
+            Peak responses of the records are persisted in SUMMARY, only
+            records added or rewritten since the last call are read
 
         Raises
         -------
@@ -105,6 +189,9 @@ class MSAPostprocessor:
             Must provide either of: hazard, imls if any of return_periods or
             imls is None
 
+        Termination statuses recorded with the records are set in status,
+        records terminated without outputs are skipped.
+
         Returns
         -------
         dict
@@ -135,6 +222,10 @@ class MSAPostprocessor:
 
         # gm_levels = self._get_ground_motion_batches()
 
+        summary = self._load_summary()
+        self._updated = False
+        self.status = {}
+
         # outputs
         out = {}
 
@@ -198,90 +289,142 @@ class MSAPostprocessor:
 
             print(f"[LEVEL] {level}, Return period {rp} years")
 
-            # for each record level
-            for record in next(os.walk(self.msa / level))[-1]:
-                """
-                0 - accelerations [g], 1 - displacements [m], 2 - drifts
-                each has a shape of d x s x r, where
-                    d stands for number of directions
-                    s stands for number of storeys and floors
-                    r stands for number of steps of the record
-                """
-                data = read_pickle(self.msa / level / record)
-
-                # SRSS
-                if n_dir == 2:
-                    pfa = (data[0][0]**2 + data[0][1]**2)**0.5
-                    disp = (data[1][0]**2 + data[1][1]**2)**0.5
-                    psd = (data[2][0]**2 + data[2][1]**2)**0.5
-
-                    res_drift_global = 0
-                    for st in range(nst + 1):
-                        out[level]['SRSS']["PFA"][st].append(np.amax(pfa[st]))
-                        out[level]['SRSS']["disp"][st].append(
-                            np.amax(disp[st]))
-                        if st != nst:
-                            out[level]['SRSS']["PSD"][st + 1].append(
-                                np.amax(psd[st]))
-
-                            res_drift_val = (
-                                self._compute_residual_drift(
-                                    abs(data[3][0][st]),
-                                    abs(data[2][0][st]))**2 +
-                                self._compute_residual_drift(
-                                    abs(data[3][1][st]),
-                                    abs(data[2][1][st]))**2
-                            )**0.5
-                            if res_drift_val > res_drift_global:
-                                res_drift_global = res_drift_val
-
-                            out[level]['SRSS']["RPSD"][st + 1].append(
-                                res_drift_val)
-
-                    out[level]['SRSS']["PFA"]["global"].append(np.amax(pfa))
-                    out[level]['SRSS']["disp"]["global"].append(np.amax(disp))
-                    out[level]['SRSS']["PSD"]["global"].append(np.amax(psd))
-                    out[level]['SRSS']["RPSD"]["global"].append(
-                        res_drift_global)
+            # Peak responses of each record
+            records = self._summarize_level(
+                level, nst, n_dir, summary, workers)
+
+            for key, (record, (collapse_index, reason)) in records.items():
+                if collapse_index is not None:
+                    self.status.setdefault(level, {})[key] = {
+                        "collapse-index": collapse_index, "reason": reason}
+                if record is None:
+                    print(f"[WARNING] Record: {key} terminated without "
+                          f"outputs ({reason})")
+                    continue
+
+                for key, edps in record.items():
+                    for edp in ["PFA", "disp", "PSD", "RPSD"]:
+                        # Floors start from 0, storeys from 1
+                        first = 0 if edp in ["PFA", "disp"] else 1
+                        for st, val in enumerate(edps[edp]):
+                            out[level][key][edp][st + first].append(val)
+                        out[level][key][edp]["global"].append(
+                            edps["global"][edp])
+
+        if self._updated:
+            self._save_summary(summary)
 
-                for d in range(n_dir):
-                    res_drift_global = 0
+        return out
 
-                    for st in range(nst + 1):
-                        out[level][str(d + 1)][
-                            "PFA"][st].append(np.amax(abs(data[0][d][st])))
-                        out[level][str(d + 1)][
-                            "disp"][st].append(np.amax(abs(data[1][d][st])))
-                        if st != nst:
-                            out[level][str(d + 1)]["PSD"][
-                                st + 1].append(np.amax(abs(data[2][d][st])))
-
-                            res_drift_val = self._compute_residual_drift(
-                                abs(data[3][d][st]),
-                                abs(data[2][d][st])
-                            )
-                            if res_drift_val > res_drift_global:
-                                res_drift_global = res_drift_val
-
-                            out[level][str(
-                                d + 1)]["RPSD"][st + 1].append(res_drift_val)
-
-                    out[level][str(d + 1)][
-                        "PFA"]["global"].append(np.amax(abs(data[0][d])))
-                    out[level][str(d + 1)][
-                        "disp"]["global"].append(np.amax(abs(data[1][d])))
-                    out[level][str(d + 1)][
-                        "PSD"]["global"].append(np.amax(abs(data[2][d])))
-                    out[level][str(d + 1)
-                               ]["RPSD"]["global"].append(res_drift_global)
+    def _summarize_level(
+        self, level: str, nst: int, n_dir: int, summary: Dict,
+        workers: int = None,
+    ) -> Dict[str, Tuple[Dict, Tuple[int, str]]]:
+        """Peak responses of the records of a level of excitation, records
+        not found in the summary are read in parallel
 
-        return out
+        Returns
+        -------
+        Dict[str, Tuple[Dict, Tuple[int, str]]]
+            Peak responses of each record, see _summarize, None for records
+            terminated without outputs, and termination status, see
+            summarizer.status, by record key
+        """
+        sources = self._level_sources(level)
+
+        # Peak responses depend on the number of storeys and directions
+        sources = [((key, nst, n_dir), signature, loader)
+                   for key, signature, loader in sources]
+        pending = [
+            (key, signature, loader) for key, signature, loader in sources
+            if summary.get(key, {}).get("signature") != signature
+        ]
+
+        if pending:
+            print(f"[LEVEL] {level}, reading {len(pending)} of "
+                  f"{len(sources)} records")
+
+            def summarize(loader):
+                data = loader()
+                edps = self._summarize(data, nst, n_dir) \
+                    if performed(data) else None
+                return edps, status(data)
+
+            with ThreadPoolExecutor(workers) as executor:
+                records = executor.map(
+                    summarize, [loader for _, _, loader in pending])
+                for (key, signature, _), (edps, record_status) in zip(
+                        pending, records):
+                    summary[key] = {"signature": signature, "edps": edps,
+                                    "status": record_status}
+            self._updated = True
+
+        return {key[0]: (summary[key]["edps"],
+                         summary[key].get("status", (None, None)))
+                for key, _, _ in sources}
+
+    def _summarize(self, data, nst: int, n_dir: int) -> Dict:
+        """Peak responses of a record
 
-    def _compute_residual_drift(self, res, drift):
+        Parameters
+        ----------
+        data : Union[Tuple[np.ndarray, ...], Dict]
+            0 - accelerations [g], 1 - displacements [m], 2 - drifts,
+            3 - residual drifts
+            each has a shape of d x s x r, where
+                d stands for number of directions
+                s stands for number of storeys and floors
+                r stands for number of steps of the record
+            or its summary, see summarizer.summarize
+        nst : int
+            Number of storeys
+        n_dir : int
+            Number of directions
+
+        Returns
+        -------
+        Dict
+            For each direction ('1', '2') and 'SRSS' if n_dir is 2
+            {
+                'PFA': np.ndarray,      peak at each floor
+                'disp': np.ndarray,     peak at each floor
+                'PSD': np.ndarray,      peak at each storey
+                'RPSD': np.ndarray,     residual at each storey
+                'global': {'PFA': float, 'disp': float, 'PSD': float,
+                           'RPSD': float}
+            }
+        """
+        if not isinstance(data, dict):
+            data = summarize(data)
+
+        edps = {}
+
+        if n_dir == 2:
+            edps["SRSS"] = self._peaks(data["SRSS"], nst)
+
+        for d in range(n_dir):
+            edps[str(d + 1)] = self._peaks(
+                {edp: data[edp][d] for edp in EDPS}, nst)
 
-        if len(res) > 1:
-            val = float(sum(res[1:]) / len(res[1:]))
-        else:
-            val = float(drift[-1])
+        return edps
 
-        return val
+    @staticmethod
+    def _peaks(summary, nst):
+        rpsd = summary["RPSD"][:nst]
+        return {
+            "PFA": summary["PFA"][:nst + 1],
+            "disp": summary["disp"][:nst + 1],
+            "PSD": summary["PSD"][:nst],
+            "RPSD": rpsd,
+            "global": {
+                "PFA": np.amax(summary["PFA"]),
+                "disp": np.amax(summary["disp"]),
+                "PSD": np.amax(summary["PSD"]),
+                "RPSD": np.amax(rpsd, initial=0),
+            },
+        }
+
+    def _compute_residual_drift(self, res, drift):
+        """Residual drifts, see summarizer.residual_drift
+        """
+        return residual_drift(res, drift)
@@ -0,0 +1,160 @@
+import atexit
+import os
+import pickle
+import queue
+import threading
+from pathlib import Path
+from typing import Any, Callable
+
+import numpy as np
+
+from .results_store import _atomic_write
+
+
+class ResultWriter:
+    def __init__(self, max_pending: int = 8) -> None:
+        """Background writer of analysis results
+
+        Writes are queued and performed by a single thread, so that the
+        next analysis starts while the results of the previous one are
+        written. Each file is written through a temporary file that is
+        renamed into place once complete. A pending write is skipped when a
+        newer write to the same path is queued, e.g. IM.csv rewritten after
+        each IDA run.
+
+        Parameters
+        ----------
+        max_pending : int, optional
+            Maximum number of queued writes, further writes block until the
+            queue drains, bounding the memory held by pending results,
+            by default 8
+        """
+        self.max_pending = max_pending
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._latest = {}
+        self._lock = threading.Lock()
+        self._error = None
+        self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+
+                path, write, seq = item
+                with self._lock:
+                    superseded = self._latest.get(path) != seq
+                if not superseded:
+                    _atomic_write(path, write)
+            except Exception as error:
+                # Raised in the analysis thread on the next call, further
+                # writes are still performed
+                if self._error is None:
+                    self._error = error
+            finally:
+                self._queue.task_done()
+
+    def _raise(self) -> None:
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError(
+                "[EXCEPTION] Background write failed") from error
+
+    def submit(self, path: Path, write: Callable) -> None:
+        """Queues a write
+
+        Parameters
+        ----------
+        path : Path
+            Destination path
+        write : Callable
+            Called with the open binary file handle, must not depend on
+            state modified after submission
+        """
+        self._raise()
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+        path = Path(path)
+        with self._lock:
+            seq = self._latest.get(path, 0) + 1
+            self._latest[path] = seq
+        self._queue.put((path, write, seq))
+
+    def dump(self, path: Path, data: Any) -> None:
+        """Queues a pickle file
+        """
+        self.submit(path, lambda file: pickle.dump(data, file))
+
+    def savetxt(self, path: Path, array: np.ndarray, **kwargs) -> None:
+        """Queues a text file of an array, see np.savetxt, the array is
+        copied
+        """
+        array = np.array(array)
+        self.submit(path, lambda file: np.savetxt(file, array, **kwargs))
+
+    def flush(self) -> None:
+        """Waits for the queued writes to complete
+
+        Raises
+        ------
+        RuntimeError
+            If a write failed
+        """
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.join()
+        with self._lock:
+            self._latest = {}
+        self._raise()
+
+    def close(self) -> None:
+        """Flushes and stops the writer thread
+        """
+        try:
+            self.flush()
+        finally:
+            if self._thread is not None and self._thread.is_alive():
+                self._queue.put(None)
+                self._thread.join()
+            self._thread = None
+
+
+# Writer of the current process, see get_writer
+_WRITER = None
+_WRITER_PID = None
+
+
+def get_writer() -> ResultWriter:
+    """Writer of the current process, created on first use. Workers get
+    their own writer, threads are not inherited by forked processes.
+    """
+    global _WRITER, _WRITER_PID
+    if _WRITER is None or _WRITER_PID != os.getpid():
+        _WRITER = ResultWriter()
+        _WRITER_PID = os.getpid()
+        atexit.register(_WRITER.close)
+    return _WRITER
+
+
+def close_writer() -> None:
+    """Flushes and stops the writer of the current process, if any
+    """
+    global _WRITER
+    if _WRITER is not None and _WRITER_PID == os.getpid():
+        writer, _WRITER = _WRITER, None
+        writer.close()
+
+
+def flush_writer() -> None:
+    """Waits for the queued writes of the current process, if any
+
+    Raises
+    ------
+    RuntimeError
+        If a write failed
+    """
+    if _WRITER is not None and _WRITER_PID == os.getpid():
+        _WRITER.flush()
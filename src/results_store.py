@@ -0,0 +1,667 @@
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
+
+import numpy as np
+
+from .summarizer import failure, summarize
+
+
+# Response variables of a nonlinear time history analysis, in the order of
+# the outputs of SolutionAlgorithm.solve
+VARIABLES = ("accelerations", "displacements", "drifts", "residuals")
+
+# Key of the references to arrays in the data file of a segment
+_REF = "__offset__"
+# Values are stored in the data files as little-endian float64
+_DTYPE = np.dtype("<f8")
+
+
+def _atomic_write(path: Path, write) -> None:
+    """Writes a file through a temporary file in the same directory, which
+    is renamed into place, readers never see a partially written file
+
+    Parameters
+    ----------
+    path : Path
+        Destination path
+    write : Callable
+        Called with the open binary file handle
+    """
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as file:
+        write(file)
+    os.replace(tmp, path)
+
+
+def _peak(history: np.ndarray) -> np.ndarray:
+    """Peak absolute values over the steps of a history
+    """
+    history = np.asarray(history, dtype=float)
+    if history.shape[-1] == 0:
+        return np.full(history.shape[:-1], np.nan)
+    return np.amax(np.abs(history), axis=-1)
+
+
+def _pack(data, arrays: List[np.ndarray], offset: int):
+    """Replaces the arrays and numeric lists of nested data by references
+    to the data file, the arrays are appended to arrays
+
+    Parameters
+    ----------
+    data : any
+        Data, e.g. a summary
+    arrays : List[np.ndarray]
+        Arrays to be written, updated in place
+    offset : int
+        Offset in values of the first array to be written
+
+    Returns
+    -------
+    Tuple[any, int]
+        JSON serializable layout of the data, offset after the arrays
+    """
+    if isinstance(data, dict):
+        layout = {}
+        for key, value in data.items():
+            layout[key], offset = _pack(value, arrays, offset)
+        return layout, offset
+
+    if isinstance(data, (np.ndarray, list, tuple)):
+        try:
+            array = np.asarray(data, dtype=_DTYPE)
+        except (TypeError, ValueError):
+            # Non-numeric or ragged lists are kept in the index
+            items = []
+            for item in data:
+                item, offset = _pack(item, arrays, offset)
+                items.append(item)
+            return items, offset
+        arrays.append(array.ravel())
+        return {_REF: offset, "shape": list(array.shape)}, \
+            offset + array.size
+
+    if isinstance(data, np.generic):
+        return data.item(), offset
+    return data, offset
+
+
+def _unpack(layout, data: np.ndarray, copy: bool = False):
+    """Resolves the references of _pack against the data file of a segment,
+    arrays are views of the memory map unless copied
+    """
+    if isinstance(layout, list):
+        return [_unpack(item, data, copy) for item in layout]
+    if not isinstance(layout, dict):
+        return layout
+    if _REF not in layout:
+        return {key: _unpack(value, data, copy)
+                for key, value in layout.items()}
+
+    offset, shape = layout[_REF], layout["shape"]
+    array = data[offset:offset + int(np.prod(shape))].reshape(shape)
+    return np.array(array) if copy else array
+
+
+class ResultsStore:
+    MANIFEST = "manifest.json"
+    SEGMENTS = "segments"
+    VERSION = 2
+
+    def __init__(
+        self,
+        directory: Union[Path, str],
+        histories: bool = False,
+        max_buffer: float = 64.,
+    ) -> None:
+        """Columnar store of analysis results of a campaign (IDA or MSA)
+
+        Each run is indexed by record, IDA run or MSA stripe, and its arrays
+        by (direction, storey or floor). Peak absolute values of each
+        variable and the summary of each run, from which the postprocessors
+        read, are always stored, time histories only if requested.
+
+        Each writing process appends to its own segment, i.e. a data file of
+        the arrays and an index of one JSON line per run, so that many
+        workers append concurrently without coordination and the number of
+        files does not grow with the number of records. A run is indexed
+        once its arrays are written. Segments are numbered in the order they
+        are created, a run appended again in a later segment overrides
+        earlier ones. compact() merges the segments into one. Arrays are
+        read memory-mapped, only the accessed runs are loaded.
+
+        Parameters
+        ----------
+        directory : Union[Path, str]
+            Directory of the store, created if missing
+        histories : bool, optional
+            Store time histories in addition to peak values, by default
+            False. Ignored if the store already exists, the setting of its
+            manifest is used.
+        max_buffer : float, optional
+            Size of the buffered runs in [MB], beyond which they are flushed
+            when appending, by default 64.
+        """
+        self.directory = Path(directory)
+        self.histories = histories
+        self.max_buffer = max_buffer
+
+        path = self.directory / self.MANIFEST
+        if path.exists():
+            with open(path, "r") as file:
+                manifest = json.load(file)
+            if manifest.get("version") != self.VERSION:
+                raise ValueError(
+                    f"[EXCEPTION] Results store version "
+                    f"{manifest.get('version')} is not supported")
+            self.histories = manifest["histories"]
+        else:
+            (self.directory / self.SEGMENTS).mkdir(
+                parents=True, exist_ok=True)
+            manifest = {
+                "version": self.VERSION,
+                "variables": list(VARIABLES),
+                "histories": self.histories,
+            }
+            _atomic_write(path, lambda file: file.write(
+                json.dumps(manifest, indent=2).encode()))
+
+        self._buffer = []
+        self._buffered = 0
+        # Segment written by the current process
+        self._segment = None
+        self._segment_pid = None
+        self._index = None
+        # Index entries grouped by record, see _load_index
+        self._by_record = None
+        self._arrays = {}
+
+    def __getstate__(self) -> dict:
+        # Memory maps and cached index are not sent to workers, workers
+        # write to their own segments
+        state = self.__dict__.copy()
+        state["_index"] = None
+        state["_by_record"] = None
+        state["_arrays"] = {}
+        state["_segment"] = None
+        state["_segment_pid"] = None
+        return state
+
+    def _segments(self) -> List[Path]:
+        """Indices of the segments, in the order they were created
+        """
+        return sorted((self.directory / self.SEGMENTS).glob("*.jsonl"),
+                      key=lambda path: int(path.stem))
+
+    def _new_segment(self) -> str:
+        """Creates the index of a new segment, numbered after the existing
+        ones, the number is reserved by the exclusive creation of the file
+        """
+        segments = self._segments()
+        number = int(segments[-1].stem) + 1 if segments else 1
+        while True:
+            path = self.directory / self.SEGMENTS / f"{number:08d}.jsonl"
+            try:
+                os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return path.stem
+            except FileExistsError:
+                number += 1
+
+    def _segment_path(self, segment: str, suffix: str) -> Path:
+        return self.directory / self.SEGMENTS / f"{segment}{suffix}"
+
+    def append(
+        self,
+        outputs: Tuple[np.ndarray, ...],
+        record: int,
+        run: int = None,
+        stripe: str = None,
+        im: float = None,
+        summary: Dict = None,
+        idxres: int = None,
+        collapse_index: int = None,
+        reason: str = None,
+    ) -> None:
+        """Buffers the outputs of a run, see flush()
+
+        Parameters
+        ----------
+        outputs : Tuple[np.ndarray, ...]
+            Accelerations, displacements, drifts and residuals, each of shape
+            (directions, storeys or floors, steps), further items are ignored
+        record : int
+            Record index
+        run : int, optional
+            IDA run, by default None
+        stripe : str, optional
+            MSA stripe, i.e. batch name, by default None
+        im : float, optional
+            Intensity measure level of the run, by default None
+        summary : Dict, optional
+            Summary of the run, see summarizer.summarize, by default None,
+            i.e. summarized here
+        idxres : int, optional
+            Step at which the free vibration phase starts, used to summarize
+            the run, required by IDAPostprocessor, by default None
+        collapse_index : int, optional
+            Termination status of the run, see SolutionAlgorithm, stored in
+            the entry and the summary, by default None
+        reason : str, optional
+            Reason of the termination, by default None
+        """
+        histories = [np.asarray(outputs[i]) for i in range(len(VARIABLES))]
+
+        entry = self._entry(record, run, stripe, im, collapse_index, reason)
+        if summary is None:
+            summary = summarize(outputs, idxres)
+        if collapse_index is not None:
+            summary = dict(summary, **{"collapse-index": int(collapse_index),
+                                       "reason": reason})
+
+        arrays = {
+            "peaks": {variable: _peak(history)
+                      for variable, history in zip(VARIABLES, histories)},
+            "histories": {},
+            "summary": summary,
+        }
+        if self.histories:
+            arrays["histories"] = dict(zip(VARIABLES, histories))
+        self._buffer.append((entry, arrays))
+
+        self._buffered += sum(history.nbytes for history in histories)
+        if self._buffered > self.max_buffer * 1024 ** 2:
+            self.flush()
+
+    def append_failure(
+        self,
+        record: int,
+        run: int = None,
+        stripe: str = None,
+        reason: str = None,
+        im: float = None,
+    ) -> None:
+        """Buffers a run terminated without outputs, e.g. by the watchdog of
+        WorkerPool, as non-converged, see summarizer.failure
+
+        Parameters
+        ----------
+        record : int
+            Record index
+        run : int, optional
+            IDA run, by default None
+        stripe : str, optional
+            MSA stripe, i.e. batch name, by default None
+        reason : str, optional
+            Reason of the termination, by default None
+        im : float, optional
+            Intensity measure level of the run, by default None
+        """
+        entry = self._entry(record, run, stripe, im, -1, reason)
+        self._buffer.append((entry, {
+            "peaks": {}, "histories": {}, "summary": failure(reason, im)}))
+
+    @staticmethod
+    def _entry(record, run, stripe, im, collapse_index, reason) -> dict:
+        entry = {
+            "record": int(record),
+            "run": None if run is None else int(run),
+            "stripe": None if stripe is None else str(stripe),
+        }
+        if im is not None:
+            entry["im"] = float(im)
+        if collapse_index is not None:
+            entry["collapse-index"] = int(collapse_index)
+            entry["reason"] = reason
+        return entry
+
+    def _write(self, buffer: Iterable[tuple], segment: str) -> Path:
+        """Appends runs to a segment, arrays first, then the index lines
+
+        Parameters
+        ----------
+        buffer : Iterable[tuple]
+            Index entries and nested arrays of each run
+        segment : str
+            Segment name
+
+        Returns
+        -------
+        Path
+            Path to the index of the segment
+        """
+        lines = []
+        with open(self._segment_path(segment, ".bin"), "ab") as file:
+            # Arrays are located from the end of the file, so that a write
+            # interrupted earlier does not shift the offsets
+            offset = file.seek(0, os.SEEK_END) // _DTYPE.itemsize
+            for entry, arrays in buffer:
+                values = []
+                layout, offset = _pack(arrays, values, offset)
+                if values:
+                    file.write(np.concatenate(values).astype(_DTYPE).tobytes())
+                lines.append(json.dumps(dict(entry, **layout)) + "\n")
+
+        # The index is written last, a run exists only once it is indexed
+        path = self._segment_path(segment, ".jsonl")
+        with open(path, "a") as file:
+            file.write("".join(lines))
+        return path
+
+    def flush(self) -> Path:
+        """Writes the buffered runs to the segment of the current process
+
+        Returns
+        -------
+        Path
+            Path to the index of the segment, None if the buffer is empty
+        """
+        if not self._buffer:
+            return None
+
+        if self._segment is None or self._segment_pid != os.getpid():
+            self._segment = self._new_segment()
+            self._segment_pid = os.getpid()
+
+        path = self._write(self._buffer, self._segment)
+        self._buffer = []
+        self._buffered = 0
+        self.refresh()
+        return path
+
+    def compact(self) -> Path:
+        """Merges the segments into a single segment, keeping the latest
+        version of each run. Not to be called while other processes write to
+        the store.
+
+        Returns
+        -------
+        Path
+            Path to the index of the merged segment, None if the store is
+            empty
+        """
+        self.flush()
+        self.refresh()
+        old = self._segments()
+        entries = self._load_index()
+        if not entries:
+            return None
+
+        segment = self._new_segment()
+        path = self._write(self._runs(entries), segment)
+
+        # Memory maps are closed before the merged segments are removed
+        entries = None
+        self.refresh()
+        for index in old:
+            for suffix in (".bin", ".jsonl"):
+                self._segment_path(index.stem, suffix).unlink(missing_ok=True)
+        if self._segment_pid == os.getpid():
+            self._segment = None
+        return path
+
+    def _runs(self, entries: List[dict]):
+        """Index entries and nested arrays of indexed runs, as buffered by
+        append(), arrays are read one run at a time
+        """
+        for entry in entries:
+            data = self._data(entry["segment"])
+            arrays = {kind: _unpack(entry[kind], data)
+                      for kind in ("peaks", "histories", "summary")
+                      if kind in entry}
+            meta = {key: value for key, value in entry.items()
+                    if key not in arrays and key not in ("segment", "line")}
+            yield meta, arrays
+
+    def _load_index(self) -> List[dict]:
+        if self._index is not None:
+            return self._index
+
+        index = {}
+        for path in self._segments():
+            with open(path, "r") as file:
+                for line, text in enumerate(file):
+                    try:
+                        entry = json.loads(text)
+                    except json.JSONDecodeError:
+                        # Partially written line of an interrupted flush
+                        continue
+                    entry["segment"] = path.stem
+                    entry["line"] = line
+                    key = (entry["record"], entry["run"], entry["stripe"])
+                    index[key] = entry
+
+        self._index = sorted(
+            index.values(), key=lambda entry: (
+                entry["stripe"] or "", entry["record"], entry["run"] or 0))
+        # Grouped once, records are read one at a time by the postprocessors
+        self._by_record = {}
+        for entry in self._index:
+            self._by_record.setdefault(entry["record"], []).append(entry)
+        return self._index
+
+    def refresh(self) -> None:
+        """Discards the cached index, runs flushed since are picked up on
+        the next read
+        """
+        self._index = None
+        self._by_record = None
+        self._arrays = {}
+
+    def entries(
+        self,
+        record: int = None,
+        run: int = None,
+        stripe: str = None,
+    ) -> List[dict]:
+        """Indexed runs, sorted by stripe, record and run
+
+        Parameters
+        ----------
+        record : int, optional
+            Select a record, by default None
+        run : int, optional
+            Select an IDA run, by default None
+        stripe : str, optional
+            Select an MSA stripe, by default None
+
+        Returns
+        -------
+        List[dict]
+            Index entries of the selected runs
+        """
+        entries = self._load_index()
+        if record is not None:
+            entries = self._by_record.get(record, [])
+
+        selection = []
+        for entry in entries:
+            if run is not None and entry["run"] != run:
+                continue
+            if stripe is not None and entry["stripe"] != str(stripe):
+                continue
+            selection.append(entry)
+        return selection
+
+    def records(self) -> Iterator[Tuple[int, List[dict]]]:
+        """Iterates over the records in ascending order, the index is
+        scanned once
+
+        Yields
+        ------
+        Tuple[int, List[dict]]
+            Record index and the index entries of its runs, sorted by stripe
+            and run
+        """
+        self._load_index()
+        for record in sorted(self._by_record):
+            yield record, self._by_record[record]
+
+    def stripes(self) -> List[str]:
+        """Names of the MSA stripes in the store
+        """
+        return sorted({entry["stripe"] for entry in self._load_index()
+                       if entry["stripe"] is not None})
+
+    def _data(self, segment: str) -> np.ndarray:
+        if segment not in self._arrays:
+            path = self._segment_path(segment, ".bin")
+            if path.stat().st_size == 0:
+                # Segment of runs without arrays
+                self._arrays[segment] = np.empty(0, dtype=_DTYPE)
+            else:
+                self._arrays[segment] = np.memmap(
+                    path, dtype=_DTYPE, mode="r")
+        return self._arrays[segment]
+
+    def _view(self, entry: dict, variable: str, kind: str) -> np.ndarray:
+        return _unpack(entry[kind][variable], self._data(entry["segment"]))
+
+    def peak(self, entry: dict, variable: str) -> np.ndarray:
+        """Peak absolute values of a variable for a run
+
+        Parameters
+        ----------
+        entry : dict
+            Index entry, see entries()
+        variable : str
+            One of VARIABLES
+
+        Returns
+        -------
+        np.ndarray
+            Peak values of shape (directions, storeys or floors)
+        """
+        return self._view(entry, variable, "peaks")
+
+    def history(self, entry: dict, variable: str) -> np.ndarray:
+        """Time history of a variable for a run, memory-mapped
+
+        Parameters
+        ----------
+        entry : dict
+            Index entry, see entries()
+        variable : str
+            One of VARIABLES
+
+        Returns
+        -------
+        np.ndarray
+            History of shape (directions, storeys or floors, steps)
+
+        Raises
+        ------
+        ValueError
+            If time histories are not stored
+        """
+        if variable not in entry["histories"]:
+            raise ValueError(
+                "[EXCEPTION] Time histories are not stored for record "
+                f"{entry['record']}")
+        return self._view(entry, variable, "histories")
+
+    def peaks(
+        self,
+        variable: str,
+        record: int = None,
+        run: int = None,
+        stripe: str = None,
+    ) -> np.ndarray:
+        """Peak absolute values of a variable for the selected runs
+
+        Parameters
+        ----------
+        variable : str
+            One of VARIABLES
+        record : int, optional
+            Select a record, by default None
+        run : int, optional
+            Select an IDA run, by default None
+        stripe : str, optional
+            Select an MSA stripe, by default None
+
+        Returns
+        -------
+        np.ndarray
+            Peak values of shape (runs, directions, storeys or floors), in
+            the order of entries(), runs terminated without outputs are
+            skipped
+        """
+        return np.stack([
+            self.peak(entry, variable)
+            for entry in self.entries(record, run, stripe)
+            if entry["peaks"]
+        ])
+
+    def summary(self, entry: dict) -> Dict:
+        """Summary of a run, arrays are read from the data file of its
+        segment
+
+        Parameters
+        ----------
+        entry : dict
+            Index entry, see entries()
+
+        Returns
+        -------
+        Dict
+            Summary, see summarizer.summarize, None if not stored
+        """
+        if "summary" not in entry:
+            return None
+        # Summaries are small, they are copied out of the memory map
+        return _unpack(entry["summary"], self._data(entry["segment"]),
+                       copy=True)
+
+    def read(self, entry: dict) -> Tuple[np.ndarray, ...]:
+        """Outputs of a run, in the layout of SolutionAlgorithm.solve
+
+        Parameters
+        ----------
+        entry : dict
+            Index entry, see entries()
+
+        Returns
+        -------
+        Tuple[np.ndarray, ...]
+            Accelerations, displacements, drifts, residuals and, if stored,
+            the intensity measure level of the run
+        """
+        outputs = tuple(self.history(entry, variable)
+                        for variable in VARIABLES)
+        if "im" in entry:
+            outputs += (entry["im"], )
+        return outputs
+
+    def as_dict(self, stripe: str = None, summaries: bool = False) -> Dict:
+        """Outputs of the store as nested dictionaries, arrays are
+        memory-mapped and read only when accessed
+
+        Parameters
+        ----------
+        stripe : str, optional
+            Select an MSA stripe, by default None
+        summaries : bool, optional
+            Return the summaries of the runs, instead of their time
+            histories, by default False. Summaries are returned for runs
+            whose time histories are not stored.
+
+        Returns
+        -------
+        Dict
+            {record: {run: outputs}} for IDA,
+            {stripe: {record: outputs}} for MSA
+        """
+        data = {}
+        for entry in self.entries(stripe=stripe):
+            if "summary" in entry and (summaries or not entry["histories"]):
+                outputs = self.summary(entry)
+            else:
+                outputs = self.read(entry)
+
+            if entry["stripe"] is None:
+                data.setdefault(entry["record"], {})[entry["run"]] = outputs
+            else:
+                data.setdefault(entry["stripe"], {})[entry["record"]] = \
+                    outputs
+        return data
@@ -0,0 +1,220 @@
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+
+def count_points(path: Path) -> int:
+    """Counts the number of data points of a ground motion record without
+    parsing it
+
+    Parameters
+    ----------
+    path : Path
+        Path to ground motion record
+
+    Returns
+    -------
+    int
+        Number of non-empty lines in the record file
+    """
+    with open(path, "rb") as file:
+        return sum(1 for line in file if line.strip())
+
+
+def estimate_cost(
+    npts: int,
+    dt: float,
+    analysis_time_step: float = None,
+    extra_dur: float = 10.,
+    substeps: float = 1.0,
+    runs: int = 1,
+) -> float:
+    """Estimates the relative cost of a nonlinear time history analysis as
+    the expected number of analysis steps
+
+    Parameters
+    ----------
+    npts : int
+        Number of data points of the ground motion record
+    dt : float
+        Time step of the ground motion record in [s]
+    analysis_time_step : float, optional
+        Nonlinear analysis time step in [s], by default None
+        If None, will default to dt
+    extra_dur : float, optional
+        Extra duration for free vibrations in [s], by default 10.
+    substeps : float, optional
+        Expected ratio of performed to nominal analysis steps, accounting for
+        time step reductions, by default 1.0
+    runs : int, optional
+        Number of analyses performed with the record, e.g., IDA runs,
+        by default 1
+
+    Returns
+    -------
+    float
+        Expected number of analysis steps
+    """
+    if analysis_time_step is None:
+        analysis_time_step = dt
+    analysis_time_step = min(analysis_time_step, dt)
+
+    dur = dt * npts + extra_dur
+    return runs * substeps * dur / analysis_time_step
+
+
+class Journal:
+    FILENAME = "journal.jsonl"
+
+    def __init__(self, directory: Path) -> None:
+        """Journal of past analysis timings, one JSON entry per line
+
+        Parameters
+        ----------
+        directory : Path
+            Directory where the journal file is stored
+        """
+        self.path = Path(directory) / self.FILENAME
+
+    def append(self, entries: List[dict]) -> None:
+        """Appends entries to the journal
+
+        Parameters
+        ----------
+        entries : List[dict]
+            Entries to append, each containing at least 'key' and 'wall-time'
+        """
+        if not entries:
+            return
+
+        with open(self.path, "a") as file:
+            for entry in entries:
+                file.write(json.dumps(entry) + "\n")
+
+    def read(self) -> Dict[str, List[dict]]:
+        """Reads the journal
+
+        Returns
+        -------
+        Dict[str, List[dict]]
+            Journal entries grouped by task key
+        """
+        entries = {}
+        if not self.path.exists():
+            return entries
+
+        with open(self.path, "r") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Partially written line of an interrupted run
+                    continue
+                entries.setdefault(entry["key"], []).append(entry)
+
+        return entries
+
+
+class TaskScheduler:
+    def __init__(
+        self,
+        journal: Journal = None,
+        analysis_time_step: float = None,
+        extra_dur: float = 10.,
+    ) -> None:
+        """Orders analysis tasks longest first based on a cost model
+
+        The cost of a task is estimated from the number of data points and
+        the time step of the record. When a journal of past runs is
+        available, the expected sub-stepping of each record and the measured
+        wall-clock times are used instead.
+
+        Parameters
+        ----------
+        journal : Journal, optional
+            Journal of past analysis timings, by default None
+        analysis_time_step : float, optional
+            Nonlinear analysis time step in [s], by default None
+        extra_dur : float, optional
+            Extra duration for free vibrations in [s], by default 10.
+        """
+        self.journal = journal
+        self.analysis_time_step = analysis_time_step
+        self.extra_dur = extra_dur
+
+        self.history = {} if journal is None else journal.read()
+        self.rate = self._seconds_per_step()
+        self.tasks: List[Tuple[float, str, Any]] = []
+
+    def _seconds_per_step(self) -> float:
+        """Median wall-clock time per analysis step over the journal
+        """
+        rates = [
+            entry["wall-time"] / entry["steps"]
+            for entries in self.history.values() for entry in entries
+            if entry.get("steps") and entry.get("wall-time") is not None
+        ]
+        if not rates:
+            return None
+        return float(np.median(rates))
+
+    def _substeps(self, key: str) -> float:
+        """Expected sub-stepping of a task from its past runs
+        """
+        ratios = [
+            entry["steps"] / entry["nominal-steps"]
+            for entry in self.history.get(key, [])
+            if entry.get("steps") and entry.get("nominal-steps")
+        ]
+        if not ratios:
+            return 1.0
+        return float(np.mean(ratios))
+
+    def add(self, key: str, task: Any, npts: int, dt: float,
+            runs: int = 1) -> float:
+        """Adds a task to the schedule
+
+        Parameters
+        ----------
+        key : str
+            Unique task identifier used in the journal
+        task : Any
+            Task payload passed to the worker
+        npts : int
+            Number of data points of the ground motion record
+        dt : float
+            Time step of the ground motion record in [s]
+        runs : int, optional
+            Number of analyses performed with the record, by default 1
+
+        Returns
+        -------
+        float
+            Estimated cost in analysis steps
+        """
+        cost = estimate_cost(
+            npts, dt, self.analysis_time_step, self.extra_dur,
+            self._substeps(key), runs)
+
+        # Measured timings take precedence over the estimate, they are
+        # converted to analysis steps to remain comparable
+        timings = [entry["wall-time"] for entry in self.history.get(key, [])
+                   if entry.get("wall-time") is not None]
+        if timings and self.rate:
+            cost = float(np.mean(timings)) / self.rate
+
+        self.tasks.append((cost, key, task))
+        return cost
+
+    def order(self) -> List[Any]:
+        """Returns the task payloads, longest first
+
+        Returns
+        -------
+        List[Any]
+            Ordered tasks
+        """
+        tasks = sorted(self.tasks, key=lambda item: item[0], reverse=True)
+        return [task for _, _, task in tasks]
@@ -3,6 +3,9 @@ import numpy as np
 import pickle
 from .SDOF_model import build
 from ..intensity_measure import IntensityMeasure
+from ..gm_records import load_record
+from ..scheduler import TaskScheduler, count_points
+from ..worker_pool import WorkerPool
 from .solution_algorithm_sdof import SolutionAlgorithm
 
 
@@ -22,6 +25,9 @@ class RCMRF:
     IM = IntensityMeasure()
     outputs = dict()
 
+    # Modal parameters, computed once per process
+    _modal = None
+
     def __init__(self, outputsDir,  gmdir, gmfileNames, Fvect, Dvect, mass,
                  damage=False, IM_type=3,
                  max_runs=15, analysis_time_step=None, drift_capacity=10.0,
@@ -66,6 +72,9 @@ class RCMRF:
         # Records for MSA
         self.records = None
 
+        # Intensity measures of the records, cached per process
+        self._im_cache = {}
+
         if direction != 0 and flag3d and analysis_type == "MA":
             print("[WARNING] Direction should be set to 0 for Modal Analysis!")
 
@@ -107,6 +116,30 @@ class RCMRF:
         im_y = self.IM.get_sa_avg(accg_y, dt, period, xi, bounds=[0.2, 3.0])
         return im_x, im_y
 
+    def _modal_parameters(self):
+        """
+        Modal parameters, the eigenvalue analysis is performed once per
+        process
+        :return: tuple, period, damping and circular frequency
+        """
+        if self._modal is None:
+            self._modal = self.get_modal_parameters()
+        return self._modal
+
+    def _record_im(self, period, eq_name_x, eq_name_y, dt, xi):
+        """
+        Geometric mean of the intensity measures of a record pair, cached
+        per process
+        :return: float
+        """
+        key = (str(eq_name_x), str(eq_name_y), period)
+        if key not in self._im_cache:
+            sa_x, sa_y = self.estimate_im_record(
+                period, load_record(self.gmdir / eq_name_x),
+                load_record(self.gmdir / eq_name_y), dt, xi)
+            self._im_cache[key] = np.power(sa_x * sa_y, 0.5)
+        return self._im_cache[key]
+
     def ida_step(self, im, sa_record, dt, eq_name_x, damping, omegas,
                  analysis_time_step, dur, rec, im_idx):
         sf = round(im / sa_record * self.g, 3)
@@ -119,8 +152,9 @@ class RCMRF:
         a0 = 2 * w * damping
         b0 = 2 * damping / w
         op.rayleigh(a0, 0.0, b0, 0.0)
-        op.timeSeries('Path', self.TSTAGX, '-dt', dt, '-filePath',
-                      str(eq_name_x), '-factor', sf)
+        # Parsed records are cached, avoids reading the file at each step
+        op.timeSeries('Path', self.TSTAGX, '-dt', dt, '-values',
+                      *load_record(eq_name_x), '-factor', sf)
         op.pattern('UniformExcitation', self.PTAGX, 1, '-accel', self.TSTAGX)
         op.constraints('Plain')
         op.numberer('RCM')
@@ -130,7 +164,8 @@ class RCMRF:
             self.outputsDir / "cache", analysis_time_step, dur,
             self.drift_capacity, [1], [2],
         )
-        self.outputs[rec][im_idx] = th.solve()
+        self.outputs.setdefault(rec, {})
+        self.outputs[rec][im_idx] = th.solve(f"rec{rec}_run{im_idx}_cache")
 
         if self.export_at_each_step:
             with open(
@@ -138,6 +173,8 @@ class RCMRF:
             ) as handle:
                 pickle.dump(self.outputs[rec][im_idx], handle)
 
+        return th.collapse_index
+
     def run_model(self, period, imls):
         """
         Initializes model creator and runs analysis
@@ -184,3 +221,97 @@ class RCMRF:
                         pickle.dump(self.outputs, handle)
 
                 print("[SUCCESS] IDA done")
+
+    def _analysis_task(self, task):
+        """
+        Runs the analyses of a record at one or more IM levels in a worker
+        :param task: tuple, (rec, eq_name_x, eq_name_y, dt, period, levels,
+        collapse_search), where levels is a list of (im_idx, im)
+        :return: list of (rec, im_idx, outputs, collapse_index)
+        """
+        rec, eq_name_x, eq_name_y, dt, period, levels, collapse_search = task
+
+        _, xi, omegas = self._modal_parameters()
+
+        accg_x = load_record(self.gmdir / eq_name_x)
+        dur = round(self.EXTRA_DUR + dt * len(accg_x), 5)
+        sa_record = self._record_im(period, eq_name_x, eq_name_y, dt, xi)
+
+        if self.analysis_time_step is None:
+            analysis_time_step = dt
+        else:
+            analysis_time_step = min(self.analysis_time_step, dt)
+
+        results = []
+        for im_idx, im in levels:
+            collapse_index = self.ida_step(
+                im, sa_record, dt, self.gmdir / eq_name_x, xi,
+                omegas, analysis_time_step, dur, rec, im_idx)
+
+            # Outputs are returned to the coordinator, not kept in the worker
+            results.append((rec, im_idx, self.outputs[rec].pop(im_idx),
+                            collapse_index))
+
+            # Levels are ascending, collapse is bracketed between the
+            # previous level and the current one
+            if collapse_search and collapse_index != 0:
+                break
+
+        return results
+
+    def run_model_mp(self, period, imls, workers=0, collapse_search=False,
+                     max_memory=None):
+        """
+        Runs the analyses in parallel, (record, IM) tasks are distributed
+        over a pool of persistent workers, longest records first
+        :param period: float, conditioning period
+        :param imls: List[float], intensity measure levels
+        :param workers: int, number of workers, 0 for number of CPUs
+        :param collapse_search: bool, if True, each record is a single task
+        running the IM levels in ascending order until the first collapse
+        (collapse_index != 0), higher levels are not analysed
+        :param max_memory: float, resident memory of a worker in [MB]
+        beyond which it is recycled
+        :return: None
+        """
+        imls = np.asarray(imls)
+
+        print("[INITIATE] IDA started")
+
+        eqnms_list_x, eqnms_list_y, dts_list = self._get_gm()
+
+        scheduler = TaskScheduler(None, self.analysis_time_step,
+                                  self.EXTRA_DUR)
+        for rec, (eq_name_x, eq_name_y, dt) in enumerate(zip(
+                eqnms_list_x, eqnms_list_y, dts_list)):
+            self.outputs[rec] = {}
+            npts = count_points(self.gmdir / eq_name_x)
+
+            if collapse_search:
+                levels = [(int(i), float(imls[i])) for i in np.argsort(imls)]
+                scheduler.add(
+                    eq_name_x,
+                    (rec, eq_name_x, eq_name_y, dt, period, levels, True),
+                    npts, dt, runs=len(levels))
+                continue
+
+            for im_idx, im in enumerate(imls):
+                scheduler.add(
+                    f"{eq_name_x}/{im_idx}",
+                    (rec, eq_name_x, eq_name_y, dt, period,
+                     [(im_idx, float(im))], False),
+                    npts, dt)
+
+        with WorkerPool(self._analysis_task, workers,
+                        initargs=(self.call_model,),
+                        max_memory=max_memory) as pool:
+            for results in pool.imap(scheduler.order()):
+                for rec, im_idx, outputs, _ in results:
+                    self.outputs[rec][im_idx] = outputs
+
+        # Export results
+        if not self.export_at_each_step:
+            with open(self.outputsDir / "IDA.pickle", "wb") as handle:
+                pickle.dump(self.outputs, handle)
+
+        print("[SUCCESS] IDA done")
@@ -173,9 +173,16 @@ class SolutionAlgorithm:
                 print(f"[FAILURE] Failed at {control_time} - exit analysis...")
             self.collapse_index = -1
 
-    def solve(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    def solve(self, cache: str = "cache"
+              ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
         """Looks for a solution, performs nonlinear time history analysis
 
+        Parameters
+        ----------
+        cache : str, optional
+            Name of the temporary cache folder, must be unique for analyses
+            running concurrently, by default "cache"
+
         Returns
         -------
         Tuple[np.ndarray, np.ndarray, np.ndarray]
@@ -187,11 +194,10 @@ class SolutionAlgorithm:
         """
         # Create self.output_path and a temporary cache folder
         if self.output_path is not None:
-            create_path(self.output_path / "cache")
-            cache_path = self.output_path / 'cache'
+            cache_path = self.output_path / cache
         else:
-            create_path(Path("cache"))
-            cache_path = Path('cache')
+            cache_path = Path(cache)
+        create_path(cache_path)
 
         # Set up analysis parameters
         control_time = 0.0
@@ -1,11 +1,14 @@
 from typing import List, Union, Tuple
 from pathlib import Path
+import time
 import openseespy.opensees as op
 import numpy as np
 import warnings
 
 from .utilities import create_path, read_text, \
     remove_directory_contents
+from .gm_records import load_record
+from .worker_pool import heartbeat, RUN_TIMEOUT, STEP_TIMEOUT
 
 
 def apply_time_series(
@@ -67,9 +70,9 @@ def apply_time_series(
     # op.timeSeries('Path', tstagx, '-dt', dt,
     #               '-filePath', str(pathx), '-factor', fx)
     try:
-        accx = list(np.loadtxt(pathx)[:, 1])
+        accx = list(load_record(pathx)[:, 1])
     except IndexError:
-        accx = list(np.loadtxt(pathx))
+        accx = list(load_record(pathx))
 
     op.timeSeries('Path', tstagx, '-dt', dt, '-values', *accx, '-factor', fx)
 
@@ -79,9 +82,9 @@ def apply_time_series(
         # op.timeSeries('Path', tstagy, '-dt', dt,
         #               '-filePath', str(pathy), '-factor', fy)
         try:
-            accy = list(np.loadtxt(pathy)[:, 1])
+            accy = list(load_record(pathy)[:, 1])
         except IndexError:
-            accy = list(np.loadtxt(pathy))
+            accy = list(load_record(pathy))
 
         op.timeSeries('Path', tstagy, '-dt', dt, '-values', *accy,
                       '-factor', fy)
@@ -103,6 +106,11 @@ class SolutionAlgorithm:
     TOL = 1e-04
     collapse_index = 0
 
+    # Reasons for terminating the analysis, besides RUN_TIMEOUT and
+    # STEP_TIMEOUT, both of which are non-converged (collapse_index = -1)
+    NON_CONVERGENCE = "non-convergence"
+    COLLAPSE = "collapse"
+
     def __init__(
         self,
         output_path: Path,
@@ -114,6 +122,8 @@ class SolutionAlgorithm:
         pflag: bool = True,
         extra_dur: float = 10.,
         directions: int = 2,
+        run_timeout: float = None,
+        step_timeout: float = None,
     ) -> None:
         """Algorithms to execute nonlinear time history analysis (NLTHA)
 
@@ -137,6 +147,13 @@ class SolutionAlgorithm:
             Print statements, by default True
         extra_dur : float, optional
             Extra duration for free vibrations in [s], by default 10.
+        directions : int, optional
+            Number of horizontal directions of excitation, by default 2
+        run_timeout : float, optional
+            Wall-clock budget of the analysis in [s], by default None
+        step_timeout : float, optional
+            Wall-clock budget of a single analysis step, including the
+            attempts to achieve convergence, in [s], by default None
         """
         self.output_path = output_path
         if self.output_path is not None:
@@ -148,10 +165,18 @@ class SolutionAlgorithm:
         self.bnode = np.array(bnode)
         self.tnode = np.array(tnode)
         self.directions = directions
+        self.run_timeout = run_timeout
+        self.step_timeout = step_timeout
+
+        # Reason for terminating the analysis, None if completed
+        self.reason = None
 
         # TODO, remove pflag and do logging instead
         self.pflag = pflag
 
+        # Number of performed analysis steps, including reduced time steps
+        self.steps = 0
+
         self._set_analysis()
 
     def _set_analysis(self):
@@ -162,6 +187,22 @@ class SolutionAlgorithm:
         op.integrator('Newmark', 0.5, 0.25)
         op.analysis('Transient')
 
+    def _analyze(self, dt: float) -> int:
+        """Performs a single analysis step
+
+        Parameters
+        ----------
+        dt : float
+            Analysis time step, [s]
+
+        Returns
+        -------
+        int
+            0 if analysis step was successful, != 0 otherwise
+        """
+        self.steps += 1
+        return op.analyze(1, dt)
+
     def _algorithm(self, ok: int, control_time: float) -> None:
         """Algorithms necessary to perform the analysis
 
@@ -183,20 +224,20 @@ class SolutionAlgorithm:
                 print(f"[FAILURE] Failed at {control_time} - "
                       "Reduced timestep by half...")
             dtt = 0.5 * self.dt
-            ok = op.analyze(1, dtt)
+            ok = self._analyze(dtt)
         if ok:
             if self.pflag:
                 print(f"[FAILURE] Failed at {control_time} - "
                       "Reduced timestep by quarter...")
             dtt = 0.25 * self.dt
-            ok = op.analyze(1, dtt)
+            ok = self._analyze(dtt)
         if ok:
             if self.pflag:
                 print(
                     f"[FAILURE] Failed at {control_time} - Trying Broyden...")
             op.algorithm('Broyden', 8)
             dtt = self.dt
-            ok = op.analyze(1, dtt)
+            ok = self._analyze(dtt)
             op.algorithm(self.ALGORITHM_TYPE)
         if ok:
             if self.pflag:
@@ -204,7 +245,7 @@ class SolutionAlgorithm:
                       "Trying Newton with initial tangent...")
             op.algorithm('Newton', '-initial')
             dtt = self.dt
-            ok = op.analyze(1, dtt)
+            ok = self._analyze(dtt)
             op.algorithm(self.ALGORITHM_TYPE)
         if ok:
             if self.pflag:
@@ -212,7 +253,7 @@ class SolutionAlgorithm:
                       "Trying NewtonWithLineSearch...")
             op.algorithm('NewtonLineSearch', 0.8)
             dtt = self.dt
-            ok = op.analyze(1, self.dt)
+            ok = self._analyze(self.dt)
             op.algorithm(self.ALGORITHM_TYPE)
         if ok:
             if self.pflag:
@@ -222,7 +263,7 @@ class SolutionAlgorithm:
             op.test('NormDispIncr', self.TOL * 0.1, self.ITERATIONS * 50)
             op.algorithm('Newton', '-initial')
             dtt = self.dt
-            ok = op.analyze(1, dtt)
+            ok = self._analyze(dtt)
             op.test(self.TEST_TYPE, self.TOL, self.ITERATIONS)
             op.algorithm(self.ALGORITHM_TYPE)
         if ok:
@@ -232,7 +273,7 @@ class SolutionAlgorithm:
             op.test('NormDispIncr', self.TOL * 0.1, self.ITERATIONS * 50)
             op.algorithm('NewtonLineSearch', 0.8)
             dtt = self.dt
-            ok = op.analyze(1, dtt)
+            ok = self._analyze(dtt)
             op.test(self.TEST_TYPE, self.TOL, self.ITERATIONS)
             op.algorithm(self.ALGORITHM_TYPE)
         # Next, halve the timestep with both algorithm and tolerance reduction
@@ -244,7 +285,7 @@ class SolutionAlgorithm:
             op.test('NormDispIncr', self.TOL * 0.1, self.ITERATIONS * 50)
             op.algorithm('Newton', '-initial')
             dtt = 0.5 * self.dt
-            ok = op.analyze(1, dtt)
+            ok = self._analyze(dtt)
             op.test(self.TEST_TYPE, self.TOL, self.ITERATIONS)
             op.algorithm(self.ALGORITHM_TYPE)
         if ok:
@@ -255,15 +296,42 @@ class SolutionAlgorithm:
             op.test('NormDispIncr', self.TOL * 0.1, self.ITERATIONS * 50)
             op.algorithm('NewtonLineSearch', 0.8)
             dtt = 0.5 * self.dt
-            ok = op.analyze(1, dtt)
+            ok = self._analyze(dtt)
             op.test(self.TEST_TYPE, self.TOL, self.ITERATIONS)
             op.algorithm(self.ALGORITHM_TYPE)
         if ok:
             if self.pflag:
                 print(f"[FAILURE] Failed at {control_time} - exit analysis...")
             self.collapse_index = -1
+            self.reason = self.NON_CONVERGENCE
         return ok
 
+    def _check_budget(self, start: float, step_start: float) -> None:
+        """Terminates the analysis as non-converged, if the time budgets
+        are exceeded
+
+        Parameters
+        ----------
+        start : float
+            Start time of the analysis, [s]
+        step_start : float
+            Start time of the current analysis step, [s]
+        """
+        now = time.perf_counter()
+
+        if self.step_timeout is not None and \
+                now - step_start > self.step_timeout:
+            self.reason = STEP_TIMEOUT
+        elif self.run_timeout is not None and now - start > self.run_timeout:
+            self.reason = RUN_TIMEOUT
+        else:
+            return
+
+        if self.pflag:
+            print(f"[FAILURE] Time budget exceeded ({self.reason}) - "
+                  "exit analysis...")
+        self.collapse_index = -1
+
     def _verify_against_zerolength(self) -> np.ndarray:
         """Verify that the elements of the model are not of zero length
 
@@ -354,11 +422,17 @@ class SolutionAlgorithm:
 
         h = self._verify_against_zerolength()
 
+        start = time.perf_counter()
+        heartbeat(run=True)
+
         # Run the actual analysis now
         while self.collapse_index == 0 and control_time <= self.dur and \
                 not ok:
+            step_start = time.perf_counter()
+            heartbeat()
+
             # Start analysis
-            ok = op.analyze(1, self.dt)
+            ok = self._analyze(self.dt)
             control_time = op.getTime()
 
             # If the analysis fails, try the following changes to achieve
@@ -366,6 +440,10 @@ class SolutionAlgorithm:
             # Analysis will be slower in here though...
             ok = self._algorithm(ok, control_time)
 
+            # Stop hung analyses as non-converged
+            if self.collapse_index == 0:
+                self._check_budget(start, step_start)
+
             # Recorders
             temp_accel = np.zeros((self.directions, nst + 1, 1))
             temp_disp = np.zeros((self.directions, nst + 1, 1))
@@ -434,6 +512,7 @@ class SolutionAlgorithm:
             if mdrift_init >= self.dc:
                 # If it was exceeded then local structure collapse is assumed
                 self.collapse_index = 1
+                self.reason = self.COLLAPSE
                 # Hard cap the mdrift_init value to the drift capacity
                 mdrift_init = self.dc
 
@@ -454,7 +533,7 @@ class SolutionAlgorithm:
 
         if self.collapse_index == -1:
             print(f"[FAILURE] Analysis failed to converge at {control_time}"
-                  f" of {self.dur}.")
+                  f" of {self.dur} ({self.reason}).")
         if self.collapse_index == 0:
             print('[SUCCESS] Analysis completed successfully.')
         if self.collapse_index == 1:
@@ -0,0 +1,187 @@
+from pathlib import Path
+from typing import Dict, Tuple
+
+import numpy as np
+
+
+# Suffix of summary files exported next to, or instead of, the time history
+# pickle files, e.g. Record1_Run2.summary.pickle
+SUFFIX = ".summary.pickle"
+
+# Engineering demand parameters of a summary, each of shape
+# directions x storeys (or floors)
+EDPS = ("PFA", "disp", "PSD", "RPSD")
+
+
+def summary_path(path: Path) -> Path:
+    """Path of the summary exported with a time history pickle file
+
+    Parameters
+    ----------
+    path : Path
+        Path to the pickle file, e.g. Record1.pickle
+
+    Returns
+    -------
+    Path
+        Path to the summary, e.g. Record1.summary.pickle
+    """
+    path = Path(path)
+    return path.with_name(path.name.replace(".pickle", "") + SUFFIX)
+
+
+def residual_drift(res: np.ndarray, drift: np.ndarray) -> np.ndarray:
+    """Residual drifts, mean of the residual history, or final drift if the
+    residual history is not available, along the last axis
+
+    Parameters
+    ----------
+    res : np.ndarray
+        Residual drift histories
+    drift : np.ndarray
+        Drift histories
+
+    Returns
+    -------
+    np.ndarray
+        Residual drifts
+    """
+    res = np.asarray(res)
+    if res.shape[-1] > 1:
+        return np.mean(res[..., 1:], axis=-1)
+
+    return np.asarray(drift)[..., -1]
+
+
+def summarize(outputs: Tuple[np.ndarray, ...], idxres: int = None) -> Dict:
+    """Reduces the outputs of a nonlinear time history analysis to the
+    engineering demand parameters used by the postprocessors, meant to be
+    called in the worker, where the histories are already in memory
+
+    Parameters
+    ----------
+    outputs : Tuple[np.ndarray, ...]
+        Accelerations [g], displacements [m], drifts and residual drifts,
+        each of shape directions x storeys (or floors) x steps, and
+        optionally the intensity measure level
+    idxres : int, optional
+        Step at which the free vibration phase starts, by default None
+        If provided, the residual drifts used for IDA are computed as the
+        mean drifts over the free vibration phase
+
+    Returns
+    -------
+    Dict
+        {
+            'PFA': np.ndarray,      peak at each floor
+            'disp': np.ndarray,     peak at each floor
+            'PSD': np.ndarray,      peak at each storey
+            'RPSD': np.ndarray,     residual at each storey
+            'SRSS': {'PFA', 'disp', 'PSD', 'RPSD'}, if two directions
+            'RPSD-free': np.ndarray, residual over the free vibration
+                phase, if idxres is provided
+            'free-vibration': bool, free vibration phase reached
+            'im': float, if provided
+        }
+        EDPs of each direction are of shape directions x storeys (floors)
+    """
+    acc, disp, drifts, res = (np.asarray(outputs[i]) for i in range(4))
+
+    summary = {
+        "PFA": np.amax(np.abs(acc), axis=-1),
+        "disp": np.amax(np.abs(disp), axis=-1),
+        "PSD": np.amax(np.abs(drifts), axis=-1),
+        "RPSD": residual_drift(np.abs(res), np.abs(drifts)),
+    }
+
+    if acc.shape[0] == 2:
+        summary["SRSS"] = {
+            "PFA": np.amax((acc[0]**2 + acc[1]**2)**0.5, axis=-1),
+            "disp": np.amax((disp[0]**2 + disp[1]**2)**0.5, axis=-1),
+            "PSD": np.amax((drifts[0]**2 + drifts[1]**2)**0.5, axis=-1),
+            "RPSD": (summary["RPSD"][0]**2 + summary["RPSD"][1]**2)**0.5,
+        }
+
+    if idxres is not None:
+        summary["free-vibration"] = drifts.shape[-1] > idxres
+        if summary["free-vibration"]:
+            summary["RPSD-free"] = np.mean(drifts[..., idxres:], axis=-1)
+        else:
+            # Analysis stopped before the free vibration phase
+            summary["RPSD-free"] = drifts[..., -1]
+
+    if len(outputs) > 4:
+        summary["im"] = float(outputs[4])
+
+    return summary
+
+
+def failure(reason: str, im: float = None) -> Dict:
+    """Summary of a run terminated without outputs, e.g. by the watchdog of
+    WorkerPool, the run is non-converged
+
+    Parameters
+    ----------
+    reason : str
+        Reason of the termination
+    im : float, optional
+        Intensity measure level, by default None
+
+    Returns
+    -------
+    Dict
+        {'collapse-index': -1, 'reason': str, 'im': float, if provided}
+    """
+    summary = {"collapse-index": -1, "reason": reason}
+    if im is not None:
+        summary["im"] = float(im)
+    return summary
+
+
+def status(outputs) -> Tuple[int, str]:
+    """Termination status of a run
+
+    Parameters
+    ----------
+    outputs : Union[Tuple[np.ndarray, ...], Dict]
+        Outputs of the run, or its summary
+
+    Returns
+    -------
+    Tuple[int, str]
+        Collapse index and reason, None if not recorded
+    """
+    if not isinstance(outputs, dict):
+        return None, None
+    return outputs.get("collapse-index"), outputs.get("reason")
+
+
+def performed(outputs) -> bool:
+    """Whether a run has outputs, i.e. it is not None nor the summary of a
+    run terminated without outputs, see failure
+    """
+    if outputs is None:
+        return False
+    return not isinstance(outputs, dict) or "PSD" in outputs
+
+
+def to_lists(summary: Dict) -> Dict:
+    """Summary with arrays converted to lists, e.g. for JSON
+    """
+    if isinstance(summary, dict):
+        return {key: to_lists(value) for key, value in summary.items()}
+    if isinstance(summary, np.ndarray):
+        return summary.tolist()
+    if isinstance(summary, np.generic):
+        return summary.item()
+    return summary
+
+
+def from_lists(summary: Dict) -> Dict:
+    """Summary with lists converted back to arrays, see to_lists
+    """
+    if isinstance(summary, dict):
+        return {key: from_lists(value) for key, value in summary.items()}
+    if isinstance(summary, list):
+        return np.asarray(summary, dtype=float)
+    return summary
@@ -3,10 +3,11 @@ import pickle
 import numpy as np
 from scipy import stats
 from scipy.interpolate import interp1d
-from scipy.optimize import minimize
 import ast
+import struct
+import zipfile
 from pathlib import Path
-import warnings
+from .fragility_fit import fit_lognormal, neg_log_likelihood
 
 
 def append_record(x, y):
@@ -114,7 +115,157 @@ def to_json_serializable(data):
     return data
 
 
-def export_results(filepath: Path, data, filetype: str):
+# Marker of arrays stored in the binary file in the JSON sidecar of an
+# npz export, see export_results and load_results
+NPZ_REF = "__npz__"
+
+
+def _pack_arrays(data, arrays: dict, packed: dict):
+    """Replaces arrays and numeric lists in nested data by references to the
+    binary file, numeric lists are packed into one array per dtype
+
+    Parameters
+    ----------
+    data : any
+        Data to be stored
+    arrays : dict
+        Arrays stored as separate members, updated in place
+    packed : dict
+        Flattened numeric lists per dtype, updated in place
+
+    Returns
+    -------
+    any
+        JSON serializable structure of the data
+    """
+    if isinstance(data, dict):
+        return {key: _pack_arrays(value, arrays, packed)
+                for key, value in data.items()}
+
+    if isinstance(data, np.ndarray) and data.dtype.kind in "biufc" \
+            and data.ndim > 0:
+        name = f"array{len(arrays)}"
+        arrays[name] = data
+        return {NPZ_REF: name}
+
+    if isinstance(data, (list, tuple)) and data:
+        try:
+            arr = np.asarray(data)
+        except ValueError:
+            # Ragged lists
+            arr = None
+        if arr is not None and arr.dtype.kind in "biuf":
+            name = f"packed-{arr.dtype.name}"
+            chunks = packed.setdefault(name, [])
+            offset = sum(chunk.size for chunk in chunks)
+            chunks.append(arr.ravel())
+            return {NPZ_REF: name, "offset": offset, "shape": arr.shape}
+        return [_pack_arrays(item, arrays, packed) for item in data]
+
+    return to_json_serializable(data)
+
+
+def _unpack_arrays(data, arrays: dict):
+    """Resolves the references of _pack_arrays
+    """
+    if isinstance(data, dict):
+        if NPZ_REF not in data:
+            return {key: _unpack_arrays(value, arrays)
+                    for key, value in data.items()}
+
+        array = arrays[data[NPZ_REF]]
+        if "offset" not in data:
+            return array
+        size = int(np.prod(data["shape"]))
+        return array[data["offset"]:data["offset"] + size].reshape(
+            data["shape"])
+
+    if isinstance(data, list):
+        return [_unpack_arrays(item, arrays) for item in data]
+    return data
+
+
+def _npz_memmap(path: Path) -> dict:
+    """Memory-maps the members of an uncompressed .npz file, compressed
+    members are read into memory
+
+    Parameters
+    ----------
+    path : Path
+        Path to the .npz file
+
+    Returns
+    -------
+    dict
+        Arrays by member name
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as file:
+        for info in archive.infolist():
+            name = info.filename[:-len(".npy")]
+            if info.compress_type != zipfile.ZIP_STORED:
+                with archive.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member)
+                continue
+
+            # Data of a stored member starts after its local file header
+            file.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack("<HH", file.read(4))
+            file.seek(info.header_offset + 30 + name_length + extra_length)
+
+            version = np.lib.format.read_magic(file)
+            if version == (1, 0):
+                header = np.lib.format.read_array_header_1_0(file)
+            else:
+                header = np.lib.format.read_array_header_2_0(file)
+            shape, fortran_order, dtype = header
+
+            if int(np.prod(shape)) == 0:
+                arrays[name] = np.empty(shape, dtype=dtype)
+                continue
+            arrays[name] = np.memmap(
+                path, dtype=dtype, mode="r", offset=file.tell(),
+                shape=shape, order="F" if fortran_order else "C")
+
+    return arrays
+
+
+def load_results(filepath: Path, mmap: bool = True):
+    """Loads results exported with export_results as npz
+
+    Parameters
+    ----------
+    filepath : Path
+        Path to the .npz file, or the path provided to export_results
+    mmap : bool, optional
+        Memory-map the arrays, pages are read from disk only when the
+        arrays are accessed, by default True. Arrays of compressed files are
+        always read into memory.
+
+    Returns
+    -------
+    any
+        Exported data, arrays and numeric lists are returned as arrays,
+        read-only if memory-mapped
+    """
+    path = Path(filepath)
+    if path.suffix != ".npz":
+        path = path.with_name(path.name + ".npz")
+
+    with open(path.with_suffix(".meta.json"), "r") as file:
+        meta = json.load(file)
+
+    if mmap:
+        arrays = _npz_memmap(path)
+    else:
+        with np.load(path) as npz:
+            arrays = {name: npz[name] for name in npz.files}
+
+    return _unpack_arrays(meta["data"], arrays)
+
+
+def export_results(filepath: Path, data, filetype: str,
+                   compress: bool = False):
     """Exports results to file
 
     Parameters
@@ -124,11 +275,28 @@ def export_results(filepath: Path, data, filetype: str):
     data : any
         Data to be stored
     filetype : str
-        Filetype, e.g. npy, json, pkl, csv
+        Filetype, e.g. npy, npz, json, pkl, csv
+        npz stores arrays and numeric lists in a binary .npz file and the
+        structure of the data in a .meta.json sidecar, see load_results
+    compress : bool, optional
+        Compress the .npz file, by default False. Uncompressed files can be
+        memory-mapped when loaded.
     """
     if filetype == "json":
         data = to_json_serializable(data)
 
+    if filetype == "npz":
+        arrays, packed = {}, {}
+        structure = _pack_arrays(data, arrays, packed)
+        for name, chunks in packed.items():
+            arrays[name] = np.concatenate(chunks)
+
+        save = np.savez_compressed if compress else np.savez
+        save(f"{filepath}.npz", **arrays)
+        # The sidecar is written last, the export is complete once it exists
+        with open(f"{filepath}.meta.json", "w") as json_file:
+            json.dump({"data": structure}, json_file)
+
     if filetype == "npy":
         np.save(f"{filepath}.npy", data)
     elif filetype == "pkl" or filetype == "pickle":
@@ -182,23 +350,12 @@ def mlefit_ida(median: float, dispersion: float, total_count: int, count: int,
     Returns
     -------
     float
-        Negative Log likelihood to be minimized
+        Negative Log likelihood to be minimized, inf for non-positive
+        median or dispersion, see fragility_fit.neg_log_likelihood
     """
-    warnings.filterwarnings("ignore", category=RuntimeWarning)
-
-    try:
-        p = stats.norm.cdf(np.log(data), loc=np.log(median), scale=dispersion)
-        likelihood = stats.binom.pmf(count, total_count, p)
-        likelihood[likelihood == 0] = 1e-290
-        loglik = -sum(np.log10(likelihood))
-
-        warnings.resetwarnings()
-
-        return loglik
-    except OverflowError:
-        warnings.resetwarnings()
-
-        return 1e+8
+    # Negative log-likelihood in log10, as a single fit
+    return float(neg_log_likelihood(
+        median, dispersion, data, total_count, count)) / np.log(10)
 
 
 def mlefit_msa(points, trials, observations, initial_guess=None):
@@ -222,7 +379,9 @@ def mlefit_msa(points, trials, observations, initial_guess=None):
     observations: numpy.ndarray (1xn)
         number of observations or collapses observed at IMLs
     initial_guess: list, optional (The default is None)
-        Initial guess for the log-normal distribution parameters [theta,beta]
+        Initial guess for the log-normal distribution parameters [theta,beta],
+        estimated from the observations if None, see
+        fragility_fit.fit_lognormal
 
     Returns
     -------
@@ -237,36 +396,9 @@ def mlefit_msa(points, trials, observations, initial_guess=None):
     output: array([1.07611623, 0.42923779])
     """
 
-    if initial_guess is None:
-        initial_guess = [0.8, 0.4]
-
-    if len(trials if type(trials) is list else [trials]) == 1:
-        trials = np.repeat(trials, len(points))
-
-    def func(x):
-        theta, beta = x
-        # poes = observations / trials
-        # evaluates the probability calculated under the initial assumption of
-        # theta and beta
-        poes_fitted = stats.lognorm.cdf(points, beta, scale=theta)
-        # calculates the likelihood of the parameters being correct
-        likelihood = stats.binom.pmf(k=observations, n=trials, p=poes_fitted)
-        # do not assign zero, assign zero like value
-        likelihood[likelihood <= 0] = 1e-200
-        # sum of the logs of the likelihood to be minimized
-        return -np.sum(np.log(likelihood))
-
-    # this finds a solution, bounds prevent negative values, check
-    # documentation for other settings
-    try:
-        sol = minimize(func, x0=initial_guess, method='SLSQP',
-                       bounds=((0, None), (0, None)))
-    except:
-        initial_guess = [1.0, 0.5]
-        sol = minimize(func, x0=initial_guess, method='SLSQP',
-                       bounds=((0, None), (0, None)))
-
-    return sol.x
+    theta, beta = fit_lognormal(points, trials, observations,
+                                x0=initial_guess)
+    return np.array([theta, beta])
 
 
 def spline(x, y, size: int = 1000) -> tuple[np.ndarray, np.ndarray]:
@@ -0,0 +1,399 @@
+from collections import deque
+from typing import Any, Callable, Iterable, Iterator
+import multiprocessing as mp
+import os
+import queue
+import time
+import traceback
+import openseespy.opensees as op
+
+from .result_writer import close_writer, flush_writer
+
+
+# Reasons for terminating an analysis that exceeded its time budget
+RUN_TIMEOUT = "run-timeout"
+STEP_TIMEOUT = "step-timeout"
+
+# Shared timestamps of the current worker, set in the worker process,
+# [start of current run, start of current step]
+_HEARTBEAT = None
+
+
+def heartbeat(run: bool = False) -> None:
+    """Signals progress of the current worker to the coordinator, has no
+    effect outside of a WorkerPool
+
+    Parameters
+    ----------
+    run : bool, optional
+        Start of a new analysis run, otherwise start of a new analysis step,
+        by default False
+    """
+    if _HEARTBEAT is None:
+        return
+
+    now = time.time()
+    if run:
+        _HEARTBEAT[0] = now
+    _HEARTBEAT[1] = now
+
+
+def memory_usage() -> float:
+    """Resident memory of the current process
+
+    Returns
+    -------
+    float
+        Resident set size in [MB]
+    """
+    try:
+        with open("/proc/self/statm", "r") as file:
+            pages = int(file.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        # Not available on Windows, memory based recycling is disabled
+        return 0.
+
+    # Peak resident memory, in [KB] on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def wipe_model() -> bool:
+    """Wipes the OpenSees domain and verifies that no state is carried over
+    to the next task
+
+    Returns
+    -------
+    bool
+        True if the domain is empty after the wipe
+    """
+    op.wipe()
+
+    try:
+        return not op.getNodeTags() and not op.getEleTags() \
+            and op.getTime() == 0.0
+    except Exception:
+        return False
+
+
+def warm_worker(builder: Callable = None) -> None:
+    """Worker initializer, imports are done once when the worker starts.
+    The model is built once to verify the builder and to warm up the
+    OpenSees interpreter.
+
+    Parameters
+    ----------
+    builder : Callable, optional
+        Model builder, by default None
+    """
+    if builder is not None:
+        builder()
+
+    if not wipe_model():
+        raise RuntimeError("[EXCEPTION] OpenSees domain could not be wiped")
+
+
+def _worker_loop(
+    worker_id: int,
+    func: Callable,
+    initializer: Callable,
+    initargs: tuple,
+    tasks: mp.Queue,
+    results: mp.Queue,
+    max_memory: float,
+    max_tasks: int,
+    timestamps,
+) -> None:
+    global _HEARTBEAT
+    _HEARTBEAT = timestamps
+
+    if initializer is not None:
+        initializer(*initargs)
+
+    count = 0
+    try:
+        while True:
+            item = tasks.get()
+            if item is None:
+                break
+
+            index, task = item
+            result, error = None, None
+            heartbeat(run=True)
+            try:
+                result = func(task)
+                # The result is posted once the files of the task are
+                # written, a worker terminated afterwards loses no writes
+                flush_writer()
+            except Exception:
+                error = traceback.format_exc()
+            count += 1
+
+            # Health checks, the worker is recycled only when necessary
+            healthy = wipe_model()
+            recycle = not healthy \
+                or (max_memory is not None and memory_usage() > max_memory) \
+                or (max_tasks is not None and count >= max_tasks)
+
+            results.put((worker_id, index, result, error, recycle))
+
+            if recycle:
+                break
+    finally:
+        # Stops the writer thread, writes are flushed after each task
+        close_writer()
+
+
+class WorkerPool:
+    POLL_INTERVAL = 1.0
+    # Allowance on top of the time budgets, the analysis is expected to stop
+    # by itself, the coordinator intervenes only when the solver hangs
+    GRACE = 5.0
+    # Time allowed to a stopping worker to complete its pending writes
+    SHUTDOWN_TIMEOUT = 60.0
+
+    def __init__(
+        self,
+        func: Callable,
+        workers: int = None,
+        initializer: Callable = warm_worker,
+        initargs: tuple = (),
+        max_memory: float = None,
+        max_tasks: int = None,
+        run_timeout: float = None,
+        step_timeout: float = None,
+        on_timeout: Callable = None,
+    ) -> None:
+        """Pool of persistent workers
+
+        Workers import the packages and initialize once, and process tasks
+        until the pool is closed. OpenSees domain is wiped and verified after
+        each task. A worker is replaced only when it fails the verification,
+        exceeds the memory threshold or the maximum number of tasks.
+
+        Parameters
+        ----------
+        func : Callable
+            Function applied to each task
+        workers : int, optional
+            Number of workers, by default None, i.e. number of CPUs
+        initializer : Callable, optional
+            Function called once when a worker starts, by default warm_worker
+        initargs : tuple, optional
+            Arguments of the initializer, by default ()
+        max_memory : float, optional
+            Resident memory of a worker in [MB], beyond which the worker is
+            recycled, by default None
+        max_tasks : int, optional
+            Number of tasks after which a worker is recycled, by default None
+        run_timeout : float, optional
+            Wall-clock budget of a single analysis run in [s], by default None
+        step_timeout : float, optional
+            Wall-clock budget of a single analysis step in [s],
+            by default None
+        on_timeout : Callable, optional
+            Called in the coordinator with (task, reason, wall_time) when a
+            worker exceeding a budget is terminated, wall_time being the
+            time in [s] since the task was dispatched, its return value is
+            yielded as the result of the task, by default None
+
+        Notes
+        -----
+        Budgets are enforced from the coordinator using the heartbeats of the
+        workers, see heartbeat(), so that they hold even when the solver
+        does not return. Workers are terminated after the budget plus
+        GRACE seconds and replaced.
+        """
+        if workers is None or workers <= 0:
+            workers = mp.cpu_count()
+
+        self.func = func
+        self.workers = workers
+        self.initializer = initializer
+        self.initargs = initargs
+        self.max_memory = max_memory
+        self.max_tasks = max_tasks
+        self.run_timeout = run_timeout
+        self.step_timeout = step_timeout
+        self.on_timeout = on_timeout
+
+        self.results = mp.Queue()
+        self.processes = {}
+        self.queues = {}
+        self.timestamps = {}
+        self._next_id = 0
+
+        for _ in range(self.workers):
+            self._spawn()
+
+    def _spawn(self) -> int:
+        worker_id = self._next_id
+        self._next_id += 1
+
+        tasks = mp.Queue()
+        timestamps = mp.RawArray('d', 2)
+        process = mp.Process(
+            target=_worker_loop,
+            args=(worker_id, self.func, self.initializer, self.initargs,
+                  tasks, self.results, self.max_memory, self.max_tasks,
+                  timestamps),
+            daemon=True,
+        )
+        process.start()
+
+        self.processes[worker_id] = process
+        self.queues[worker_id] = tasks
+        self.timestamps[worker_id] = timestamps
+        return worker_id
+
+    def _retire(self, worker_id: int, kill: bool = False) -> None:
+        process = self.processes.pop(worker_id)
+        self.queues.pop(worker_id)
+        self.timestamps.pop(worker_id)
+        if not kill:
+            process.join(timeout=self.SHUTDOWN_TIMEOUT)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+
+    def _expired(self, worker_id: int) -> str:
+        """Checks the heartbeat of a busy worker against the budgets
+
+        Returns
+        -------
+        str
+            Reason if a budget is exceeded, None otherwise
+        """
+        run_start, step_start = self.timestamps[worker_id]
+        now = time.time()
+
+        if self.step_timeout is not None and step_start > 0 and \
+                now - step_start > self.step_timeout + self.GRACE:
+            return STEP_TIMEOUT
+        if self.run_timeout is not None and run_start > 0 and \
+                now - run_start > self.run_timeout + self.GRACE:
+            return RUN_TIMEOUT
+        return None
+
+    def _receive(self, timeout: float = None) -> list:
+        """Results available in the queue, waits up to timeout for the
+        first one, by default does not wait
+        """
+        items = []
+        try:
+            if timeout is None:
+                items.append(self.results.get_nowait())
+            else:
+                items.append(self.results.get(timeout=timeout))
+            while True:
+                items.append(self.results.get_nowait())
+        except queue.Empty:
+            pass
+        return items
+
+    def imap(self, tasks: Iterable[Any]) -> Iterator[Any]:
+        """Applies the function to the tasks, tasks are dispatched in the
+        order provided
+
+        Parameters
+        ----------
+        tasks : Iterable[Any]
+            Tasks
+
+        Yields
+        ------
+        Any
+            Results in the order of completion
+
+        Raises
+        ------
+        RuntimeError
+            If a task raises an exception or a worker terminates unexpectedly
+        """
+        tasks = list(tasks)
+        pending = deque(range(len(tasks)))
+        idle = deque(self.processes.keys())
+        busy = {}
+        # Dispatch times of the busy workers
+        started = {}
+
+        while pending or busy:
+            # Dispatch to idle workers
+            while pending and idle:
+                worker_id = idle.popleft()
+                index = pending.popleft()
+                busy[worker_id] = index
+                started[worker_id] = time.time()
+                # Reset the heartbeat, it is set by the worker on receipt
+                self.timestamps[worker_id][:] = [0., 0.]
+                self.queues[worker_id].put((index, tasks[index]))
+
+            items = self._receive(self.POLL_INTERVAL)
+            # A worker posts its result before it exits, e.g. when recycled,
+            # results of exited workers are drained before their liveness
+            # is checked
+            exited = [worker_id for worker_id in busy
+                      if not self.processes[worker_id].is_alive()]
+            if exited:
+                items += self._receive()
+
+            for item in items:
+                # Results of terminated workers are discarded
+                if item[0] not in busy:
+                    continue
+                worker_id, index, result, error, recycle = item
+
+                busy.pop(worker_id)
+                if recycle:
+                    self._retire(worker_id)
+                    worker_id = self._spawn()
+                idle.append(worker_id)
+
+                if error is not None:
+                    raise RuntimeError(
+                        f"[EXCEPTION] Task {index} failed:\n{error}")
+
+                yield result
+
+            # Watchdog
+            for worker_id in list(busy):
+                reason = self._expired(worker_id)
+                if reason is None and worker_id not in exited:
+                    continue
+
+                index = busy.pop(worker_id)
+                wall_time = time.time() - started[worker_id]
+                self._retire(worker_id, kill=True)
+                idle.append(self._spawn())
+
+                # Workers may terminate without returning, e.g. segfaults
+                if reason is None:
+                    raise RuntimeError(
+                        f"[EXCEPTION] Worker terminated unexpectedly "
+                        f"while running task {index}")
+
+                print(f"[WATCHDOG] Task {index} exceeded its time budget "
+                      f"({reason}), worker terminated")
+                if self.on_timeout is not None:
+                    yield self.on_timeout(tasks[index], reason, wall_time)
+                else:
+                    yield None
+
+    def close(self) -> None:
+        """Stops all workers
+        """
+        for tasks in self.queues.values():
+            tasks.put(None)
+        for worker_id in list(self.processes):
+            self._retire(worker_id)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()